@@ -1,35 +1,617 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent
+# Antes de importar o prometheus_client: ele escolhe no import, por PROMETHEUS_MULTIPROC_DIR,
+# se os valores das métricas ficam no processo ou nos arquivos compartilhados
+load_dotenv(ROOT_DIR / '.env')
+
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, status
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DeleteOne, ReplaceOne, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, PyMongoError
+from pyinstrument import Profiler
+from pyinstrument.renderers import SpeedscopeRenderer
+from starlette.routing import compile_path
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess,
+)
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+import asyncio
+import base64
+import binascii
+import bisect
+import heapq
+import json
 import os
 import logging
-from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
+import math
+import random
+import re
+import socket
+import threading
+import time
+import unicodedata
+from pydantic import BaseModel, BeforeValidator, Field, EmailStr
+from typing import Annotated, List, Optional
 import uuid
 from datetime import datetime, timezone, timedelta
 import jwt
 import bcrypt
+import httpx
 
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+# ============ METRICS ============
+
+# Com vários workers do uvicorn, defina PROMETHEUS_MULTIPROC_DIR (diretório vazio e
+# compartilhado) para que /metrics agregue os valores de todos os processos.
+PROMETHEUS_MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP_REQUESTS = Counter(
+    "rankflow_http_requests_total", "HTTP requests handled",
+    ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "rankflow_http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route"], buckets=LATENCY_BUCKETS
+)
+HTTP_IN_FLIGHT = Gauge(
+    "rankflow_http_requests_in_flight", "HTTP requests currently being served",
+    multiprocess_mode="livesum"
+)
+MONGO_POOL_CHECKOUTS = Counter(
+    "rankflow_mongo_pool_checkouts_total", "Connections checked out from the Motor pool"
+)
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    "rankflow_mongo_pool_checkout_failures_total", "Failed connection checkouts", ["reason"]
+)
+MONGO_POOL_CHECKED_OUT = Gauge(
+    "rankflow_mongo_pool_checked_out", "Connections currently checked out",
+    multiprocess_mode="livesum"
+)
+MONGO_POOL_WAIT = Histogram(
+    "rankflow_mongo_pool_wait_seconds", "Time spent waiting for a pool connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0, 5.0)
+)
+EVENT_LOOP_LAG = Gauge(
+    "rankflow_event_loop_lag_seconds", "Event loop scheduling delay (per worker)",
+    multiprocess_mode="liveall"
+)
+CACHE_REQUESTS = Counter(
+    "rankflow_cache_requests_total", "Tenant cache lookups", ["result"]
+)
+CACHE_INVALIDATIONS = Counter(
+    "rankflow_cache_invalidations_total", "Tenant cache evictions", ["source"]
+)
+SINGLEFLIGHT_CALLS = Counter(
+    "rankflow_singleflight_calls_total", "Expensive reads executed vs. coalesced into an in-flight call",
+    ["route", "result"]
+)
+LIVE_CONNECTIONS = Gauge(
+    "rankflow_live_connections", "Open Server-Sent Events connections",
+    multiprocess_mode="livesum"
+)
+SSE_CONNECTION_DURATION = Histogram(
+    "rankflow_sse_connection_duration_seconds", "How long Server-Sent Events connections stay open",
+    ["route"], buckets=(1, 10, 60, 300, 900, 1800, 3600, 7200, 14400)
+)
+LIVE_EVENTS = Counter(
+    "rankflow_live_events_total", "Deltas pushed to live connections", ["type"]
+)
+BCRYPT_QUEUE_DEPTH = Gauge(
+    "rankflow_bcrypt_queue_depth", "bcrypt jobs waiting for an executor thread",
+    multiprocess_mode="livesum"
+)
+LOGIN_THROTTLED = Counter(
+    "rankflow_login_throttled_total", "Login/register attempts rejected before any bcrypt work",
+    ["route", "reason"]
+)
+QUOTA_REJECTIONS = Counter(
+    "rankflow_quota_rejections_total", "Requests rejected by plan quotas", ["plan", "resource"]
+)
+JOB_RUNS = Counter(
+    "rankflow_job_runs_total", "Periodic job executions", ["job", "result"]
+)
+REMINDERS_SENT = Counter(
+    "rankflow_reminders_sent_total", "Task reminders dispatched", ["sink", "result"]
+)
+REMINDER_DELAY = Histogram(
+    "rankflow_reminder_delay_seconds", "Time between a reminder's remind_at and its dispatch",
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 300.0)
+)
+JOB_DURATION = Histogram(
+    "rankflow_job_duration_seconds", "Periodic job execution time", ["job"],
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0)
+)
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Exporta checkouts e esperas do pool de conexões do Motor"""
+
+    def __init__(self):
+        # Checkout started/checked out acontecem na mesma thread do executor do Motor
+        self._local = threading.local()
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        MONGO_POOL_CHECKOUTS.inc()
+        MONGO_POOL_CHECKED_OUT.inc()
+        started = getattr(self._local, "started", None)
+        if started is not None:
+            MONGO_POOL_WAIT.observe(time.perf_counter() - started)
+            self._local.started = None
+
+    def connection_check_out_failed(self, event):
+        MONGO_POOL_CHECKOUT_FAILURES.labels(reason=str(event.reason)).inc()
+        self._local.started = None
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CHECKED_OUT.dec()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+# ============ DB TRACING ============
+
+# Tracing opcional das chamadas ao Mongo dentro de um request: ligado pelo header
+# X-Trace-DB: 1 ou por amostragem (TRACE_SAMPLE_RATE entre 0 e 1).
+TRACE_HEADER = b"x-trace-db"
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0'))
+TRACE_FILE = Path(os.environ.get('TRACE_FILE', ROOT_DIR / 'traces.jsonl'))
+
+class RequestTrace:
+    """Waterfall das chamadas ao Mongo de um único request"""
+
+    def __init__(self, method: str, path: str):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.started_at = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        self.spans = []
+        self.pending = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, command: str, collection: Optional[str], duration_micros: int, ok: bool):
+        end_ms = (time.perf_counter() - self.start) * 1000
+        duration_ms = duration_micros / 1000
+        with self._lock:
+            self.spans.append({
+                "command": command,
+                "collection": collection,
+                "start_ms": round(max(end_ms - duration_ms, 0), 3),
+                "duration_ms": round(duration_ms, 3),
+                "ok": ok
+            })
+
+    def to_dict(self, route: str, status_code: int) -> dict:
+        spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        return {
+            "trace_id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": route,
+            "status": status_code,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round((time.perf_counter() - self.start) * 1000, 3),
+            "db_calls": len(spans),
+            "db_time_ms": round(sum(span["duration_ms"] for span in spans), 3),
+            "spans": spans
+        }
+
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+class JsonlTraceExporter:
+    """Grava um trace por linha; substitua `trace_exporter` para enviar a outro coletor"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, trace: dict):
+        line = json.dumps(trace, default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+trace_exporter = JsonlTraceExporter(TRACE_FILE)
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+class TraceCommandListener(monitoring.CommandListener):
+    """Anexa cada comando ao trace do request atual (o Motor propaga o contexto ao executor)"""
+
+    @staticmethod
+    def _collection(event) -> Optional[str]:
+        key = "collection" if event.command_name == "getMore" else event.command_name
+        target = event.command.get(key)
+        return target if isinstance(target, str) else None
+
+    def started(self, event):
+        trace = current_trace.get()
+        if trace is not None:
+            trace.pending[event.request_id] = self._collection(event)
+
+    def succeeded(self, event):
+        self._finish(event, True)
+
+    def failed(self, event):
+        self._finish(event, False)
+
+    def _finish(self, event, ok: bool):
+        trace = current_trace.get()
+        if trace is None:
+            return
+        collection = trace.pending.pop(event.request_id, None)
+        trace.add_span(event.command_name, collection, event.duration_micros, ok)
+
+# ============ SETTINGS ============
+
+def _env_int(name: str, default: Optional[int] = None) -> Optional[int]:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+class Settings(BaseModel):
+    """Configuração de um app criado por create_app (por padrão, lida do ambiente)"""
+    mongo_url: str
+    db_name: str
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 0
+    mongo_max_idle_time_ms: Optional[int] = None
+    mongo_wait_queue_timeout_ms: Optional[int] = None
+    mongo_connect_timeout_ms: int = 20000
+    mongo_server_selection_timeout_ms: int = 30000
+    mongo_socket_timeout_ms: Optional[int] = None
+    mongo_compressors: Optional[str] = None  # ex: "zstd,snappy,zlib"
+    cors_origins: List[str] = ["*"]
+    bcrypt_workers: int = 4
+    cache_ttl_seconds: int = 30
+    cache_max_tenants: int = 10000
+    login_window_seconds: int = 300
+    login_ip_limit: int = 50  # tentativas por IP na janela
+    login_email_limit: int = 10  # tentativas por email na janela
+    login_max_bcrypt_queue: int = 16  # acima disso, novas tentativas são descartadas
+    login_max_loop_lag_ms: int = 500
+    # Proxies (ingress) que acrescentam ao X-Forwarded-For. 0 = usa o IP da conexão: sem proxy,
+    # o header vem do cliente e confiar nele deixaria escolher o IP do rate limit.
+    # Atrás do ingress, defina TRUSTED_PROXY_HOPS=1 no deploy.
+    trusted_proxy_hops: int = 0
+    migration_batch_size: int = 500
+    migration_docs_per_second: int = 2000
+    reminder_hour_utc: int = 12  # hora (UTC) do lembrete no dia do vencimento; 12h = 9h em Brasília
+    reminder_window_seconds: int = 600  # lembretes carregados no heap com antecedência
+    reminder_refill_seconds: int = 30
+    reminder_sinks: List[str] = ["log", "sse"]  # log | sse | webhook
+    reminder_webhook_url: Optional[str] = None
+    run_background_jobs: bool = True
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(
+            mongo_url=os.environ['MONGO_URL'],
+            db_name=os.environ['DB_NAME'],
+            mongo_max_pool_size=_env_int('MONGO_MAX_POOL_SIZE', 100),
+            mongo_min_pool_size=_env_int('MONGO_MIN_POOL_SIZE', 0),
+            mongo_max_idle_time_ms=_env_int('MONGO_MAX_IDLE_TIME_MS'),
+            mongo_wait_queue_timeout_ms=_env_int('MONGO_WAIT_QUEUE_TIMEOUT_MS'),
+            mongo_connect_timeout_ms=_env_int('MONGO_CONNECT_TIMEOUT_MS', 20000),
+            mongo_server_selection_timeout_ms=_env_int('MONGO_SERVER_SELECTION_TIMEOUT_MS', 30000),
+            mongo_socket_timeout_ms=_env_int('MONGO_SOCKET_TIMEOUT_MS'),
+            mongo_compressors=os.environ.get('MONGO_COMPRESSORS') or None,
+            cors_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+            bcrypt_workers=_env_int('BCRYPT_WORKERS', 4),
+            cache_ttl_seconds=_env_int('CACHE_TTL_SECONDS', 30),
+            cache_max_tenants=_env_int('CACHE_MAX_TENANTS', 10000),
+            login_window_seconds=_env_int('LOGIN_WINDOW_SECONDS', 300),
+            login_ip_limit=_env_int('LOGIN_IP_LIMIT', 50),
+            login_email_limit=_env_int('LOGIN_EMAIL_LIMIT', 10),
+            login_max_bcrypt_queue=_env_int('LOGIN_MAX_BCRYPT_QUEUE', 16),
+            login_max_loop_lag_ms=_env_int('LOGIN_MAX_LOOP_LAG_MS', 500),
+            trusted_proxy_hops=_env_int('TRUSTED_PROXY_HOPS', 0),
+            migration_batch_size=_env_int('MIGRATION_BATCH_SIZE', 500),
+            migration_docs_per_second=_env_int('MIGRATION_DOCS_PER_SECOND', 2000),
+            reminder_hour_utc=_env_int('REMINDER_HOUR_UTC', 12),
+            reminder_window_seconds=_env_int('REMINDER_WINDOW_SECONDS', 600),
+            reminder_refill_seconds=_env_int('REMINDER_REFILL_SECONDS', 30),
+            reminder_sinks=os.environ.get('REMINDER_SINKS', 'log,sse').split(','),
+            reminder_webhook_url=os.environ.get('REMINDER_WEBHOOK_URL') or None,
+            run_background_jobs=os.environ.get('RUN_BACKGROUND_JOBS', 'true').lower() != 'false'
+        )
+
+    def mongo_client_options(self) -> dict:
+        options = {
+            "maxPoolSize": self.mongo_max_pool_size,
+            "minPoolSize": self.mongo_min_pool_size,
+            "connectTimeoutMS": self.mongo_connect_timeout_ms,
+            "serverSelectionTimeoutMS": self.mongo_server_selection_timeout_ms,
+            "maxIdleTimeMS": self.mongo_max_idle_time_ms,
+            "waitQueueTimeoutMS": self.mongo_wait_queue_timeout_ms,
+            "socketTimeoutMS": self.mongo_socket_timeout_ms,
+            "compressors": self.mongo_compressors
+        }
+        return {k: v for k, v in options.items() if v is not None}
+
+# ============ APP STATE ============
+
+# Recursos do app que está atendendo (cliente Mongo, executor do bcrypt, profiler).
+# Cada app criado por create_app define este contexto no lifespan e em cada request,
+# então vários apps podem rodar no mesmo processo (ex: testes).
+current_app_state: ContextVar = ContextVar("current_app_state", default=None)
+
+def app_state():
+    state = current_app_state.get()
+    if state is None:
+        raise RuntimeError("Nenhum app RankFlow ativo neste contexto")
+    return state
+
+class DatabaseProxy:
+    """`db` global que resolve para o banco do app atual"""
+
+    def __getattr__(self, name):
+        return getattr(app_state().db, name)
+
+    def __getitem__(self, name):
+        return app_state().db[name]
+
+db = DatabaseProxy()
+
+# ============ TENANT CACHE ============
+
+MISSING = object()
+
+class TenantCache:
+    """Cache em memória por tenant (user_id), invalidado pelo change stream.
+
+    Só fica ativo enquanto o ChangeFeed está acompanhando o banco;
+    sem change streams (mongod sem replica set) toda leitura vai ao Mongo.
+    """
+
+    def __init__(self, ttl_seconds: int, max_tenants: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_tenants = max_tenants
+        self.enabled = False
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._epoch = 0
+
+    # Chaves sempre str: o token traz o id como string, os documentos como UUID
+
+    def generation(self, tenant_id):
+        return (self._epoch, self._generations.get(str(tenant_id), 0))
+
+    def get(self, tenant_id, key):
+        if not self.enabled:
+            return MISSING
+        tenant_id = str(tenant_id)
+        entry = self._entries.get(tenant_id, {}).get(key)
+        if entry is None or entry[0] < time.monotonic():
+            CACHE_REQUESTS.labels(result="miss").inc()
+            return MISSING
+        self._entries.move_to_end(tenant_id)
+        CACHE_REQUESTS.labels(result="hit").inc()
+        return entry[1]
+
+    def set(self, tenant_id, key, value, generation):
+        # Descarta valores lidos antes de uma invalidação que chegou durante a leitura
+        if not self.enabled or self.generation(tenant_id) != generation:
+            return
+        tenant_id = str(tenant_id)
+        self._entries.setdefault(tenant_id, {})[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(tenant_id)
+        while len(self._entries) > self.max_tenants:
+            self._entries.popitem(last=False)
+
+    def evict(self, tenant_id, source: str):
+        tenant_id = str(tenant_id)
+        self._generations[tenant_id] = self._generations.get(tenant_id, 0) + 1
+        if self._entries.pop(tenant_id, None) is not None:
+            CACHE_INVALIDATIONS.labels(source=source).inc()
+
+    def clear(self):
+        self._epoch += 1
+        self._entries.clear()
+        CACHE_INVALIDATIONS.labels(source="flush").inc()
+
+async def cached(tenant_id, key, loader):
+    """Lê do cache do tenant ou executa `loader` e guarda o resultado"""
+    cache = app_state().cache
+    value = cache.get(tenant_id, key)
+    if value is not MISSING:
+        return value
+    generation = cache.generation(tenant_id)
+    value = await loader()
+    cache.set(tenant_id, key, value, generation)
+    return value
+
+# ============ REQUEST COALESCING ============
+
+class SingleFlight:
+    """Compartilha uma única execução entre chamadas idênticas simultâneas.
+
+    Várias abas do mesmo usuário disparam as mesmas leituras ao mesmo tempo; a
+    primeira executa e as demais aguardam o mesmo resultado (ou a mesma exceção).
+    """
+
+    def __init__(self):
+        self._inflight = {}
+
+    async def do(self, key: tuple, fn):
+        route = key[1]
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            SINGLEFLIGHT_CALLS.labels(route=route, result="executed").inc()
+        else:
+            SINGLEFLIGHT_CALLS.labels(route=route, result="coalesced").inc()
+        # shield: se um cliente desconectar, a execução continua para os demais
+        return await asyncio.shield(task)
+
+async def coalesce(key: tuple, fn):
+    """key = (user_id, rota, *parâmetros)"""
+    return await app_state().singleflight.do(key, fn)
+
+# ============ CACHE INVALIDATION BUS ============
+
+# Inclui as coleções derivadas (rollups, funil): são lidas via cached() e escritas por jobs
+# em outros workers, então também precisam invalidar o tenant
+WATCHED_COLLECTIONS = [
+    "users", "leads", "clients", "tasks", "payments", "notifications", "finance_rollups", "funnel_stats"
+]
+CHANGE_STREAM_PIPELINE = [
+    {"$match": {"$or": [
+        {"ns.coll": {"$in": WATCHED_COLLECTIONS}},
+        {"operationType": {"$in": ["dropDatabase", "invalidate"]}}
+    ]}},
+    {"$project": {
+        "ns": 1, "operationType": 1, "fullDocument": 1, "updateDescription.updatedFields": 1,
+        "fullDocumentBeforeChange.id": 1, "fullDocumentBeforeChange.user_id": 1
+    }},
+    {"$unset": "fullDocument.password"}
+]
+RESUME_TOKEN_ID = "cache_invalidation"
+RESUME_TOKEN_FLUSH_SECONDS = 1.0
+# Códigos do servidor: sem replica set / token que saiu do oplog
+CHANGE_STREAM_UNSUPPORTED = {40573}
+CHANGE_STREAM_HISTORY_LOST = {280, 286}
+
+class ChangeFeed:
+    """Acompanha os change streams: remove do cache os tenants afetados e
+    repassa as mudanças ao LiveHub.
+
+    Cada worker roda um; uma escrita feita em qualquer worker chega a todos em
+    milissegundos. O resume token fica em memória para reconexões e é salvo em
+    `change_stream_tokens` para sobreviver a um restart.
+    """
+
+    def __init__(self, cache: TenantCache, hub: "LiveHub"):
+        self.cache = cache
+        self.hub = hub
+        self.resume_token = None
+        self._token_saved_at = 0.0
+
+    async def run(self):
+        await self._enable_pre_images()
+        saved = await db.change_stream_tokens.find_one({"_id": RESUME_TOKEN_ID})
+        self.resume_token = saved["token"] if saved else None
+        backoff = 1
+        while True:
+            try:
+                await self._follow()
+                backoff = 1
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as exc:
+                self.cache.enabled = False
+                if exc.code in CHANGE_STREAM_UNSUPPORTED:
+                    logger.warning("Change streams indisponíveis (replica set necessário); cache desativado")
+                    await asyncio.sleep(300)
+                    continue
+                if exc.code in CHANGE_STREAM_HISTORY_LOST:
+                    logger.warning("Resume token expirado; limpando o cache")
+                    self.cache.clear()
+                    self.resume_token = None
+                    continue
+                logger.exception("Erro no change stream de invalidação")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            except PyMongoError:
+                self.cache.enabled = False
+                logger.exception("Change stream de invalidação interrompido")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    async def _follow(self):
+        async with db.watch(
+            CHANGE_STREAM_PIPELINE,
+            full_document="whenAvailable",
+            full_document_before_change="whenAvailable",
+            resume_after=self.resume_token
+        ) as stream:
+            # Aplica o que aconteceu enquanto estávamos desconectados antes de reativar o cache
+            while (change := await stream.try_next()) is not None:
+                self.apply(change)
+            await self._remember(stream.resume_token)
+            self.cache.enabled = True
+            async for change in stream:
+                self.apply(change)
+                await self._remember(stream.resume_token)
+        # O stream termina após um evento "invalidate": recomeça do zero
+        self.cache.enabled = False
+        self.cache.clear()
+        self.resume_token = None
+
+    def apply(self, change: dict):
+        collection = change.get("ns", {}).get("coll")
+        if collection not in WATCHED_COLLECTIONS:
+            self.cache.clear()
+            return
+        field = "id" if collection == "users" else "user_id"
+        for image in ("fullDocument", "fullDocumentBeforeChange"):
+            tenant_id = (change.get(image) or {}).get(field)
+            if tenant_id:
+                self.cache.evict(tenant_id, "change_stream")
+                self.hub.publish_change(tenant_id, change)
+                return
+        # Sem pre-image não dá para saber o tenant de um delete/update: invalida tudo
+        self.cache.clear()
+
+    async def _remember(self, token):
+        self.resume_token = token
+        now = time.monotonic()
+        if token is not None and now - self._token_saved_at >= RESUME_TOKEN_FLUSH_SECONDS:
+            self._token_saved_at = now
+            await db.change_stream_tokens.update_one(
+                {"_id": RESUME_TOKEN_ID},
+                {"$set": {"token": token, "updated_at": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+
+    @staticmethod
+    async def _enable_pre_images():
+        # Pre-images (MongoDB 6+) trazem o user_id de documentos apagados ou atualizados
+        for name in WATCHED_COLLECTIONS:
+            try:
+                await db.command({"collMod": name, "changeStreamPreAndPostImages": {"enabled": True}})
+            except PyMongoError as exc:
+                logger.info("Pre-images não habilitadas em %s: %s", name, exc)
 
 # JWT Config
 JWT_SECRET = os.environ.get('JWT_SECRET', 'rankflow-secret-key-2024')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
+# Token do EventSource: vai na URL (e nos access logs), então vale só para o stream e por pouco tempo
+EVENTS_TOKEN_SCOPE = "events"
+EVENTS_TOKEN_TTL_SECONDS = 60
 
 # Security
 security = HTTPBearer()
 
-app = FastAPI(title="RankFlow API")
 api_router = APIRouter(prefix="/api")
 
 # Configure logging
@@ -47,6 +629,97 @@ PLAN_STATUS = ["active", "overdue", "canceled"]
 SUPER_ADMIN_EMAIL = os.environ.get('SUPER_ADMIN_EMAIL', 'admin@rankflow.com')
 SUPER_ADMIN_PASSWORD = os.environ.get('SUPER_ADMIN_PASSWORD', 'admin123456')
 
+# ============ DATES ============
+
+# Datas são gravadas como datetime BSON (UTC). Documentos antigos ainda podem ter
+# strings ISO até o backfill terminar, então toda leitura aceita as duas formas.
+
+# Datas "de calendário" (vindas de <input type="date">) ficam à meia-noite UTC
+CALENDAR_DATE_FIELDS = {"due_date", "next_contact", "plan_expires_at", "next_due_date"}
+DATE_FIELDS_BY_COLLECTION = {
+    "users": ["created_at", "updated_at", "last_login_at", "last_payment_at", "plan_expires_at"],
+    "leads": ["next_contact", "created_at", "updated_at"],
+    "clients": ["created_at", "updated_at", "weekly_tasks_reset_at"],
+    "tasks": ["due_date", "created_at"],
+    "payments": ["due_date", "created_at"],
+    "audit_logs": ["created_at"],
+}
+
+def to_datetime(value) -> Optional[datetime]:
+    """String ISO, YYYY-MM-DD ou datetime -> datetime UTC (None para vazio)"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def api_datetime(value):
+    """datetime -> string ISO, no mesmo formato que a API sempre devolveu"""
+    if isinstance(value, datetime):
+        return to_datetime(value).isoformat()
+    return value
+
+def api_date(value):
+    """Como api_datetime, mas datas de calendário voltam como YYYY-MM-DD"""
+    if isinstance(value, datetime):
+        value = to_datetime(value)
+        if (value.hour, value.minute, value.second, value.microsecond) == (0, 0, 0, 0):
+            return value.date().isoformat()
+    return api_datetime(value)
+
+def api_dates(doc: dict) -> dict:
+    """Aplica api_date/api_datetime aos campos de data de um documento"""
+    return {
+        k: api_date(v) if k in CALENDAR_DATE_FIELDS else api_datetime(v)
+        for k, v in doc.items()
+    }
+
+def legacy_date_key(value: datetime) -> str:
+    """Limite comparável com as strings ISO legadas (UTC, precisão de segundos): "YYYY-MM-DD"
+    à meia-noite, que ordena antes de "YYYY-MM-DD" e de qualquer horário do dia; senão o
+    prefixo "YYYY-MM-DDTHH:MM:SS", indiferente a fração de segundo e ao sufixo Z/+00:00"""
+    if (value.hour, value.minute, value.second) == (0, 0, 0):
+        return value.date().isoformat()
+    return value.strftime("%Y-%m-%dT%H:%M:%S")
+
+def date_range_query(field: str, **bounds) -> dict:
+    """Filtro de intervalo (gte/lte/...) que casa datetimes e, durante a migração, strings ISO"""
+    as_dates = {f"${op}": to_datetime(v) for op, v in bounds.items()}
+    as_strings = {}
+    for op, value in bounds.items():
+        value = to_datetime(value)
+        second = value.replace(microsecond=0)
+        following = second + timedelta(seconds=1)
+        ceiling = second if second == value else following
+        # Nas strings, "horário >= t" equivale a "string >= legacy_date_key(t)"
+        string_op, bound = {
+            "gte": ("$gte", ceiling), "gt": ("$gte", following), "lte": ("$lt", following), "lt": ("$lt", ceiling)
+        }[op]
+        as_strings[string_op] = legacy_date_key(bound)
+    return {"$or": [{field: as_dates}, {field: as_strings}]}
+
+# Entrada: aceita YYYY-MM-DD ou ISO completo; saída: mesmas strings de antes
+DateParam = Annotated[datetime, BeforeValidator(to_datetime)]
+OptionalDateParam = Annotated[Optional[datetime], BeforeValidator(to_datetime)]
+ApiDateTime = Annotated[str, BeforeValidator(api_datetime)]
+ApiDate = Annotated[str, BeforeValidator(api_date)]
+
+# ============ IDS ============
+
+# ids são UUIDs gravados como Binary subtype 4 (uuidRepresentation="standard");
+# na API continuam strings. Parâmetros de rota usam `uuid.UUID` direto.
+
+def id_str(value):
+    return str(value) if isinstance(value, uuid.UUID) else value
+
+def optional_id(value):
+    # O frontend manda "" quando nenhum cliente/lead foi escolhido
+    return value or None
+
+ApiId = Annotated[str, BeforeValidator(id_str)]
+OptionalIdParam = Annotated[Optional[uuid.UUID], BeforeValidator(optional_id)]
+
 # ============ MODELS ============
 
 # User Models
@@ -60,15 +733,15 @@ class UserLogin(BaseModel):
     password: str
 
 class UserResponse(BaseModel):
-    id: str
+    id: ApiId
     name: str
     email: str
     role: str = "USER"
     status: str = "active"
-    created_at: str
+    created_at: ApiDateTime
 
 class UserFullResponse(BaseModel):
-    id: str
+    id: ApiId
     name: str
     email: str
     role: str
@@ -76,10 +749,10 @@ class UserFullResponse(BaseModel):
     plan: str
     plan_value: float
     plan_status: str
-    plan_expires_at: Optional[str]
-    last_login_at: Optional[str]
-    created_at: str
-    updated_at: str
+    plan_expires_at: Optional[ApiDate]
+    last_login_at: Optional[ApiDateTime]
+    created_at: ApiDateTime
+    updated_at: ApiDateTime
 
 # User Settings Model
 class UserSettingsUpdate(BaseModel):
@@ -103,7 +776,7 @@ class LeadCreate(BaseModel):
     company: Optional[str] = None
     stage: str = "novo_lead"
     contract_value: float = 0.0
-    next_contact: Optional[str] = None
+    next_contact: OptionalDateParam = None
     reminder: Optional[str] = None
     notes: Optional[str] = None
 
@@ -114,28 +787,40 @@ class LeadUpdate(BaseModel):
     company: Optional[str] = None
     stage: Optional[str] = None
     contract_value: Optional[float] = None
-    next_contact: Optional[str] = None
+    next_contact: OptionalDateParam = None
     reminder: Optional[str] = None
     notes: Optional[str] = None
 
 class LeadResponse(BaseModel):
-    id: str
+    id: ApiId
     name: str
     email: Optional[str]
     phone: Optional[str]
     company: Optional[str]
     stage: str
     contract_value: float
-    next_contact: Optional[str]
+    next_contact: Optional[ApiDate]
     reminder: Optional[str]
     notes: Optional[str]
-    user_id: str
-    created_at: str
-    updated_at: str
+    user_id: ApiId
+    created_at: ApiDateTime
+    updated_at: ApiDateTime
+
+class LeadBoardPage(BaseModel):
+    stage: str
+    leads: List[LeadResponse]
+    next_cursor: Optional[str] = None
+
+class LeadBoardColumn(LeadBoardPage):
+    count: int
+    value: float
+
+class LeadBoard(BaseModel):
+    columns: List[LeadBoardColumn]
 
 # Client Models
 class ChecklistItem(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: ApiId = Field(default_factory=lambda: uuid.uuid4())
     title: str
     completed: bool = False
 
@@ -158,12 +843,12 @@ class ClientUpdate(BaseModel):
     notes: Optional[str] = None
 
 class WeeklyTask(BaseModel):
-    id: str
+    id: ApiId
     title: str
     completed: bool = False
 
 class ClientResponse(BaseModel):
-    id: str
+    id: ApiId
     name: str
     email: Optional[str]
     phone: Optional[str]
@@ -173,10 +858,11 @@ class ClientResponse(BaseModel):
     notes: Optional[str]
     checklist: List[ChecklistItem]
     weekly_tasks: Optional[List[WeeklyTask]] = []
-    weekly_tasks_reset_at: Optional[str] = None
-    user_id: str
-    created_at: str
-    updated_at: str
+    weekly_tasks_reset_at: Optional[ApiDateTime] = None
+    tasks_horizon: Optional[ApiDateTime] = None  # tarefas dos modelos geradas até aqui
+    user_id: ApiId
+    created_at: ApiDateTime
+    updated_at: ApiDateTime
 
 # Task Models
 TASK_TYPES = ["onboarding", "recorrente", "follow_up", "outro"]
@@ -185,60 +871,189 @@ class TaskCreate(BaseModel):
     title: str
     description: Optional[str] = None
     task_type: str = "outro"
-    due_date: str
-    client_id: Optional[str] = None
-    lead_id: Optional[str] = None
+    due_date: DateParam
+    client_id: OptionalIdParam = None
+    lead_id: OptionalIdParam = None
 
 class TaskUpdate(BaseModel):
     title: Optional[str] = None
     description: Optional[str] = None
     task_type: Optional[str] = None
-    due_date: Optional[str] = None
+    due_date: OptionalDateParam = None
     completed: Optional[bool] = None
 
 class TaskResponse(BaseModel):
-    id: str
+    id: ApiId
     title: str
     description: Optional[str]
     task_type: str
-    due_date: str
+    due_date: ApiDate
     completed: bool
-    client_id: Optional[str]
+    client_id: Optional[ApiId]
     client_name: Optional[str]
-    lead_id: Optional[str]
+    lead_id: Optional[ApiId]
     lead_name: Optional[str]
-    user_id: str
-    created_at: str
+    user_id: ApiId
+    created_at: ApiDateTime
+    template_id: Optional[ApiId] = None  # gerada a partir de um modelo
+
+# Task Template Models
+TEMPLATE_FREQUENCIES = ["weekly", "monthly"]
+
+class TaskTemplateCreate(BaseModel):
+    title: str
+    description: Optional[str] = None
+    task_type: str = "recorrente"
+    frequency: str = "monthly"  # "weekly" | "monthly"
+    interval: int = Field(1, ge=1, le=12)  # a cada N semanas/meses
+    day: int = Field(1, ge=0, le=31)  # dia do mês (mensal) ou da semana, 0 = segunda (semanal)
+    active: bool = True
+
+class TaskTemplateUpdate(BaseModel):
+    title: Optional[str] = None
+    description: Optional[str] = None
+    task_type: Optional[str] = None
+    frequency: Optional[str] = None
+    interval: Optional[int] = Field(None, ge=1, le=12)
+    day: Optional[int] = Field(None, ge=0, le=31)
+    active: Optional[bool] = None
+
+class TaskTemplateResponse(BaseModel):
+    id: ApiId
+    title: str
+    description: Optional[str]
+    task_type: str
+    frequency: str
+    interval: int
+    day: int
+    active: bool
+    user_id: ApiId
+    created_at: ApiDateTime
+    updated_at: ApiDateTime
 
 # Payment Models
 PAYMENT_TYPES = ["pontual", "recorrente"]
+PAYMENT_STATUS = ["pending", "paid", "overdue"]
 
 class PaymentCreate(BaseModel):
-    client_id: str
+    client_id: uuid.UUID
     description: str
     amount: float
     payment_type: str = "pontual"
-    due_date: str
+    due_date: DateParam
     paid: bool = False
 
 class PaymentUpdate(BaseModel):
     description: Optional[str] = None
     amount: Optional[float] = None
     payment_type: Optional[str] = None
-    due_date: Optional[str] = None
+    due_date: OptionalDateParam = None
     paid: Optional[bool] = None
 
 class PaymentResponse(BaseModel):
-    id: str
-    client_id: str
+    id: ApiId
+    client_id: ApiId
     client_name: Optional[str]
     description: str
     amount: float
     payment_type: str
-    due_date: str
+    due_date: ApiDate
     paid: bool
-    user_id: str
-    created_at: str
+    user_id: ApiId
+    created_at: ApiDateTime
+    status: Optional[str] = None  # pending | paid | overdue (mantido pelo overdue_sweeper)
+    source_payment_id: Optional[ApiId] = None  # pagamento que originou a série recorrente
+    next_due_date: Optional[ApiDate] = None  # só no pagamento de origem: próxima geração
+
+# ============ LIVE UPDATES (SSE) ============
+
+LIVE_HIDDEN_FIELDS = {"_id", "search_keys"}
+LIVE_COLLECTIONS = {
+    "leads": "lead", "clients": "client", "tasks": "task", "payments": "payment", "notifications": "notification"
+}
+LIVE_OPERATIONS = {"insert": "created", "update": "updated", "replace": "updated", "delete": "deleted"}
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+class LiveHub:
+    """Distribui deltas (lead mudou de estágio, tarefa concluída, ...) às conexões SSE.
+
+    Cada conexão é só uma fila; o ChangeFeed publica com put_nowait e uma única
+    task envia os heartbeats, então milhares de conexões ociosas custam memória,
+    não CPU. Uma fila cheia (cliente lento) é trocada por um evento "resync".
+    """
+
+    QUEUE_SIZE = 100
+    HEARTBEAT_SECONDS = 15
+    HEARTBEAT = object()
+    CLOSE = object()
+    RESYNC = {"type": "resync"}
+
+    def __init__(self):
+        self._subscribers = {}
+
+    def subscribe(self, user_id) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self._subscribers.setdefault(str(user_id), set()).add(queue)
+        LIVE_CONNECTIONS.inc()
+        return queue
+
+    def unsubscribe(self, user_id, queue: asyncio.Queue):
+        queues = self._subscribers.get(str(user_id))
+        if queues and queue in queues:
+            queues.discard(queue)
+            LIVE_CONNECTIONS.dec()
+            if not queues:
+                del self._subscribers[str(user_id)]
+
+    def publish(self, user_id, event):
+        for queue in self._subscribers.get(str(user_id), ()):
+            self._offer(queue, event)
+
+    def publish_change(self, user_id, change: dict):
+        """Converte um evento do change stream num delta pequeno"""
+        if str(user_id) not in self._subscribers:
+            return
+        kind = LIVE_COLLECTIONS.get(change["ns"]["coll"])
+        action = LIVE_OPERATIONS.get(change["operationType"])
+        if not kind or not action:
+            return
+        document = change.get("fullDocument") or {}
+        before = change.get("fullDocumentBeforeChange") or {}
+        event = {"type": f"{kind}.{action}", "id": id_str(document.get("id") or before.get("id"))}
+        if action == "created":
+            event["document"] = api_dates({k: v for k, v in document.items() if k not in LIVE_HIDDEN_FIELDS})
+        elif action == "updated":
+            changes = (change.get("updateDescription") or {}).get("updatedFields")
+            changes = changes if changes is not None else document
+            event["changes"] = api_dates({k: v for k, v in changes.items() if k not in LIVE_HIDDEN_FIELDS})
+        LIVE_EVENTS.labels(type=event["type"]).inc()
+        self.publish(user_id, event)
+
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(self.HEARTBEAT_SECONDS)
+            for queues in list(self._subscribers.values()):
+                for queue in queues:
+                    if not queue.full():
+                        queue.put_nowait(self.HEARTBEAT)
+
+    def close(self):
+        for queues in list(self._subscribers.values()):
+            for queue in queues:
+                self._offer(queue, self.CLOSE)
+
+    def _offer(self, queue: asyncio.Queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Cliente não acompanhou: descarta o atraso e pede para recarregar
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(self.CLOSE if event is self.CLOSE else self.RESYNC)
 
 # ============ AUTH HELPERS ============
 
@@ -248,29 +1063,87 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+# bcrypt bloqueia a CPU por ~200ms; roda num pool dedicado (por app) para não travar o event loop
+async def run_bcrypt(fn, *args):
+    """Executa uma operação bcrypt no executor dedicado, medindo a fila"""
+    state = app_state()
+    BCRYPT_QUEUE_DEPTH.inc()
+
+    def job():
+        BCRYPT_QUEUE_DEPTH.dec()
+        return fn(*args)
+
+    # Contado só no event loop (em execução + na fila) para o LoginThrottle
+    state.bcrypt_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(state.bcrypt_executor, job)
+    finally:
+        state.bcrypt_pending -= 1
+
+async def hash_password_async(password: str) -> str:
+    return await run_bcrypt(hash_password, password)
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    return await run_bcrypt(verify_password, password, hashed)
+
 def create_token(user_id: str, original_user_id: Optional[str] = None) -> str:
     payload = {
-        "sub": user_id,
+        "sub": str(user_id),
         "exp": datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS),
         "iat": datetime.now(timezone.utc)
     }
     if original_user_id:
-        payload["original_user_id"] = original_user_id
+        payload["original_user_id"] = str(original_user_id)
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+def create_events_token(user_id: str) -> str:
+    now = datetime.now(timezone.utc)
+    payload = {
+        "sub": str(user_id),
+        "scope": EVENTS_TOKEN_SCOPE,
+        "exp": now + timedelta(seconds=EVENTS_TOKEN_TTL_SECONDS),
+        "iat": now
+    }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+def decode_token(token: str) -> dict:
+    return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+
+def token_subject(scope) -> Optional[str]:
+    """user_id do Bearer token de um scope ASGI, sem consultar o banco"""
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            token = value.decode().removeprefix("Bearer ").strip()
+            try:
+                return decode_token(token).get("sub")
+            except jwt.InvalidTokenError:
+                return None
+    return None
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await authenticate_token(credentials.credentials)
+
+async def authenticate_token(token: str, scope: Optional[str] = None) -> dict:
+    """Valida o token e carrega o usuário. Tokens de sessão não têm scope; os de uso
+    restrito (ex: o do stream de eventos) só valem onde o scope é pedido."""
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = decode_token(token)
+        if payload.get("scope") != scope:
+            raise HTTPException(status_code=401, detail="Token inválido")
         user_id = payload.get("sub")
-        if not user_id:
+        try:
+            user_uuid = uuid.UUID(user_id)
+        except (TypeError, ValueError):
             raise HTTPException(status_code=401, detail="Token inválido")
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
+        user = await cached(user_id, "user", lambda: db.users.find_one({"id": user_uuid}, {"_id": 0}))
         if not user:
             raise HTTPException(status_code=401, detail="Usuário não encontrado")
+        user = dict(user)
         if user.get("status") == "blocked":
             raise HTTPException(status_code=403, detail="Usuário bloqueado")
         if user.get("status") == "paused":
             raise HTTPException(status_code=403, detail="Conta pausada temporariamente")
+        enforce_request_rate(user)
         # Add impersonation info to user object
         user["_original_user_id"] = payload.get("original_user_id")
         user["_is_impersonating"] = payload.get("original_user_id") is not None
@@ -303,18 +1176,24 @@ async def get_admin_or_super(user: dict = Depends(get_current_user)):
 
 # ============ AUDIT LOG HELPER ============
 
-async def create_audit_log(actor: dict, action: str, target_id: str, target_email: str, details: dict = None):
-    """Create an audit log entry"""
-    log_doc = {
-        "id": str(uuid.uuid4()),
+# Ator das transições feitas por jobs (sem usuário por trás)
+SYSTEM_ACTOR = {"id": None, "email": "system"}
+
+def audit_log_doc(actor: dict, action: str, target_id: str, target_email: str, details: dict = None) -> dict:
+    return {
+        "id": uuid.uuid4(),
         "actor_id": actor.get("id"),
         "actor_email": actor.get("email"),
         "action": action,
         "target_id": target_id,
         "target_email": target_email,
         "details": details or {},
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": datetime.now(timezone.utc)
     }
+
+async def create_audit_log(actor: dict, action: str, target_id: str, target_email: str, details: dict = None):
+    """Create an audit log entry"""
+    log_doc = audit_log_doc(actor, action, target_id, target_email, details)
     await db.audit_logs.insert_one(log_doc)
     return log_doc
 
@@ -324,12 +1203,12 @@ async def init_super_admin():
     """Create default SUPER_ADMIN if not exists"""
     existing = await db.users.find_one({"email": SUPER_ADMIN_EMAIL})
     if not existing:
-        now = datetime.now(timezone.utc).isoformat()
+        now = datetime.now(timezone.utc)
         admin_doc = {
-            "id": str(uuid.uuid4()),
+            "id": uuid.uuid4(),
             "name": "Super Admin",
             "email": SUPER_ADMIN_EMAIL,
-            "password": hash_password(SUPER_ADMIN_PASSWORD),
+            "password": await hash_password_async(SUPER_ADMIN_PASSWORD),
             "role": "SUPER_ADMIN",
             "status": "active",
             "plan": "enterprise",
@@ -343,22 +1222,208 @@ async def init_super_admin():
         await db.users.insert_one(admin_doc)
         logger.info(f"Super Admin created: {SUPER_ADMIN_EMAIL}")
 
+# ============ LOGIN THROTTLING ============
+
+class TokenBucket:
+    """Token bucket em memória por chave; barra rajadas sem ida ao banco"""
+
+    def __init__(self, capacity: int, window_seconds: int, max_keys: int = 100000):
+        self.capacity = capacity
+        self.rate = capacity / window_seconds
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # chave -> (fichas, instante da última atualização)
+
+    def take(self, key: str) -> float:
+        """Consome uma ficha; retorna 0 ou os segundos até a próxima ficha"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            self._buckets[key] = (tokens - 1, now)
+            wait = 0.0
+        else:
+            self._buckets[key] = (tokens, now)
+            wait = (1 - tokens) / self.rate
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+class LoginThrottle:
+    """Limita tentativas de login/cadastro antes de qualquer hash bcrypt.
+
+    Três barreiras, da mais barata para a mais cara:
+    1. sobrecarga do worker (fila do bcrypt ou atraso do event loop): 429 imediato;
+    2. token buckets locais por IP e por email;
+    3. contadores de janela fixa em `rate_limits`, incrementados atomicamente e
+       compartilhados por todos os workers (TTL index limpa janelas vencidas).
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.buckets = {
+            "ip": TokenBucket(settings.login_ip_limit, settings.login_window_seconds),
+            "email": TokenBucket(settings.login_email_limit, settings.login_window_seconds),
+        }
+        self.limits = {"ip": settings.login_ip_limit, "email": settings.login_email_limit}
+
+    async def check(self, route: str, ip: str, email: Optional[str] = None):
+        state = app_state()
+        waiting = state.bcrypt_pending - self.settings.bcrypt_workers
+        if (waiting >= self.settings.login_max_bcrypt_queue
+                or state.event_loop_lag * 1000 >= self.settings.login_max_loop_lag_ms):
+            self._reject(route, "overload", 1, "Servidor ocupado. Tente novamente em instantes.")
+
+        keys = {"ip": ip}
+        if email:
+            keys["email"] = email.lower()
+        for kind, value in keys.items():
+            wait = self.buckets[kind].take(value)
+            if wait:
+                self._reject(route, kind, wait)
+
+        counts = await asyncio.gather(*[self._hit(kind, value) for kind, value in keys.items()])
+        for kind, (count, wait) in zip(keys, counts):
+            if count > self.limits[kind]:
+                self._reject(route, kind, wait)
+
+    async def _hit(self, kind: str, value: str):
+        """Incrementa o contador compartilhado da janela atual; retorna (total, segundos restantes)"""
+        window = self.settings.login_window_seconds
+        now = time.time()
+        window_start = int(now // window) * window
+        doc = await db.rate_limits.find_one_and_update(
+            {"_id": f"login:{kind}:{value}:{window_start}"},
+            {
+                "$inc": {"count": 1},
+                "$setOnInsert": {"expires_at": datetime.fromtimestamp(window_start + window, timezone.utc)}
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return doc["count"], window_start + window - now
+
+    @staticmethod
+    def _reject(route: str, reason: str, retry_after: float, detail: str = None):
+        LOGIN_THROTTLED.labels(route=route, reason=reason).inc()
+        raise HTTPException(
+            status_code=429,
+            detail=detail or "Muitas tentativas. Tente novamente mais tarde.",
+            headers={"Retry-After": str(max(math.ceil(retry_after), 1))}
+        )
+
+def client_ip(request: Request) -> str:
+    """IP do cliente: o X-Forwarded-For é preenchido pelo ingress, que acrescenta à direita"""
+    hops = app_state().settings.trusted_proxy_hops
+    forwarded = [part.strip() for part in request.headers.get("x-forwarded-for", "").split(",") if part.strip()]
+    if hops and len(forwarded) >= hops:
+        return forwarded[-hops]
+    return request.client.host if request.client else "unknown"
+
+# ============ PLAN QUOTAS ============
+
+# Limites por plano; None = ilimitado
+PLAN_QUOTAS = {
+    "free": {"leads": 100, "clients": 10, "tasks": 500, "payments": 200, "requests_per_minute": 120},
+    "starter": {"leads": 1000, "clients": 50, "tasks": 5000, "payments": 2000, "requests_per_minute": 300},
+    "pro": {"leads": 10000, "clients": 500, "tasks": 50000, "payments": 20000, "requests_per_minute": 600},
+    "enterprise": {"leads": None, "clients": None, "tasks": None, "payments": None, "requests_per_minute": None},
+}
+QUOTA_RESOURCES = ["leads", "clients", "tasks", "payments"]
+# Documentos que contam na cota: tarefas geradas pelos modelos não contam, senão um tenant
+# free bateria o limite sem fazer nada e deixaria de conseguir criar tarefas à mão
+QUOTA_COUNTED = {"tasks": {"template_id": None}}
+QUOTA_LABELS = {"leads": "leads", "clients": "clientes", "tasks": "tarefas", "payments": "pagamentos"}
+
+def plan_quota(user: dict, name: str) -> Optional[int]:
+    """Limite do plano do usuário; administradores não têm cota"""
+    if user.get("role") in ("ADMIN", "SUPER_ADMIN"):
+        return None
+    return PLAN_QUOTAS.get(user.get("plan"), PLAN_QUOTAS["free"])[name]
+
+async def init_usage(user_id: uuid.UUID):
+    """Cria os contadores de `tenant_usage` a partir das contagens reais (uma vez por tenant)"""
+    counts = {}
+    for resource in QUOTA_RESOURCES:
+        counts[resource] = await db[resource].count_documents({"user_id": user_id, **QUOTA_COUNTED.get(resource, {})})
+    await db.tenant_usage.update_one({"_id": user_id}, {"$setOnInsert": counts}, upsert=True)
+
+async def reserve_quota(user: dict, resource: str, amount: int = 1):
+    """Reserva `amount` documentos com um único $inc condicional ao limite do plano"""
+    if amount <= 0:
+        return
+    limit = plan_quota(user, resource)
+    query = {"_id": user["id"]}
+    if limit is not None:
+        query[resource] = {"$lte": limit - amount}
+    update = {"$inc": {resource: amount}}
+
+    result = await db.tenant_usage.update_one(query, update)
+    if result.matched_count == 0 and not await db.tenant_usage.find_one({"_id": user["id"]}, {"_id": 1}):
+        await init_usage(user["id"])
+        result = await db.tenant_usage.update_one(query, update)
+    if result.matched_count == 0:
+        QUOTA_REJECTIONS.labels(plan=user.get("plan", "free"), resource=resource).inc()
+        raise HTTPException(
+            status_code=403,
+            detail=f"Limite do plano atingido ({limit} {QUOTA_LABELS[resource]}). Faça upgrade para continuar."
+        )
+
+async def adjust_usage(user_id: uuid.UUID, resource: str, delta: int):
+    """Ajusta o contador sem checar limite (exclusões e documentos gerados pelo sistema)"""
+    if delta:
+        await db.tenant_usage.update_one({"_id": user_id}, {"$inc": {resource: delta}})
+
+async def adjust_usage_many(resource: str, counts: dict):
+    """adjust_usage de vários tenants em um único bulk_write ({user_id: delta})"""
+    requests = [UpdateOne({"_id": user_id}, {"$inc": {resource: delta}}) for user_id, delta in counts.items() if delta]
+    if requests:
+        await db.tenant_usage.bulk_write(requests, ordered=False)
+
+@asynccontextmanager
+async def quota_reservation(user: dict, resource: str, amount: int = 1):
+    """Reserva a cota antes da escrita e a devolve se a escrita falhar"""
+    await reserve_quota(user, resource, amount)
+    try:
+        yield
+    except BaseException:
+        await adjust_usage(user["id"], resource, -amount)
+        raise
+
+def enforce_request_rate(user: dict):
+    """Token bucket por usuário com a taxa do plano (por worker, sem ida ao banco)"""
+    limit = plan_quota(user, "requests_per_minute")
+    if limit is None:
+        return
+    buckets = app_state().request_buckets
+    bucket = buckets.get(limit)
+    if bucket is None:
+        bucket = buckets[limit] = TokenBucket(limit, 60)
+    wait = bucket.take(user["id"])
+    if wait:
+        QUOTA_REJECTIONS.labels(plan=user.get("plan", "free"), resource="requests").inc()
+        raise HTTPException(
+            status_code=429,
+            detail="Limite de requisições do plano atingido. Tente novamente em instantes.",
+            headers={"Retry-After": str(max(math.ceil(wait), 1))}
+        )
+
 # ============ AUTH ROUTES ============
 
 @api_router.post("/auth/register", response_model=TokenResponse)
-async def register(data: UserCreate):
+async def register(data: UserCreate, request: Request):
+    await app_state().login_throttle.check("register", client_ip(request), data.email)
     existing = await db.users.find_one({"email": data.email})
     if existing:
         raise HTTPException(status_code=400, detail="Email já cadastrado")
     
-    user_id = str(uuid.uuid4())
-    now = datetime.now(timezone.utc).isoformat()
+    user_id = uuid.uuid4()
+    now = datetime.now(timezone.utc)
     
     user_doc = {
         "id": user_id,
         "name": data.name,
         "email": data.email,
-        "password": hash_password(data.password),
+        "password": await hash_password_async(data.password),
         "role": "USER",
         "status": "active",
         "plan": "free",
@@ -370,6 +1435,7 @@ async def register(data: UserCreate):
         "updated_at": now
     }
     await db.users.insert_one(user_doc)
+    await db.task_templates.insert_many(default_task_templates(user_id))
     
     token = create_token(user_id)
     return TokenResponse(
@@ -378,9 +1444,10 @@ async def register(data: UserCreate):
     )
 
 @api_router.post("/auth/login", response_model=TokenResponse)
-async def login(data: UserLogin):
+async def login(data: UserLogin, request: Request):
+    await app_state().login_throttle.check("login", client_ip(request), data.email)
     user = await db.users.find_one({"email": data.email}, {"_id": 0})
-    if not user or not verify_password(data.password, user["password"]):
+    if not user or not await verify_password_async(data.password, user["password"]):
         raise HTTPException(status_code=401, detail="Credenciais inválidas")
     
     if user.get("status") == "blocked":
@@ -390,7 +1457,7 @@ async def login(data: UserLogin):
         raise HTTPException(status_code=403, detail="Conta pausada temporariamente. Entre em contato com o suporte.")
     
     # Update last login
-    now = datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc)
     await db.users.update_one({"id": user["id"]}, {"$set": {"last_login_at": now}})
     
     token = create_token(user["id"])
@@ -420,6 +1487,39 @@ async def get_me(user: dict = Depends(get_current_user)):
         "original_user_id": user.get("_original_user_id")
     }
 
+@api_router.post("/events/token")
+async def issue_events_token(user: dict = Depends(get_current_user)):
+    """Token curto para abrir o stream; o JWT de sessão nunca vai na URL"""
+    return {"token": create_events_token(user["id"]), "expires_in": EVENTS_TOKEN_TTL_SECONDS}
+
+@api_router.get("/events/stream")
+async def stream_events(token: str):
+    """Canal SSE do usuário. O EventSource não envia headers, então o token vai na query:
+    é o de /events/token, checado só na conexão."""
+    user = await authenticate_token(token, scope=EVENTS_TOKEN_SCOPE)
+    hub = app_state().live_hub
+    queue = hub.subscribe(user["id"])
+
+    async def event_stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                event = await queue.get()
+                if event is LiveHub.CLOSE:
+                    break
+                if event is LiveHub.HEARTBEAT:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps(event, default=json_default)}\n\n"
+        finally:
+            hub.unsubscribe(user["id"], queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ============ USER SETTINGS ============
 
 @api_router.put("/user/settings")
@@ -439,20 +1539,119 @@ async def update_user_settings(data: UserSettingsUpdate, user: dict = Depends(ge
     
     return {"message": "Configurações atualizadas com sucesso"}
 
+@api_router.get("/usage")
+async def get_usage(user: dict = Depends(get_current_user)):
+    """Uso atual e limites do plano"""
+    usage = await db.tenant_usage.find_one({"_id": user["id"]})
+    if not usage:
+        await init_usage(user["id"])
+        usage = await db.tenant_usage.find_one({"_id": user["id"]})
+    return {
+        "plan": user.get("plan", "free"),
+        "usage": {resource: max(usage.get(resource, 0), 0) for resource in QUOTA_RESOURCES},
+        "limits": {name: plan_quota(user, name) for name in QUOTA_RESOURCES + ["requests_per_minute"]}
+    }
+
 # ============ LEADS ROUTES ============
 
+# Listagens não trazem as chaves de busca (ver SEARCH)
+LIST_PROJECTION = {"_id": 0, "search_keys": 0}
+
 @api_router.get("/leads", response_model=List[LeadResponse])
 async def get_leads(user: dict = Depends(get_current_user)):
-    leads = await db.leads.find({"user_id": user["id"]}, {"_id": 0}).to_list(1000)
-    return leads
+    return await cached(user["id"], "leads", lambda: db.leads.find({"user_id": user["id"]}, LIST_PROJECTION).to_list(1000))
+
+# Kanban: cada coluna pagina por (updated_at, id) decrescente, no índice (user_id, stage, updated_at)
+BOARD_PAGE_SIZE = 20
+MAX_BOARD_PAGE_SIZE = 100
+BOARD_SORT = {"updated_at": -1, "id": -1}
+CLOSED_STAGES = ["fechado", "perdido"]
+
+def lead_totals_group(stale_before: Optional[datetime] = None) -> dict:
+    """$group por estágio: quantidade, soma de contract_value e leads abertos parados desde `stale_before`"""
+    group = {"_id": "$stage", "count": {"$sum": 1}, "value": {"$sum": {"$ifNull": ["$contract_value", 0]}}}
+    if stale_before:
+        open_stages = [stage for stage in PIPELINE_STAGES if stage not in CLOSED_STAGES]
+        is_stale = {"$and": [{"$in": ["$stage", open_stages]}, {"$lt": ["$updated_at", stale_before]}]}
+        group["stale"] = {"$sum": {"$cond": [is_stale, 1, 0]}}
+    return {"$group": group}
+
+async def lead_stage_totals(user_id, stale_before: Optional[datetime] = None) -> dict:
+    rows = await db.leads.aggregate([{"$match": {"user_id": user_id}}, lead_totals_group(stale_before)]).to_list(None)
+    return {row["_id"]: row for row in rows}
+
+def encode_board_cursor(lead: dict) -> str:
+    raw = f"{to_datetime(lead['updated_at']).isoformat()}|{lead['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def board_cursor_query(cursor: str) -> dict:
+    """Leads depois do cursor na ordem (updated_at, id) decrescente"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        updated_at, lead_id = raw.split("|")
+        updated_at, lead_id = to_datetime(updated_at), uuid.UUID(lead_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return {"$or": [
+        {"updated_at": {"$lt": updated_at}},
+        {"updated_at": updated_at, "id": {"$lt": lead_id}}
+    ]}
+
+def board_page(stage: str, leads: list, limit: int) -> dict:
+    # Busca limit + 1 cards: o excedente só indica que há próxima página
+    return {
+        "stage": stage,
+        "leads": leads[:limit],
+        "next_cursor": encode_board_cursor(leads[limit - 1]) if limit and len(leads) > limit else None
+    }
+
+async def board_column_leads(user_id, stage: str, limit: int, cursor: Optional[str] = None) -> list:
+    """limit + 1 cards de uma coluna pelo índice (user_id, stage, updated_at, id)"""
+    query = {"user_id": user_id, "stage": stage}
+    if cursor:
+        query.update(board_cursor_query(cursor))
+    return await db.leads.find(query, LIST_PROJECTION).sort(list(BOARD_SORT.items())).limit(limit + 1).to_list(limit + 1)
+
+async def compute_lead_board(user_id, limit: int) -> dict:
+    # Totais num $group e uma consulta indexada por coluna, em paralelo: dentro de um
+    # $facet o $sort/$limit de cada estágio não usaria o índice
+    pages = [board_column_leads(user_id, stage, limit) for stage in PIPELINE_STAGES] if limit else []
+    totals, *leads = await asyncio.gather(lead_stage_totals(user_id), *pages)
+    columns = []
+    for index, stage in enumerate(PIPELINE_STAGES):
+        column = board_page(stage, leads[index] if limit else [], limit)
+        column["count"] = totals.get(stage, {}).get("count", 0)
+        column["value"] = round(totals.get(stage, {}).get("value", 0), 2)
+        columns.append(column)
+    return {"columns": columns}
+
+@api_router.get("/leads/board", response_model=LeadBoard)
+async def get_lead_board(
+    limit: int = Query(BOARD_PAGE_SIZE, ge=0, le=MAX_BOARD_PAGE_SIZE),
+    user: dict = Depends(get_current_user)
+):
+    """Colunas do kanban com totais e a primeira página de cards; limit=0 devolve só os totais"""
+    return await cached(user["id"], ("leads_board", limit), lambda: compute_lead_board(user["id"], limit))
+
+@api_router.get("/leads/board/{stage}", response_model=LeadBoardPage)
+async def get_lead_board_page(
+    stage: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(BOARD_PAGE_SIZE, ge=1, le=MAX_BOARD_PAGE_SIZE),
+    user: dict = Depends(get_current_user)
+):
+    """Próxima página de uma coluna do kanban, a partir do `next_cursor` anterior"""
+    if stage not in PIPELINE_STAGES:
+        raise HTTPException(status_code=400, detail="Estágio inválido")
+    return board_page(stage, await board_column_leads(user["id"], stage, limit, cursor), limit)
 
 @api_router.post("/leads", response_model=LeadResponse)
 async def create_lead(data: LeadCreate, user: dict = Depends(get_current_user)):
     if data.stage not in PIPELINE_STAGES:
         raise HTTPException(status_code=400, detail="Estágio inválido")
     
-    lead_id = str(uuid.uuid4())
-    now = datetime.now(timezone.utc).isoformat()
+    lead_id = uuid.uuid4()
+    now = datetime.now(timezone.utc)
     
     lead_doc = {
         "id": lead_id,
@@ -466,33 +1665,40 @@ async def create_lead(data: LeadCreate, user: dict = Depends(get_current_user)):
         "reminder": data.reminder,
         "notes": data.notes,
         "user_id": user["id"],
+        "stage_changed_at": now,
+        "stages_reached": stages_reached(data.stage),
         "created_at": now,
         "updated_at": now
     }
-    await db.leads.insert_one(lead_doc)
-    
-    # Se definiu próximo contato, criar tarefa na agenda automaticamente
-    if data.next_contact:
-        task_doc = {
-            "id": str(uuid.uuid4()),
-            "title": f"Follow-up: {data.name}",
-            "description": data.reminder or f"Lembrete de contato com {data.name}",
-            "task_type": "follow_up",
-            "due_date": data.next_contact,
-            "completed": False,
-            "client_id": None,
-            "client_name": None,
-            "lead_id": lead_id,
-            "lead_name": data.name,
-            "user_id": user["id"],
-            "created_at": now
-        }
-        await db.tasks.insert_one(task_doc)
+    lead_doc["search_keys"] = search_keys("leads", lead_doc)
+    async with quota_reservation(user, "leads"), quota_reservation(user, "tasks", 1 if data.next_contact else 0):
+        await db.leads.insert_one(lead_doc)
+        await record_stage_change(user["id"], lead_id, None, data.stage, now)
+        
+        # Se definiu próximo contato, criar tarefa na agenda automaticamente
+        if data.next_contact:
+            task_doc = {
+                "id": uuid.uuid4(),
+                "title": f"Follow-up: {data.name}",
+                "description": data.reminder or f"Lembrete de contato com {data.name}",
+                "task_type": "follow_up",
+                "due_date": data.next_contact,
+                "completed": False,
+                "client_id": None,
+                "client_name": None,
+                "lead_id": lead_id,
+                "lead_name": data.name,
+                "user_id": user["id"],
+                "created_at": now,
+                **reminder_fields(data.next_contact)
+            }
+            task_doc["search_keys"] = search_keys("tasks", task_doc)
+            await db.tasks.insert_one(task_doc)
     
     return lead_doc
 
 @api_router.put("/leads/{lead_id}", response_model=LeadResponse)
-async def update_lead(lead_id: str, data: LeadUpdate, user: dict = Depends(get_current_user)):
+async def update_lead(lead_id: uuid.UUID, data: LeadUpdate, user: dict = Depends(get_current_user)):
     lead = await db.leads.find_one({"id": lead_id, "user_id": user["id"]}, {"_id": 0})
     if not lead:
         raise HTTPException(status_code=404, detail="Lead não encontrado")
@@ -501,22 +1707,22 @@ async def update_lead(lead_id: str, data: LeadUpdate, user: dict = Depends(get_c
         raise HTTPException(status_code=400, detail="Estágio inválido")
     
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
-    update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
+    update_data["updated_at"] = datetime.now(timezone.utc)
     
     # Se definiu próximo contato, criar tarefa na agenda automaticamente
-    if data.next_contact and data.next_contact != lead.get("next_contact"):
+    if data.next_contact and data.next_contact != to_datetime(lead.get("next_contact")):
         # Verificar se já existe tarefa de follow-up para este lead nesta data
         existing_task = await db.tasks.find_one({
             "lead_id": lead_id,
             "task_type": "follow_up",
-            "due_date": data.next_contact,
+            "due_date": {"$in": [data.next_contact, api_date(data.next_contact)]},
             "user_id": user["id"]
         })
         
         if not existing_task:
-            now = datetime.now(timezone.utc).isoformat()
+            now = datetime.now(timezone.utc)
             task_doc = {
-                "id": str(uuid.uuid4()),
+                "id": uuid.uuid4(),
                 "title": f"Follow-up: {lead['name']}",
                 "description": data.reminder or f"Lembrete de contato com {lead['name']}",
                 "task_type": "follow_up",
@@ -525,41 +1731,56 @@ async def update_lead(lead_id: str, data: LeadUpdate, user: dict = Depends(get_c
                 "client_id": None,
                 "client_name": None,
                 "lead_id": lead_id,
-                "lead_name": lead["name"],
+                "lead_name": data.name or lead["name"],
                 "user_id": user["id"],
-                "created_at": now
+                "created_at": now,
+                **reminder_fields(data.next_contact)
             }
-            await db.tasks.insert_one(task_doc)
+            task_doc["search_keys"] = search_keys("tasks", task_doc)
+            async with quota_reservation(user, "tasks"):
+                await db.tasks.insert_one(task_doc)
     
-    await db.leads.update_one({"id": lead_id}, {"$set": update_data})
+    update_data.update(search_update("leads", lead, update_data))
+    update = {"$set": update_data}
+    if data.stage and data.stage != lead["stage"]:
+        update_data["stage_changed_at"] = update_data["updated_at"]
+        update["$addToSet"] = {"stages_reached": {"$each": stages_reached(data.stage)}}
+    # Documento de antes: a transição registrada é a que esta escrita de fato fez
+    before = await db.leads.find_one_and_update({"id": lead_id}, update, projection=LEAD_STAGE_FIELDS)
+    if before and data.stage and data.stage != before["stage"]:
+        await record_stage_change(user["id"], lead_id, before, data.stage, update_data["updated_at"])
+    if data.name and data.name != lead["name"]:
+        # A agenda lê o nome gravado na tarefa, sem join
+        await db.tasks.update_many({"user_id": user["id"], "lead_id": lead_id}, {"$set": {"lead_name": data.name}})
     updated = await db.leads.find_one({"id": lead_id}, {"_id": 0})
     return updated
 
 @api_router.delete("/leads/{lead_id}")
-async def delete_lead(lead_id: str, user: dict = Depends(get_current_user)):
+async def delete_lead(lead_id: uuid.UUID, user: dict = Depends(get_current_user)):
     result = await db.leads.delete_one({"id": lead_id, "user_id": user["id"]})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Lead não encontrado")
+    await adjust_usage(user["id"], "leads", -1)
     return {"message": "Lead excluído com sucesso"}
 
 @api_router.post("/leads/{lead_id}/convert", response_model=ClientResponse)
-async def convert_lead_to_client(lead_id: str, user: dict = Depends(get_current_user)):
+async def convert_lead_to_client(lead_id: uuid.UUID, user: dict = Depends(get_current_user)):
     lead = await db.leads.find_one({"id": lead_id, "user_id": user["id"]}, {"_id": 0})
     if not lead:
         raise HTTPException(status_code=404, detail="Lead não encontrado")
     
     # Create client from lead
-    client_id = str(uuid.uuid4())
-    now = datetime.now(timezone.utc).isoformat()
+    client_id = uuid.uuid4()
+    now = datetime.now(timezone.utc)
     
     # Default onboarding checklist
     checklist = [
-        {"id": str(uuid.uuid4()), "title": "Revisão do perfil", "completed": False},
-        {"id": str(uuid.uuid4()), "title": "SEO descrição", "completed": False},
-        {"id": str(uuid.uuid4()), "title": "Inserção serviços", "completed": False},
-        {"id": str(uuid.uuid4()), "title": "Fotos", "completed": False},
-        {"id": str(uuid.uuid4()), "title": "Primeira postagem", "completed": False},
-        {"id": str(uuid.uuid4()), "title": "Pedido de avaliação", "completed": False},
+        {"id": uuid.uuid4(), "title": "Revisão do perfil", "completed": False},
+        {"id": uuid.uuid4(), "title": "SEO descrição", "completed": False},
+        {"id": uuid.uuid4(), "title": "Inserção serviços", "completed": False},
+        {"id": uuid.uuid4(), "title": "Fotos", "completed": False},
+        {"id": uuid.uuid4(), "title": "Primeira postagem", "completed": False},
+        {"id": uuid.uuid4(), "title": "Pedido de avaliação", "completed": False},
     ]
     
     client_doc = {
@@ -569,44 +1790,34 @@ async def convert_lead_to_client(lead_id: str, user: dict = Depends(get_current_
         "phone": lead.get("phone"),
         "company": lead.get("company"),
         "contract_value": lead.get("contract_value", 0),
+        "plan": "recorrente",
         "notes": lead.get("notes"),
         "checklist": checklist,
+        "weekly_tasks": [],
+        "weekly_tasks_reset_at": now,
+        "tasks_horizon": now,
         "user_id": user["id"],
         "created_at": now,
         "updated_at": now
     }
-    await db.clients.insert_one(client_doc)
-    
-    # Create recurring monthly tasks
-    today = datetime.now(timezone.utc)
-    recurring_tasks = [
-        {"title": "Postagem 1 do mês", "task_type": "recorrente"},
-        {"title": "Postagem 2 do mês", "task_type": "recorrente"},
-        {"title": "Postagem 3 do mês", "task_type": "recorrente"},
-        {"title": "Postagem 4 do mês", "task_type": "recorrente"},
-        {"title": "Análise mensal", "task_type": "recorrente"},
-        {"title": "Pedido de avaliação mensal", "task_type": "recorrente"},
-    ]
     
-    for i, task in enumerate(recurring_tasks):
-        task_doc = {
-            "id": str(uuid.uuid4()),
-            "title": task["title"],
-            "description": f"Tarefa recorrente para {lead['name']}",
-            "task_type": task["task_type"],
-            "due_date": (today + timedelta(days=(i + 1) * 5)).isoformat(),
-            "completed": False,
-            "client_id": client_id,
-            "client_name": lead["name"],
-            "lead_id": None,
-            "lead_name": None,
-            "user_id": user["id"],
-            "created_at": now
-        }
-        await db.tasks.insert_one(task_doc)
+    client_doc["search_keys"] = search_keys("clients", client_doc)
+    async with quota_reservation(user, "clients"):
+        await db.clients.insert_one(client_doc)
+    # Tarefas recorrentes a partir dos modelos do usuário
+    await generate_template_tasks(query={"id": client_id})
     
     # Update lead stage to "fechado"
-    await db.leads.update_one({"id": lead_id}, {"$set": {"stage": "fechado", "updated_at": now}})
+    before = await db.leads.find_one_and_update(
+        {"id": lead_id, "stage": {"$ne": "fechado"}},
+        {
+            "$set": {"stage": "fechado", "stage_changed_at": now, "updated_at": now},
+            "$addToSet": {"stages_reached": {"$each": stages_reached("fechado")}}
+        },
+        projection=LEAD_STAGE_FIELDS
+    )
+    if before:
+        await record_stage_change(user["id"], lead_id, before, "fechado", now)
     
     return client_doc
 
@@ -614,11 +1825,10 @@ async def convert_lead_to_client(lead_id: str, user: dict = Depends(get_current_
 
 @api_router.get("/clients", response_model=List[ClientResponse])
 async def get_clients(user: dict = Depends(get_current_user)):
-    clients = await db.clients.find({"user_id": user["id"]}, {"_id": 0}).to_list(1000)
-    return clients
+    return await cached(user["id"], "clients", lambda: db.clients.find({"user_id": user["id"]}, LIST_PROJECTION).to_list(1000))
 
 @api_router.get("/clients/{client_id}", response_model=ClientResponse)
-async def get_client(client_id: str, user: dict = Depends(get_current_user)):
+async def get_client(client_id: uuid.UUID, user: dict = Depends(get_current_user)):
     client = await db.clients.find_one({"id": client_id, "user_id": user["id"]}, {"_id": 0})
     if not client:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
@@ -626,15 +1836,15 @@ async def get_client(client_id: str, user: dict = Depends(get_current_user)):
 
 @api_router.post("/clients", response_model=ClientResponse)
 async def create_client(data: ClientCreate, user: dict = Depends(get_current_user)):
-    client_id = str(uuid.uuid4())
-    now = datetime.now(timezone.utc).isoformat()
+    client_id = uuid.uuid4()
+    now = datetime.now(timezone.utc)
     
     # Novo checklist de onboarding
     checklist = [
-        {"id": str(uuid.uuid4()), "title": "Criar NAP", "completed": False},
-        {"id": str(uuid.uuid4()), "title": "Solicitar Acesso ou Criar Perfil", "completed": False},
-        {"id": str(uuid.uuid4()), "title": "Solicitar Fotos e Imagens", "completed": False},
-        {"id": str(uuid.uuid4()), "title": "Editar Perfil", "completed": False},
+        {"id": uuid.uuid4(), "title": "Criar NAP", "completed": False},
+        {"id": uuid.uuid4(), "title": "Solicitar Acesso ou Criar Perfil", "completed": False},
+        {"id": uuid.uuid4(), "title": "Solicitar Fotos e Imagens", "completed": False},
+        {"id": uuid.uuid4(), "title": "Editar Perfil", "completed": False},
     ]
     
     client_doc = {
@@ -649,15 +1859,19 @@ async def create_client(data: ClientCreate, user: dict = Depends(get_current_use
         "checklist": checklist,
         "weekly_tasks": [],
         "weekly_tasks_reset_at": now,
+        "tasks_horizon": now,
         "user_id": user["id"],
         "created_at": now,
         "updated_at": now
     }
-    await db.clients.insert_one(client_doc)
+    client_doc["search_keys"] = search_keys("clients", client_doc)
+    async with quota_reservation(user, "clients"):
+        await db.clients.insert_one(client_doc)
+    await generate_template_tasks(query={"id": client_id})
     return client_doc
 
 @api_router.put("/clients/{client_id}/checklist/{item_id}")
-async def toggle_checklist_item(client_id: str, item_id: str, user: dict = Depends(get_current_user)):
+async def toggle_checklist_item(client_id: uuid.UUID, item_id: uuid.UUID, user: dict = Depends(get_current_user)):
     client = await db.clients.find_one({"id": client_id, "user_id": user["id"]}, {"_id": 0})
     if not client:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
@@ -668,20 +1882,24 @@ async def toggle_checklist_item(client_id: str, item_id: str, user: dict = Depen
             item["completed"] = not item["completed"]
             break
     
-    await db.clients.update_one({"id": client_id}, {"$set": {"checklist": checklist, "updated_at": datetime.now(timezone.utc).isoformat()}})
+    await db.clients.update_one({"id": client_id}, {"$set": {"checklist": checklist, "updated_at": datetime.now(timezone.utc)}})
     return {"message": "Item atualizado"}
 
 @api_router.put("/clients/{client_id}")
-async def update_client(client_id: str, data: ClientUpdate, user: dict = Depends(get_current_user)):
+async def update_client(client_id: uuid.UUID, data: ClientUpdate, user: dict = Depends(get_current_user)):
     """Editar informações do cliente"""
     client = await db.clients.find_one({"id": client_id, "user_id": user["id"]}, {"_id": 0})
     if not client:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
     
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
-    update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
+    update_data["updated_at"] = datetime.now(timezone.utc)
+    update_data.update(search_update("clients", client, update_data))
     
     await db.clients.update_one({"id": client_id}, {"$set": update_data})
+    if data.name and data.name != client["name"]:
+        # A agenda lê o nome gravado na tarefa, sem join
+        await db.tasks.update_many({"user_id": user["id"], "client_id": client_id}, {"$set": {"client_name": data.name}})
     updated = await db.clients.find_one({"id": client_id}, {"_id": 0})
     return updated
 
@@ -692,21 +1910,21 @@ def get_week_start():
     today = datetime.now(timezone.utc).date()
     days_since_monday = today.weekday()
     monday = today - timedelta(days=days_since_monday)
-    return datetime.combine(monday, datetime.min.time(), tzinfo=timezone.utc).isoformat()
+    return datetime.combine(monday, datetime.min.time(), tzinfo=timezone.utc)
 
 @api_router.get("/clients/{client_id}/weekly-tasks")
-async def get_weekly_tasks(client_id: str, user: dict = Depends(get_current_user)):
+async def get_weekly_tasks(client_id: uuid.UUID, user: dict = Depends(get_current_user)):
     """Obter tarefas da semana do cliente (com reset automático)"""
     client = await db.clients.find_one({"id": client_id, "user_id": user["id"]}, {"_id": 0})
     if not client:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
     
     weekly_tasks = client.get("weekly_tasks", [])
-    reset_at = client.get("weekly_tasks_reset_at", "")
+    reset_at = to_datetime(client.get("weekly_tasks_reset_at"))
     week_start = get_week_start()
     
     # Verificar se precisa resetar (nova semana começou)
-    if reset_at < week_start:
+    if reset_at is None or reset_at < week_start:
         # Reset: marcar todas as tarefas como não concluídas
         for task in weekly_tasks:
             task["completed"] = False
@@ -719,7 +1937,7 @@ async def get_weekly_tasks(client_id: str, user: dict = Depends(get_current_user
     return {"weekly_tasks": weekly_tasks, "reset_at": week_start}
 
 @api_router.post("/clients/{client_id}/weekly-tasks")
-async def add_weekly_task(client_id: str, title: str = "", user: dict = Depends(get_current_user)):
+async def add_weekly_task(client_id: uuid.UUID, title: str = "", user: dict = Depends(get_current_user)):
     """Adicionar tarefa da semana"""
     client = await db.clients.find_one({"id": client_id, "user_id": user["id"]}, {"_id": 0})
     if not client:
@@ -727,7 +1945,7 @@ async def add_weekly_task(client_id: str, title: str = "", user: dict = Depends(
     
     weekly_tasks = client.get("weekly_tasks", [])
     new_task = {
-        "id": str(uuid.uuid4()),
+        "id": uuid.uuid4(),
         "title": title,
         "completed": False
     }
@@ -735,12 +1953,12 @@ async def add_weekly_task(client_id: str, title: str = "", user: dict = Depends(
     
     await db.clients.update_one(
         {"id": client_id},
-        {"$set": {"weekly_tasks": weekly_tasks, "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"weekly_tasks": weekly_tasks, "updated_at": datetime.now(timezone.utc)}}
     )
     return new_task
 
 @api_router.put("/clients/{client_id}/weekly-tasks/{task_id}")
-async def update_weekly_task(client_id: str, task_id: str, title: Optional[str] = None, completed: Optional[bool] = None, user: dict = Depends(get_current_user)):
+async def update_weekly_task(client_id: uuid.UUID, task_id: uuid.UUID, title: Optional[str] = None, completed: Optional[bool] = None, user: dict = Depends(get_current_user)):
     """Atualizar tarefa da semana (editar título ou marcar concluída)"""
     client = await db.clients.find_one({"id": client_id, "user_id": user["id"]}, {"_id": 0})
     if not client:
@@ -757,12 +1975,12 @@ async def update_weekly_task(client_id: str, task_id: str, title: Optional[str]
     
     await db.clients.update_one(
         {"id": client_id},
-        {"$set": {"weekly_tasks": weekly_tasks, "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"weekly_tasks": weekly_tasks, "updated_at": datetime.now(timezone.utc)}}
     )
     return {"message": "Tarefa atualizada"}
 
 @api_router.delete("/clients/{client_id}/weekly-tasks/{task_id}")
-async def delete_weekly_task(client_id: str, task_id: str, user: dict = Depends(get_current_user)):
+async def delete_weekly_task(client_id: uuid.UUID, task_id: uuid.UUID, user: dict = Depends(get_current_user)):
     """Excluir tarefa da semana"""
     client = await db.clients.find_one({"id": client_id, "user_id": user["id"]}, {"_id": 0})
     if not client:
@@ -772,48 +1990,76 @@ async def delete_weekly_task(client_id: str, task_id: str, user: dict = Depends(
     
     await db.clients.update_one(
         {"id": client_id},
-        {"$set": {"weekly_tasks": weekly_tasks, "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"weekly_tasks": weekly_tasks, "updated_at": datetime.now(timezone.utc)}}
     )
     return {"message": "Tarefa excluída"}
 
 @api_router.delete("/clients/{client_id}")
-async def delete_client(client_id: str, user: dict = Depends(get_current_user)):
+async def delete_client(client_id: uuid.UUID, user: dict = Depends(get_current_user)):
     result = await db.clients.delete_one({"id": client_id, "user_id": user["id"]})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
     # Also delete related tasks and payments
+    tasks = await db.tasks.delete_many({"client_id": client_id, **QUOTA_COUNTED["tasks"]})
     await db.tasks.delete_many({"client_id": client_id})
-    await db.payments.delete_many({"client_id": client_id})
+    await remove_from_finance_rollups({"client_id": client_id})
+    payments = await db.payments.delete_many({"client_id": client_id})
+    await adjust_usage(user["id"], "clients", -1)
+    await adjust_usage(user["id"], "tasks", -tasks.deleted_count)
+    await adjust_usage(user["id"], "payments", -payments.deleted_count)
     return {"message": "Cliente excluído com sucesso"}
 
 # ============ TASKS ROUTES ============
 
+MAX_TASKS = 1000
+
 @api_router.get("/tasks", response_model=List[TaskResponse])
-async def get_tasks(filter: Optional[str] = None, user: dict = Depends(get_current_user)):
+async def get_tasks(
+    filter: Optional[str] = None,
+    from_date: Annotated[OptionalDateParam, Query(alias="from")] = None,
+    to_date: Annotated[OptionalDateParam, Query(alias="to")] = None,
+    client_id: Optional[uuid.UUID] = None,
+    lead_id: Optional[uuid.UUID] = None,
+    completed: Optional[bool] = None,
+    user: dict = Depends(get_current_user)
+):
+    """Tarefas por vencimento; `from`/`to` (inclusivos), cliente, lead e status restringem
+    a janela no banco via (user_id, due_date), (user_id, client_id, due_date) e (user_id, lead_id, due_date)"""
     query = {"user_id": user["id"]}
     
-    today = datetime.now(timezone.utc).date()
-    week_end = today + timedelta(days=7)
-    
-    if filter == "today":
-        query["due_date"] = {"$lte": datetime.combine(today, datetime.max.time()).isoformat()}
-        query["completed"] = False
-    elif filter == "week":
-        query["due_date"] = {"$lte": datetime.combine(week_end, datetime.max.time()).isoformat()}
-        query["completed"] = False
+    today = datetime.combine(datetime.now(timezone.utc).date(), datetime.min.time(), tzinfo=timezone.utc)
+    
+    if filter in ("today", "week"):
+        until = today + timedelta(days=7 if filter == "week" else 0)
+        to_date = min(to_date, until) if to_date else until
+        completed = False
     elif filter == "followups":
         query["task_type"] = "follow_up"
-        query["completed"] = False
+        completed = False
     elif filter == "pending":
-        query["completed"] = False
+        completed = False
     
-    tasks = await db.tasks.find(query, {"_id": 0}).sort("due_date", 1).to_list(1000)
-    return tasks
+    if client_id:
+        query["client_id"] = client_id
+    if lead_id:
+        query["lead_id"] = lead_id
+    if completed is not None:
+        query["completed"] = completed
+    bounds = {}
+    if from_date:
+        bounds["gte"] = datetime.combine(from_date.date(), datetime.min.time(), tzinfo=timezone.utc)
+    if to_date:
+        bounds["lte"] = datetime.combine(to_date.date(), datetime.max.time(), tzinfo=timezone.utc)
+    if bounds:
+        query.update(date_range_query("due_date", **bounds))
+    
+    key = ("tasks", filter, from_date, to_date, client_id, lead_id, completed)
+    return await cached(user["id"], key, lambda: db.tasks.find(query, LIST_PROJECTION).sort("due_date", 1).to_list(MAX_TASKS))
 
 @api_router.post("/tasks", response_model=TaskResponse)
 async def create_task(data: TaskCreate, user: dict = Depends(get_current_user)):
-    task_id = str(uuid.uuid4())
-    now = datetime.now(timezone.utc).isoformat()
+    task_id = uuid.uuid4()
+    now = datetime.now(timezone.utc)
     
     client_name = None
     lead_name = None
@@ -838,82 +2084,1173 @@ async def create_task(data: TaskCreate, user: dict = Depends(get_current_user)):
         "lead_id": data.lead_id,
         "lead_name": lead_name,
         "user_id": user["id"],
-        "created_at": now
+        "created_at": now,
+        **reminder_fields(data.due_date)
     }
-    await db.tasks.insert_one(task_doc)
+    task_doc["search_keys"] = search_keys("tasks", task_doc)
+    async with quota_reservation(user, "tasks"):
+        await db.tasks.insert_one(task_doc)
     return task_doc
 
 @api_router.put("/tasks/{task_id}", response_model=TaskResponse)
-async def update_task(task_id: str, data: TaskUpdate, user: dict = Depends(get_current_user)):
+async def update_task(task_id: uuid.UUID, data: TaskUpdate, user: dict = Depends(get_current_user)):
     task = await db.tasks.find_one({"id": task_id, "user_id": user["id"]}, {"_id": 0})
     if not task:
         raise HTTPException(status_code=404, detail="Tarefa não encontrada")
     
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
-    await db.tasks.update_one({"id": task_id}, {"$set": update_data})
+    update_data.update(search_update("tasks", task, update_data))
+    update = {"$set": update_data}
+    rescheduled = "due_date" in update_data and to_datetime(update_data["due_date"]) != to_datetime(task["due_date"])
+    reopened = update_data.get("completed") is False and task["completed"]
+    if not task.get("template_id") and (rescheduled or reopened or update_data.get("completed")):
+        # Reprograma o lembrete: nova data ou tarefa reaberta; concluída não lembra mais
+        merged = {**task, **update_data}
+        reminder = {} if merged["completed"] else reminder_fields(merged["due_date"])
+        update_data.update(reminder)
+        unset = {} if reminder else {"remind_at": ""}
+        if rescheduled:
+            unset["reminder_sent_at"] = ""
+        if unset:
+            update["$unset"] = unset
+    await db.tasks.update_one({"id": task_id}, update)
     updated = await db.tasks.find_one({"id": task_id}, {"_id": 0})
     return updated
 
 @api_router.delete("/tasks/{task_id}")
-async def delete_task(task_id: str, user: dict = Depends(get_current_user)):
-    result = await db.tasks.delete_one({"id": task_id, "user_id": user["id"]})
-    if result.deleted_count == 0:
+async def delete_task(task_id: uuid.UUID, user: dict = Depends(get_current_user)):
+    task = await db.tasks.find_one_and_delete({"id": task_id, "user_id": user["id"]}, {"_id": 0, "id": 1, "template_id": 1})
+    if task is None:
         raise HTTPException(status_code=404, detail="Tarefa não encontrada")
+    if not task.get("template_id"):
+        await adjust_usage(user["id"], "tasks", -1)
     return {"message": "Tarefa excluída com sucesso"}
 
+# ============ FINANCE ROLLUPS ============
+
+# Um documento em `finance_rollups` por (user_id, mês de vencimento "YYYY-MM") com
+# total e contagem por status. As rotas de pagamento aplicam cada escrita com $inc;
+# o rebuild recalcula tudo a partir de `payments` (migração 0003 e
+# `python server.py rebuild-finance`).
+
+ROLLUP_FIELDS = [field for status in PAYMENT_STATUS for field in (status, f"{status}_count")]
+MONTH_PATTERN = r"^\d{4}-(0[1-9]|1[0-2])$"
+MAX_HISTORY_MONTHS = 240
+
+def payment_status(payment: dict, today=None) -> str:
+    """Status de um pagamento hoje (UTC): paid, overdue (vencido e não pago) ou pending"""
+    if payment.get("paid"):
+        return "paid"
+    today = today or datetime.now(timezone.utc).date()
+    return "overdue" if to_datetime(payment["due_date"]).date() < today else "pending"
+
+def rollup_month(value) -> str:
+    return to_datetime(value).strftime("%Y-%m")
+
+def rollup_pipeline(match: dict) -> list:
+    """Totais por (user_id, mês), no mesmo formato dos documentos de rollup"""
+    today = datetime.combine(datetime.now(timezone.utc).date(), datetime.min.time(), tzinfo=timezone.utc)
+    # Pagamentos gravados antes do campo `status` são classificados como em payment_status
+    status = {"$ifNull": ["$status", {"$cond": [
+        {"$eq": ["$paid", True]}, "paid",
+        {"$cond": [{"$lt": ["$due_date", today]}, "overdue", "pending"]}
+    ]}]}
+    group = {"_id": {"user_id": "$user_id", "month": {"$dateToString": {"format": "%Y-%m", "date": "$due_date"}}}}
+    for name in PAYMENT_STATUS:
+        group[name] = {"$sum": {"$cond": [{"$eq": [status, name]}, "$amount", 0]}}
+        group[f"{name}_count"] = {"$sum": {"$cond": [{"$eq": [status, name]}, 1, 0]}}
+    return [{"$match": match}, {"$group": group}]
+
+def rollup_deltas(changes) -> dict:
+    """(pagamento, +1/-1), ... -> {(user_id, mês): {campo: incremento}}"""
+    deltas = {}
+    for payment, sign in changes:
+        if payment:
+            status = payment.get("status") or payment_status(payment)
+            inc = deltas.setdefault((payment["user_id"], rollup_month(payment["due_date"])), {})
+            inc[status] = inc.get(status, 0) + sign * payment["amount"]
+            inc[f"{status}_count"] = inc.get(f"{status}_count", 0) + sign
+    return deltas
+
+async def inc_finance_rollups(deltas: dict):
+    now = datetime.now(timezone.utc)
+    requests = []
+    for (user_id, month), inc in deltas.items():
+        inc = {field: value for field, value in inc.items() if value}
+        if inc:
+            requests.append(UpdateOne(
+                {"user_id": user_id, "month": month}, {"$inc": inc, "$set": {"updated_at": now}}, upsert=True
+            ))
+    if requests:
+        await db.finance_rollups.bulk_write(requests, ordered=False)
+
+async def update_finance_rollups(removed: Optional[dict] = None, added: Optional[dict] = None):
+    """Tira `removed` (o documento como estava) e soma `added` (como ficou) nos buckets"""
+    await inc_finance_rollups(rollup_deltas([(removed, -1), (added, 1)]))
+
+async def remove_from_finance_rollups(query: dict):
+    """Chamado antes de um delete_many em `payments`: desconta os pagamentos que serão apagados"""
+    await inc_finance_rollups({
+        (row["_id"]["user_id"], row["_id"]["month"]): {field: -row[field] for field in ROLLUP_FIELDS}
+        async for row in db.payments.aggregate(rollup_pipeline(query))
+    })
+
+async def rebuild_finance_rollups(user_id: Optional[uuid.UUID] = None, lease: Optional["Lease"] = None,
+                                  batch_size: int = 500) -> int:
+    """Recalcula os rollups a partir de `payments` (todos os tenants ou só `user_id`).
+
+    Idempotente. Uma escrita de pagamento concorrente com o rebuild pode ficar
+    contada em dobro ou de fora; rodar de novo corrige.
+    """
+    started = datetime.now(timezone.utc)
+    scope = {} if user_id is None else {"user_id": user_id}
+    requests = []
+    written = 0
+    async for row in db.payments.aggregate(rollup_pipeline(scope), allowDiskUse=True):
+        key = {"user_id": row["_id"]["user_id"], "month": row["_id"]["month"]}
+        totals = {field: row[field] for field in ROLLUP_FIELDS}
+        requests.append(ReplaceOne(key, {**key, **totals, "updated_at": started}, upsert=True))
+        if len(requests) >= batch_size:
+            await db.finance_rollups.bulk_write(requests, ordered=False)
+            written += len(requests)
+            requests = []
+            if lease:
+                await lease.renew()
+    if requests:
+        await db.finance_rollups.bulk_write(requests, ordered=False)
+        written += len(requests)
+    # Meses que ficaram sem pagamentos não aparecem na agregação
+    await db.finance_rollups.delete_many({**scope, "updated_at": {"$lt": started}})
+    return written
+
+def month_range(first: str, last: str) -> List[str]:
+    year, month = map(int, first.split("-"))
+    months = []
+    while f"{year:04d}-{month:02d}" <= last and len(months) <= MAX_HISTORY_MONTHS:
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+def shift_month(value: str, months: int) -> str:
+    year, month = map(int, value.split("-"))
+    index = year * 12 + month - 1 + months
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+@api_router.get("/finance/history")
+async def get_finance_history(
+    from_month: Optional[str] = Query(None, alias="from", pattern=MONTH_PATTERN),
+    to_month: Optional[str] = Query(None, alias="to", pattern=MONTH_PATTERN),
+    user: dict = Depends(get_current_user)
+):
+    """Totais mensais (pago, pendente, vencido) de `from` a `to` (YYYY-MM); padrão: últimos 12 meses"""
+    current_month = datetime.now(timezone.utc).strftime("%Y-%m")
+    to_month = to_month or current_month
+    from_month = from_month or shift_month(to_month, -11)
+    months = month_range(from_month, to_month)
+    if not months:
+        raise HTTPException(status_code=400, detail="Período inválido")
+    if len(months) > MAX_HISTORY_MONTHS:
+        raise HTTPException(status_code=400, detail=f"Período máximo de {MAX_HISTORY_MONTHS} meses")
+
+    rollups = {
+        doc["month"]: doc
+        async for doc in db.finance_rollups.find(
+            {"user_id": user["id"], "month": {"$gte": from_month, "$lte": to_month}}, {"_id": 0, "user_id": 0}
+        )
+    }
+    history = []
+    totals = {field: 0 for field in ROLLUP_FIELDS}
+    for month in months:
+        row = {field: rollups.get(month, {}).get(field, 0) for field in ROLLUP_FIELDS}
+        if month < current_month:
+            # Em um mês que já passou, todo pagamento pendente está vencido
+            row["overdue"] += row["pending"]
+            row["overdue_count"] += row["pending_count"]
+            row["pending"] = row["pending_count"] = 0
+        for field in ROLLUP_FIELDS:
+            totals[field] += row[field]
+        # -0.0 e resíduos de ponto flutuante dos $inc
+        history.append({"month": month, **{field: round(value, 2) or 0 for field, value in row.items()}})
+
+    return {
+        "from": from_month,
+        "to": to_month,
+        "months": history,
+        "totals": {field: round(value, 2) or 0 for field, value in totals.items()}
+    }
+
 # ============ PAYMENTS ROUTES ============
 
-@api_router.get("/payments", response_model=List[PaymentResponse])
-async def get_payments(user: dict = Depends(get_current_user)):
-    payments = await db.payments.find({"user_id": user["id"]}, {"_id": 0}).to_list(1000)
-    return payments
+@api_router.get("/payments", response_model=List[PaymentResponse])
+async def get_payments(user: dict = Depends(get_current_user)):
+    return await cached(user["id"], "payments", lambda: db.payments.find({"user_id": user["id"]}, {"_id": 0}).to_list(1000))
+
+@api_router.post("/payments", response_model=PaymentResponse)
+async def create_payment(data: PaymentCreate, user: dict = Depends(get_current_user)):
+    client = await db.clients.find_one({"id": data.client_id, "user_id": user["id"]}, {"_id": 0})
+    if not client:
+        raise HTTPException(status_code=404, detail="Cliente não encontrado")
+    
+    payment_id = uuid.uuid4()
+    now = datetime.now(timezone.utc)
+    
+    payment_doc = {
+        "id": payment_id,
+        "client_id": data.client_id,
+        "client_name": client["name"],
+        "description": data.description,
+        "amount": data.amount,
+        "payment_type": data.payment_type,
+        "due_date": data.due_date,
+        "paid": data.paid,
+        "user_id": user["id"],
+        "created_at": now
+    }
+    payment_doc["status"] = payment_status(payment_doc)
+    if data.payment_type == "recorrente":
+        payment_doc.update(recurrence_fields(payment_doc))
+    async with quota_reservation(user, "payments"):
+        await db.payments.insert_one(payment_doc)
+    await update_finance_rollups(added=payment_doc)
+    return payment_doc
+
+@api_router.put("/payments/{payment_id}", response_model=PaymentResponse)
+async def update_payment(payment_id: uuid.UUID, data: PaymentUpdate, user: dict = Depends(get_current_user)):
+    payment = await db.payments.find_one({"id": payment_id, "user_id": user["id"]}, {"_id": 0})
+    if not payment:
+        raise HTTPException(status_code=404, detail="Pagamento não encontrado")
+    
+    update_data = {k: v for k, v in data.model_dump().items() if v is not None}
+    update_data["status"] = payment_status({**payment, **update_data})
+    unset = {}
+    is_source = payment.get("source_payment_id") in (None, payment["id"])
+    if update_data.get("payment_type") == "recorrente" and is_source and not payment.get("next_due_date"):
+        # (Re)inicia a série; parcelas já geradas não se repetem pelo índice único
+        update_data.update(recurrence_fields({**payment, **update_data}))
+    elif update_data.get("payment_type") == "pontual" and payment.get("next_due_date"):
+        # Deixa de ser recorrente: a série para (as parcelas já geradas ficam)
+        unset["next_due_date"] = ""
+    # O documento anterior vem da própria escrita, para o rollup descontar exatamente o que estava gravado
+    previous = await db.payments.find_one_and_update(
+        {"id": payment_id}, {"$set": update_data, **({"$unset": unset} if unset else {})}, projection={"_id": 0}
+    )
+    if not previous:
+        raise HTTPException(status_code=404, detail="Pagamento não encontrado")
+    updated = {k: v for k, v in {**previous, **update_data}.items() if k not in unset}
+    await update_finance_rollups(removed=previous, added=updated)
+    return updated
+
+@api_router.delete("/payments/{payment_id}")
+async def delete_payment(payment_id: uuid.UUID, user: dict = Depends(get_current_user)):
+    payment = await db.payments.find_one_and_delete({"id": payment_id, "user_id": user["id"]}, {"_id": 0})
+    if not payment:
+        raise HTTPException(status_code=404, detail="Pagamento não encontrado")
+    await adjust_usage(user["id"], "payments", -1)
+    await update_finance_rollups(removed=payment)
+    return {"message": "Pagamento excluído com sucesso"}
+
+# ============ RECURRING PAYMENTS ============
+
+# Um pagamento "recorrente" criado pelo usuário é a origem da série: guarda o dia
+# de vencimento (`recurrence_day`) e a próxima data a gerar (`next_due_date`). O job
+# `recurring_payments` cria a parcela de cada mês RECURRING_LEAD_DAYS antes do
+# vencimento e avança `next_due_date`. O índice único (source_payment_id, period)
+# torna a geração idempotente: repetir um lote não duplica parcelas.
+
+RECURRING_LEAD_DAYS = 30
+RECURRING_BATCH_SIZE = 1000
+RECURRING_COPY_FIELDS = ["client_id", "client_name", "description", "amount", "user_id"]
+
+async def insert_many_new(collection, docs: list) -> list:
+    """insert_many que ignora documentos barrados por um índice único; devolve os inseridos"""
+    if not docs:
+        return []
+    try:
+        await collection.insert_many(docs, ordered=False)
+    except BulkWriteError as exc:
+        errors = exc.details.get("writeErrors", [])
+        if any(error["code"] != 11000 for error in errors):
+            raise
+        duplicates = {error["index"] for error in errors}
+        return [doc for i, doc in enumerate(docs) if i not in duplicates]
+    return docs
+
+def count_by_user(docs: list) -> dict:
+    counts = {}
+    for doc in docs:
+        counts[doc["user_id"]] = counts.get(doc["user_id"], 0) + 1
+    return counts
+
+def month_due_date(year: int, month: int, day: int) -> datetime:
+    """Vencimento no dia `day` do mês, limitado ao último dia (31 -> 28/29/30)"""
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    next_month = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    return datetime(year, month, min(day, (next_month - timedelta(days=1)).day), tzinfo=timezone.utc)
+
+def next_recurrence(due_date: datetime, day: int, not_before: Optional[datetime] = None) -> datetime:
+    """Primeiro vencimento da série depois de `due_date` e não antes de `not_before`"""
+    due_date = to_datetime(due_date)
+    following = month_due_date(due_date.year, due_date.month + 1, day)
+    if not_before and following < not_before:
+        following = month_due_date(not_before.year, not_before.month, day)
+        if following < not_before:
+            following = month_due_date(not_before.year, not_before.month + 1, day)
+    return following
+
+def recurrence_fields(payment: dict) -> dict:
+    """Campos que tornam `payment` a origem de uma série mensal.
+
+    A série continua a partir do mês corrente: uma origem com vencimento antigo
+    não gera parcelas retroativas para os meses que já passaram.
+    """
+    due_date = to_datetime(payment["due_date"])
+    month_start = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return {
+        "source_payment_id": payment["id"],
+        "period": rollup_month(due_date),
+        "recurrence_day": due_date.day,
+        "next_due_date": next_recurrence(due_date, due_date.day, month_start)
+    }
+
+async def generate_recurring_payments(lease: Optional["Lease"] = None, batch_size: int = RECURRING_BATCH_SIZE) -> dict:
+    """Gera as parcelas vencendo até hoje + RECURRING_LEAD_DAYS para todas as séries.
+
+    Cada lote: uma leitura pelo índice de `next_due_date`, um insert_many, um
+    bulk_write nos rollups, um em `tenant_usage` e um avançando as origens.
+    Seguro para rodar de novo após uma falha em qualquer ponto.
+    """
+    horizon = datetime.now(timezone.utc) + timedelta(days=RECURRING_LEAD_DAYS)
+    projection = {field: 1 for field in RECURRING_COPY_FIELDS + ["id", "next_due_date", "recurrence_day"]}
+    generated = skipped = 0
+    while True:
+        sources = await db.payments.find({"next_due_date": {"$lte": horizon}}, projection) \
+            .sort("next_due_date", 1).limit(batch_size).to_list(batch_size)
+        if not sources:
+            break
+
+        now = datetime.now(timezone.utc)
+        instances = []
+        for source in sources:
+            due_date = to_datetime(source["next_due_date"])
+            instance = {
+                "id": uuid.uuid4(),
+                **{field: source.get(field) for field in RECURRING_COPY_FIELDS},
+                "payment_type": "recorrente",
+                "due_date": due_date,
+                "paid": False,
+                "source_payment_id": source["id"],
+                "period": rollup_month(due_date),
+                "created_at": now
+            }
+            instance["status"] = payment_status(instance)
+            instances.append(instance)
+
+        inserted = await insert_many_new(db.payments, instances)
+        await inc_finance_rollups(rollup_deltas((instance, 1) for instance in inserted))
+        await adjust_usage_many("payments", count_by_user(inserted))
+        # Só avança quem ainda está na data lida (a origem pode ter sido editada no meio)
+        await db.payments.bulk_write([
+            UpdateOne(
+                {"_id": source["_id"], "next_due_date": source["next_due_date"]},
+                {"$set": {"next_due_date": next_recurrence(
+                    source["next_due_date"], source.get("recurrence_day") or to_datetime(source["next_due_date"]).day
+                )}}
+            )
+            for source in sources
+        ], ordered=False)
+
+        generated += len(inserted)
+        skipped += len(instances) - len(inserted)
+        if lease:
+            await lease.renew()
+    if generated:
+        logger.info("Pagamentos recorrentes gerados: %d", generated)
+    return {"generated": generated, "skipped": skipped}
+
+async def enroll_recurring_payments(lease: "Lease") -> None:
+    """Migração: a última parcela de cada série lançada à mão (cliente + descrição) vira a origem"""
+    pipeline = [
+        {"$match": {"payment_type": "recorrente", "source_payment_id": {"$exists": False}}},
+        {"$sort": {"due_date": 1}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "client_id": "$client_id", "description": "$description"},
+            "_doc": {"$last": "$_id"}, "id": {"$last": "$id"}, "due_date": {"$last": "$due_date"}
+        }}
+    ]
+    requests = []
+    async for series in db.payments.aggregate(pipeline, allowDiskUse=True):
+        requests.append(UpdateOne(
+            {"_id": series["_doc"], "source_payment_id": {"$exists": False}},
+            {"$set": recurrence_fields(series)}
+        ))
+        if len(requests) >= RECURRING_BATCH_SIZE:
+            await db.payments.bulk_write(requests, ordered=False)
+            requests = []
+            await lease.renew()
+    if requests:
+        await db.payments.bulk_write(requests, ordered=False)
+
+# ============ TASK TEMPLATES ============
+
+# Cada usuário tem modelos de tarefa com uma regra de recorrência (semanal ou mensal).
+# Clientes ativos (plano diferente de "unico") guardam em `tasks_horizon` até onde
+# suas tarefas já foram geradas; o job `task_templates` só visita quem está a menos
+# de TASK_REFILL_DAYS do fim e gera até hoje + TASK_WINDOW_DAYS. O índice único
+# (client_id, template_id, period) torna a geração idempotente.
+
+TASK_WINDOW_DAYS = 30
+TASK_REFILL_DAYS = 15
+TASK_BATCH_SIZE = 500
+
+# Substituem as seis tarefas fixas que a conversão de lead criava (uma a cada 5 dias)
+DEFAULT_TASK_TEMPLATES = [
+    ("Postagem 1 do mês", 5),
+    ("Postagem 2 do mês", 10),
+    ("Postagem 3 do mês", 15),
+    ("Postagem 4 do mês", 20),
+    ("Análise mensal", 25),
+    ("Pedido de avaliação mensal", 30),
+]
+
+def default_task_templates(user_id: uuid.UUID) -> List[dict]:
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "id": uuid.uuid4(), "title": title, "description": None, "task_type": "recorrente",
+            "frequency": "monthly", "interval": 1, "day": day, "active": True,
+            "user_id": user_id, "created_at": now, "updated_at": now
+        }
+        for title, day in DEFAULT_TASK_TEMPLATES
+    ]
+
+def validate_template_rule(template: dict):
+    if template["frequency"] not in TEMPLATE_FREQUENCIES:
+        raise HTTPException(status_code=400, detail="Frequência inválida (use weekly ou monthly)")
+    if template["frequency"] == "weekly" and template["day"] > 6:
+        raise HTTPException(status_code=400, detail="Dia da semana inválido (0 = segunda ... 6 = domingo)")
+    if template["frequency"] == "monthly" and template["day"] < 1:
+        raise HTTPException(status_code=400, detail="Dia do mês inválido (1 a 31)")
+
+def template_occurrences(template: dict, start: datetime, end: datetime) -> List[datetime]:
+    """Datas (meia-noite UTC) da regra do modelo no intervalo (start, end]"""
+    anchor = to_datetime(template["created_at"])
+    interval, day = template.get("interval", 1), template["day"]
+    dates = []
+    if template["frequency"] == "weekly":
+        anchor_monday = anchor.date() - timedelta(days=anchor.weekday())
+        current = start.date() + timedelta(days=(day - start.weekday()) % 7)
+        while current <= end.date():
+            if (current - anchor_monday).days // 7 % interval == 0:
+                dates.append(datetime.combine(current, datetime.min.time(), tzinfo=timezone.utc))
+            current += timedelta(days=7)
+    else:
+        index = start.year * 12 + start.month - 1
+        while index <= end.year * 12 + end.month - 1:
+            if (index - (anchor.year * 12 + anchor.month - 1)) % interval == 0:
+                dates.append(month_due_date(index // 12, index % 12 + 1, day))
+            index += 1
+    return [date for date in dates if start < date <= end]
+
+def template_tasks(template: dict, client: dict, start: datetime, end: datetime, now: datetime) -> List[dict]:
+    """Tarefas do modelo para o cliente com vencimento em (start, end]"""
+    description = template.get("description") or f"Tarefa recorrente para {client['name']}"
+    keys = search_keys("tasks", {"title": template["title"], "description": description})
+    return [
+        {
+            "id": uuid.uuid4(),
+            "title": template["title"],
+            "description": description,
+            "task_type": template.get("task_type", "recorrente"),
+            "due_date": due_date,
+            "completed": False,
+            "client_id": client["id"],
+            "client_name": client["name"],
+            "lead_id": None,
+            "lead_name": None,
+            "user_id": client["user_id"],
+            "template_id": template["id"],
+            "period": due_date.date().isoformat(),
+            "search_keys": keys,
+            "created_at": now
+        }
+        for due_date in template_occurrences(template, start, end)
+    ]
+
+async def generate_template_tasks(lease: Optional["Lease"] = None, query: Optional[dict] = None,
+                                  batch_size: int = TASK_BATCH_SIZE) -> dict:
+    """Gera as tarefas dos modelos para os clientes cujo horizonte está acabando.
+
+    `query` restringe os clientes (ex.: um cliente recém-criado). Por lote: uma
+    leitura de clientes pelo índice de `tasks_horizon`, uma dos modelos dos
+    tenants do lote, um insert_many e um bulk_write avançando os horizontes.
+    """
+    now = datetime.now(timezone.utc)
+    refill = now + timedelta(days=TASK_REFILL_DAYS)
+    new_horizon = now + timedelta(days=TASK_WINDOW_DAYS)
+    filters = {**(query or {}), "tasks_horizon": {"$lte": refill}, "plan": {"$ne": "unico"}}
+    projection = {"_id": 1, "id": 1, "name": 1, "user_id": 1, "tasks_horizon": 1}
+    generated = skipped = 0
+    while True:
+        clients = await db.clients.find(filters, projection).sort("tasks_horizon", 1) \
+            .limit(batch_size).to_list(batch_size)
+        if not clients:
+            break
+
+        templates = {}
+        user_ids = list({client["user_id"] for client in clients})
+        async for template in db.task_templates.find({"user_id": {"$in": user_ids}, "active": True}, {"_id": 0}):
+            templates.setdefault(template["user_id"], []).append(template)
+
+        tasks = []
+        for client in clients:
+            # Nunca gera para trás: um cliente parado (ou reativado) recomeça de agora
+            start = max(to_datetime(client["tasks_horizon"]), now)
+            for template in templates.get(client["user_id"], []):
+                tasks.extend(template_tasks(template, client, start, new_horizon, now))
+
+        inserted = await insert_many_new(db.tasks, tasks)
+        await db.clients.bulk_write([
+            UpdateOne(
+                {"_id": client["_id"], "tasks_horizon": client["tasks_horizon"]},
+                {"$set": {"tasks_horizon": new_horizon}}
+            )
+            for client in clients
+        ], ordered=False)
+
+        generated += len(inserted)
+        skipped += len(tasks) - len(inserted)
+        if lease:
+            await lease.renew()
+    if generated and query is None:
+        logger.info("Tarefas geradas a partir de modelos: %d", generated)
+    return {"generated": generated, "skipped": skipped}
+
+async def regenerate_template(user_id: uuid.UUID, template_id: uuid.UUID, template: Optional[dict] = None):
+    """Após criar/editar/apagar um modelo: troca as tarefas em aberto dele que vencem depois
+    de agora pelas da regra atual (`template`; None = apagado).
+
+    Só este modelo e só até o `tasks_horizon` de cada cliente, que não muda: dali em
+    diante o job periódico continua. Exclusão e geração usam o mesmo limite (agora),
+    como generate_template_tasks, então nenhuma ocorrência some sem ser recriada.
+    """
+    now = datetime.now(timezone.utc)
+    await db.tasks.delete_many({
+        "user_id": user_id, "template_id": template_id, "completed": False, "due_date": {"$gt": now}
+    })
+    if not template or not template.get("active", True):
+        return
+
+    clients = db.clients.find(
+        {"user_id": user_id, "plan": {"$ne": "unico"}, "tasks_horizon": {"$gt": now}},
+        {"_id": 0, "id": 1, "name": 1, "user_id": 1, "tasks_horizon": 1}
+    )
+    tasks = []
+    async for client in clients:
+        tasks.extend(template_tasks(template, client, now, to_datetime(client["tasks_horizon"]), now))
+        if len(tasks) >= TASK_BATCH_SIZE:
+            await insert_many_new(db.tasks, tasks)
+            tasks = []
+    await insert_many_new(db.tasks, tasks)
+
+@api_router.get("/task-templates", response_model=List[TaskTemplateResponse])
+async def get_task_templates(user: dict = Depends(get_current_user)):
+    return await db.task_templates.find({"user_id": user["id"]}, {"_id": 0}).sort("created_at", 1).to_list(200)
+
+@api_router.post("/task-templates", response_model=TaskTemplateResponse)
+async def create_task_template(data: TaskTemplateCreate, user: dict = Depends(get_current_user)):
+    now = datetime.now(timezone.utc)
+    template = {"id": uuid.uuid4(), **data.model_dump(), "user_id": user["id"], "created_at": now, "updated_at": now}
+    validate_template_rule(template)
+    await db.task_templates.insert_one(template)
+    await regenerate_template(user["id"], template["id"], template)
+    return template
+
+@api_router.put("/task-templates/{template_id}", response_model=TaskTemplateResponse)
+async def update_task_template(template_id: uuid.UUID, data: TaskTemplateUpdate, user: dict = Depends(get_current_user)):
+    template = await db.task_templates.find_one({"id": template_id, "user_id": user["id"]}, {"_id": 0})
+    if not template:
+        raise HTTPException(status_code=404, detail="Modelo não encontrado")
+    
+    update_data = {k: v for k, v in data.model_dump().items() if v is not None}
+    update_data["updated_at"] = datetime.now(timezone.utc)
+    template.update(update_data)
+    validate_template_rule(template)
+    await db.task_templates.update_one({"id": template_id}, {"$set": update_data})
+    await regenerate_template(user["id"], template_id, template)
+    return template
+
+@api_router.delete("/task-templates/{template_id}")
+async def delete_task_template(template_id: uuid.UUID, user: dict = Depends(get_current_user)):
+    result = await db.task_templates.delete_one({"id": template_id, "user_id": user["id"]})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Modelo não encontrado")
+    await regenerate_template(user["id"], template_id)
+    return {"message": "Modelo excluído com sucesso"}
+
+async def seed_default_task_templates(lease: "Lease") -> None:
+    """Migração: modelos padrão para quem ainda não tem nenhum"""
+    with_templates = set(await db.task_templates.distinct("user_id"))
+    templates = []
+    async for user in db.users.find({}, {"id": 1}):
+        if user["id"] not in with_templates:
+            templates.extend(default_task_templates(user["id"]))
+        if len(templates) >= TASK_BATCH_SIZE:
+            await db.task_templates.insert_many(templates)
+            templates = []
+            await lease.renew()
+    if templates:
+        await db.task_templates.insert_many(templates)
+
+# ============ OVERDUE SWEEPER ============
+
+# O status "overdue" é gravado por este job (e na escrita do pagamento), então as
+# leituras só filtram por `status`/`plan_status`. Cada lote: uma leitura pelo índice
+# (status, vencimento), um update_many e uma releitura dos que este lote marcou.
+
+SWEEP_BATCH_SIZE = 1000
+
+def _sweep_marker() -> datetime:
+    # BSON guarda milissegundos: o marcador precisa casar exatamente na releitura
+    now = datetime.now(timezone.utc)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+async def sweep_overdue_payments(today: datetime, lease: Optional["Lease"] = None,
+                                 batch_size: int = SWEEP_BATCH_SIZE) -> dict:
+    """pending -> overdue para pagamentos vencidos; devolve {user_id: (quantidade, valor)}"""
+    query = {"status": "pending", "due_date": {"$lt": today}}
+    swept = {}
+    while True:
+        ids = [doc["_id"] for doc in await db.payments.find(query, {"_id": 1}).limit(batch_size).to_list(batch_size)]
+        if not ids:
+            break
+        marker = _sweep_marker()
+        await db.payments.update_many(
+            {"_id": {"$in": ids}, **query}, {"$set": {"status": "overdue", "overdue_at": marker}}
+        )
+        # Só os que este lote marcou: um pagamento quitado no meio do lote fica de fora
+        flipped = await db.payments.find(
+            {"_id": {"$in": ids}, "overdue_at": marker}, {"user_id": 1, "due_date": 1, "amount": 1}
+        ).to_list(None)
+        await inc_finance_rollups(rollup_deltas(
+            [({**payment, "status": "pending"}, -1) for payment in flipped] +
+            [({**payment, "status": "overdue"}, 1) for payment in flipped]
+        ))
+        for payment in flipped:
+            count, amount = swept.get(payment["user_id"], (0, 0))
+            swept[payment["user_id"]] = (count + 1, amount + payment["amount"])
+        if lease:
+            await lease.renew()
+    return swept
+
+async def sweep_overdue_subscriptions(today: datetime, lease: Optional["Lease"] = None,
+                                      batch_size: int = SWEEP_BATCH_SIZE) -> int:
+    """plan_status active -> overdue quando plan_expires_at passou, com um audit log por usuário"""
+    query = {"plan_status": "active", "plan_expires_at": {"$lt": today}}
+    total = 0
+    while True:
+        ids = [doc["_id"] for doc in await db.users.find(query, {"_id": 1}).limit(batch_size).to_list(batch_size)]
+        if not ids:
+            break
+        marker = _sweep_marker()
+        await db.users.update_many(
+            {"_id": {"$in": ids}, **query},
+            {"$set": {"plan_status": "overdue", "plan_overdue_at": marker, "updated_at": marker}}
+        )
+        flipped = await db.users.find(
+            {"_id": {"$in": ids}, "plan_overdue_at": marker}, {"id": 1, "email": 1, "plan": 1, "plan_expires_at": 1}
+        ).to_list(None)
+        if flipped:
+            await db.audit_logs.insert_many([
+                audit_log_doc(SYSTEM_ACTOR, "plan_overdue", user["id"], user["email"], {
+                    "plan": user.get("plan"), "plan_expires_at": api_date(user["plan_expires_at"])
+                })
+                for user in flipped
+            ])
+        total += len(flipped)
+        if lease:
+            await lease.renew()
+    return total
+
+async def sweep_overdue(lease: Optional["Lease"] = None) -> dict:
+    """Job: marca pagamentos e assinaturas vencidos até ontem (UTC)"""
+    today = datetime.combine(datetime.now(timezone.utc).date(), datetime.min.time(), tzinfo=timezone.utc)
+    payments = await sweep_overdue_payments(today, lease)
+    if payments:
+        # Um registro por tenant e execução (não um por pagamento)
+        emails = {user["id"]: user["email"] async for user in db.users.find(
+            {"id": {"$in": list(payments)}}, {"id": 1, "email": 1}
+        )}
+        await db.audit_logs.insert_many([
+            audit_log_doc(SYSTEM_ACTOR, "payments_overdue", user_id, emails.get(user_id), {
+                "count": count, "amount": round(amount, 2)
+            })
+            for user_id, (count, amount) in payments.items()
+        ])
+    subscriptions = await sweep_overdue_subscriptions(today, lease)
+    return {
+        "payments": sum(count for count, _ in payments.values()),
+        "tenants": len(payments),
+        "subscriptions": subscriptions
+    }
+
+# ============ REMINDERS ============
+
+# Tarefas criadas pelo usuário e follow-ups de leads guardam `remind_at` (dia do
+# vencimento às reminder_hour_utc). O ReminderScheduler do worker que detém o lease
+# "reminders" mantém num heap os lembretes da próxima janela e, na hora, reivindica
+# cada um com um find_one_and_update que troca `remind_at` por `reminder_sent_at`:
+# só uma reivindicação vence, então cada lembrete é entregue uma vez. Tarefas geradas
+# por modelos não têm lembrete.
+
+REMINDER_LEASE = "reminders"
+NOTIFICATION_TTL_DAYS = 7
+REMINDER_FIELDS = ["id", "user_id", "title", "description", "task_type", "due_date",
+                   "client_id", "client_name", "lead_id", "lead_name", "remind_at"]
+
+def reminder_fields(due_date) -> dict:
+    """{"remind_at": ...} para um vencimento futuro; {} se a hora do lembrete já passou"""
+    if not due_date:
+        return {}
+    day = to_datetime(due_date)
+    remind_at = datetime.combine(day.date(), datetime.min.time(), tzinfo=timezone.utc) \
+        + timedelta(hours=app_state().settings.reminder_hour_utc)
+    return {"remind_at": remind_at} if remind_at > datetime.now(timezone.utc) else {}
+
+class LogSink:
+    name = "log"
+
+    async def send(self, reminder: dict):
+        logger.info("Lembrete: %s (tarefa %s, usuário %s)", reminder["title"], reminder["id"], reminder["user_id"])
+
+class NotificationSink:
+    """Grava em `notifications`; o ChangeFeed de cada worker entrega às conexões SSE do usuário"""
+    name = "sse"
+
+    async def send(self, reminder: dict):
+        await db.notifications.insert_one({
+            "id": uuid.uuid4(),
+            "type": "reminder",
+            "user_id": reminder["user_id"],
+            "task_id": reminder["id"],
+            "title": reminder["title"],
+            "message": reminder.get("description"),
+            "due_date": reminder["due_date"],
+            "created_at": datetime.now(timezone.utc)
+        })
+
+class WebhookSink:
+    """POST do lembrete em JSON para REMINDER_WEBHOOK_URL"""
+    name = "webhook"
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+
+    async def send(self, reminder: dict):
+        payload = json.loads(json.dumps({**api_dates(reminder), "event": "task.reminder"}, default=json_default))
+        async with httpx.AsyncClient(timeout=self.timeout) as http:
+            response = await http.post(self.url, json=payload)
+            response.raise_for_status()
+
+def reminder_sinks(settings: Settings) -> list:
+    sinks = []
+    for name in settings.reminder_sinks:
+        name = name.strip()
+        if name == "log":
+            sinks.append(LogSink())
+        elif name == "sse":
+            sinks.append(NotificationSink())
+        elif name == "webhook" and settings.reminder_webhook_url:
+            sinks.append(WebhookSink(settings.reminder_webhook_url))
+        elif name:
+            logger.warning("Destino de lembretes ignorado: %s", name)
+    return sinks
+
+class ReminderScheduler:
+    """Despacha os lembretes na hora, a partir de um heap da próxima janela.
+
+    A cada `refill_seconds` o dono do lease carrega só o trecho novo da janela
+    (remind_at entre o fim da carga anterior e agora + janela) e os lembretes já
+    vencidos que ficaram de fora (criados depois da carga ou de um dono anterior
+    que caiu). Um lembrete novo para daqui a poucos minutos sai, no máximo,
+    `refill_seconds` atrasado.
+    """
+
+    def __init__(self, sinks: list, window_seconds: int = 600, refill_seconds: int = 30):
+        self.sinks = sinks
+        self.window = timedelta(seconds=window_seconds)
+        self.refill_seconds = refill_seconds
+        self.lease = Lease(REMINDER_LEASE)
+        self._heap = []
+        self._scheduled = set()
+        self._loaded_until = None
+
+    async def run(self):
+        while True:
+            try:
+                if await self.lease.acquire():
+                    await self.refill()
+                    await self.dispatch_due()
+                    await asyncio.sleep(self._sleep_seconds())
+                    continue
+                self._reset()
+            except asyncio.CancelledError:
+                raise
+            except (PyMongoError, LeaseLost):
+                logger.exception("Erro no agendador de lembretes")
+                self._reset()
+            await asyncio.sleep(self.refill_seconds)
+
+    def _reset(self):
+        # Sem o lease (ou após um erro) recomeça do zero: o novo dono recarrega a janela
+        self._heap.clear()
+        self._scheduled.clear()
+        self._loaded_until = None
+
+    def _sleep_seconds(self) -> float:
+        if not self._heap:
+            return self.refill_seconds
+        until_next = (self._heap[0][0] - datetime.now(timezone.utc)).total_seconds()
+        return min(max(until_next, 0), self.refill_seconds)
+
+    async def refill(self):
+        now = datetime.now(timezone.utc)
+        horizon = now + self.window
+        ranges = [{"$lte": now}]
+        if self._loaded_until is None:
+            ranges = [{"$lte": horizon}]
+        elif horizon > self._loaded_until:
+            ranges.append({"$gt": self._loaded_until, "$lte": horizon})
+        projection = {field: 1 for field in REMINDER_FIELDS}
+        for remind_range in ranges:
+            async for task in db.tasks.find({"remind_at": remind_range}, projection).sort("remind_at", 1):
+                if task["_id"] not in self._scheduled:
+                    self._scheduled.add(task["_id"])
+                    heapq.heappush(self._heap, (to_datetime(task["remind_at"]), task["_id"], task))
+        self._loaded_until = horizon
+
+    async def dispatch_due(self) -> int:
+        sent = 0
+        while self._heap and self._heap[0][0] <= datetime.now(timezone.utc):
+            remind_at, doc_id, task = heapq.heappop(self._heap)
+            self._scheduled.discard(doc_id)
+            if await self.claim(task):
+                REMINDER_DELAY.observe((datetime.now(timezone.utc) - remind_at).total_seconds())
+                await self.deliver(task)
+                sent += 1
+        if self._heap or sent:
+            await self.lease.renew()
+        return sent
+
+    @staticmethod
+    async def claim(task: dict) -> bool:
+        """Reivindicação atômica: falha se outro worker já enviou ou se a tarefa foi reprogramada"""
+        claimed = await db.tasks.find_one_and_update(
+            {"_id": task["_id"], "remind_at": task["remind_at"], "completed": False},
+            {"$set": {"reminder_sent_at": datetime.now(timezone.utc)}, "$unset": {"remind_at": ""}},
+            projection={"_id": 1}
+        )
+        return claimed is not None
+
+    async def deliver(self, task: dict):
+        reminder = {k: v for k, v in task.items() if k != "_id"}
+        for sink in self.sinks:
+            try:
+                await sink.send(reminder)
+                REMINDERS_SENT.labels(sink=sink.name, result="ok").inc()
+            except Exception:
+                # Sem nova tentativa: o lembrete já foi reivindicado e não sai em dobro
+                logger.exception("Falha ao enviar lembrete %s via %s", task["id"], sink.name)
+                REMINDERS_SENT.labels(sink=sink.name, result="failed").inc()
+
+# ============ LEAD FUNNEL ============
+
+# Cada mudança de estágio (inclusive a criação) vira um evento em `lead_events` e
+# incrementa o documento do usuário em `funnel_stats`:
+#   reached.<estágio>       leads distintos que chegaram ao estágio; no funil, chegar a um
+#                           estágio conta também os anteriores (pular etapas não some com elas)
+#   exits.<estágio>         saídas do estágio
+#   days.<estágio>.<faixa>  histograma dos dias no estágio, por faixa de STAGE_DAY_BUCKETS
+#   won.<YYYY-MM>, lost.<YYYY-MM>  entradas em fechado / perdido no mês
+# GET /analytics/funnel só lê esse documento; o histórico nunca é relido.
+
+FUNNEL_STAGES = [stage for stage in PIPELINE_STAGES if stage != "perdido"]
+STAGE_DAY_BUCKETS = [1, 2, 3, 5, 7, 10, 14, 21, 30, 45, 60, 90, 180, 365]
+LEAD_STAGE_FIELDS = {"_id": 0, "stage": 1, "stages_reached": 1, "stage_changed_at": 1, "created_at": 1}
+
+def stages_reached(stage: str) -> List[str]:
+    if stage in FUNNEL_STAGES:
+        return FUNNEL_STAGES[:FUNNEL_STAGES.index(stage) + 1]
+    return [stage]
+
+async def record_stage_change(user_id, lead_id, before: Optional[dict], to_stage: str, at: datetime):
+    """Grava a transição e atualiza os agregados; `before` é o lead antes da mudança (None na criação)"""
+    event = {"id": uuid.uuid4(), "user_id": user_id, "lead_id": lead_id, "from_stage": None,
+             "to_stage": to_stage, "at": at, "days_in_stage": None}
+    already_reached = []
+    inc = {}
+    if before:
+        already_reached = before.get("stages_reached") or []
+        days = max((at - to_datetime(before.get("stage_changed_at") or before["created_at"])).total_seconds() / 86400, 0)
+        event.update(from_stage=before["stage"], days_in_stage=round(days, 2))
+        inc[f"exits.{before['stage']}"] = 1
+        inc[f"days.{before['stage']}.{bisect.bisect_right(STAGE_DAY_BUCKETS, days)}"] = 1
+    for stage in stages_reached(to_stage):
+        if stage not in already_reached:
+            inc[f"reached.{stage}"] = 1
+    if to_stage == "fechado":
+        inc[f"won.{rollup_month(at)}"] = 1
+    elif to_stage == "perdido":
+        inc[f"lost.{rollup_month(at)}"] = 1
+
+    await db.lead_events.insert_one(event)
+    await db.funnel_stats.update_one(
+        {"user_id": user_id}, {"$inc": inc, "$set": {"updated_at": at}}, upsert=True
+    )
+
+def histogram_median(counts: dict) -> Optional[float]:
+    """Mediana aproximada (interpolação linear dentro da faixa) de um histograma de STAGE_DAY_BUCKETS"""
+    total = sum(counts.values())
+    if not total:
+        return None
+    seen = 0
+    for index in range(len(STAGE_DAY_BUCKETS) + 1):
+        count = counts.get(str(index), 0)
+        if count and seen + count >= total / 2:
+            low = STAGE_DAY_BUCKETS[index - 1] if index else 0
+            if index == len(STAGE_DAY_BUCKETS):
+                return float(low)
+            return round(low + (STAGE_DAY_BUCKETS[index] - low) * (total / 2 - seen) / count, 1)
+        seen += count
+    return None
+
+async def seed_funnel_reached(lease: "Lease") -> None:
+    """Migração: contagens `reached` a partir dos leads existentes (transições antigas não foram registradas)"""
+    pipeline = [
+        {"$unwind": "$stages_reached"},
+        {"$group": {"_id": {"user_id": "$user_id", "stage": "$stages_reached"}, "count": {"$sum": 1}}}
+    ]
+    reached = {}
+    async for row in db.leads.aggregate(pipeline):
+        reached.setdefault(row["_id"]["user_id"], {})[f"reached.{row['_id']['stage']}"] = row["count"]
+    now = datetime.now(timezone.utc)
+    requests = [
+        UpdateOne({"user_id": user_id}, {"$set": {**counts, "updated_at": now}}, upsert=True)
+        for user_id, counts in reached.items()
+    ]
+    for start in range(0, len(requests), TASK_BATCH_SIZE):
+        await db.funnel_stats.bulk_write(requests[start:start + TASK_BATCH_SIZE], ordered=False)
+        await lease.renew()
+
+@api_router.get("/analytics/funnel")
+async def get_funnel_analytics(
+    from_month: Optional[str] = Query(None, alias="from", pattern=MONTH_PATTERN),
+    to_month: Optional[str] = Query(None, alias="to", pattern=MONTH_PATTERN),
+    user: dict = Depends(get_current_user)
+):
+    """Conversão por estágio, mediana de dias em cada estágio e ganhos/perdas por mês (padrão: últimos 12 meses)"""
+    to_month = to_month or datetime.now(timezone.utc).strftime("%Y-%m")
+    from_month = from_month or shift_month(to_month, -11)
+    months = month_range(from_month, to_month)
+    if not months:
+        raise HTTPException(status_code=400, detail="Período inválido")
+    if len(months) > MAX_HISTORY_MONTHS:
+        raise HTTPException(status_code=400, detail=f"Período máximo de {MAX_HISTORY_MONTHS} meses")
+
+    stats = await cached(user["id"], "funnel", lambda: db.funnel_stats.find_one({"user_id": user["id"]})) or {}
+    reached = stats.get("reached", {})
+    stages = []
+    for stage in PIPELINE_STAGES:
+        row = {
+            "stage": stage,
+            "reached": reached.get(stage, 0),
+            "exits": stats.get("exits", {}).get(stage, 0),
+            "median_days": histogram_median(stats.get("days", {}).get(stage, {})),
+            "conversion_rate": None
+        }
+        if stage in FUNNEL_STAGES[:-1] and row["reached"]:
+            next_stage = FUNNEL_STAGES[FUNNEL_STAGES.index(stage) + 1]
+            row["conversion_rate"] = round(reached.get(next_stage, 0) / row["reached"] * 100, 1)
+        stages.append(row)
+
+    history = []
+    for month in months:
+        won = stats.get("won", {}).get(month, 0)
+        lost = stats.get("lost", {}).get(month, 0)
+        history.append({
+            "month": month, "won": won, "lost": lost,
+            "win_rate": round(won / (won + lost) * 100, 1) if won + lost else None
+        })
+    first = reached.get(FUNNEL_STAGES[0], 0)
+    return {
+        "stages": stages,
+        "conversion_rate": round(reached.get("fechado", 0) / first * 100, 1) if first else None,
+        "months": history
+    }
+
+# ============ SEARCH ============
+
+# Leads, clientes e tarefas guardam `search_keys`: trigramas de cada palavra dos campos
+# pesquisáveis mais os prefixos de 1 e 2 letras ("^m", "^ma"), tudo normalizado sem
+# acento e em minúsculas. A busca exige todas as chaves da consulta ($all) pelo índice
+# multikey (user_id, search_keys) e confere/ordena os poucos candidatos em Python.
+
+SEARCH_FIELDS = {
+    "leads": ["name", "company", "email", "phone", "notes"],
+    "clients": ["name", "company", "email", "phone", "notes"],
+    "tasks": ["title", "description"],
+}
+SEARCH_WEIGHTS = {"name": 8, "title": 8, "company": 5, "email": 4, "phone": 4, "notes": 1, "description": 1}
+SEARCH_TYPES = {"leads": "lead", "clients": "client", "tasks": "task"}
+SEARCH_PROJECTIONS = {
+    "leads": {"_id": 0, "id": 1, "name": 1, "company": 1, "email": 1, "phone": 1, "notes": 1, "stage": 1},
+    "clients": {"_id": 0, "id": 1, "name": 1, "company": 1, "email": 1, "phone": 1, "notes": 1},
+    "tasks": {"_id": 0, "id": 1, "title": 1, "description": 1, "due_date": 1, "completed": 1,
+              "client_name": 1, "lead_name": 1},
+}
+MAX_SEARCH_KEYS = 400  # notas longas: campos de maior peso entram primeiro
+SEARCH_CANDIDATES = 200
+
+def search_tokens(value, field: str = "") -> List[str]:
+    """Palavras normalizadas: sem acento, minúsculas, só letras e dígitos; telefone vira só dígitos"""
+    if not value:
+        return []
+    text = unicodedata.normalize("NFKD", str(value)).lower()
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    if field == "phone":
+        digits = re.sub(r"\D", "", text)
+        return [digits] if digits else []
+    return re.findall(r"[a-z0-9]+", text)
+
+def token_keys(token: str) -> List[str]:
+    keys = [f"^{token[:length]}" for length in (1, 2) if len(token) >= length]
+    keys.extend(token[i:i + 3] for i in range(len(token) - 2))
+    return keys
+
+def search_keys(collection: str, doc: dict) -> List[str]:
+    keys = {}
+    for field in sorted(SEARCH_FIELDS[collection], key=lambda name: -SEARCH_WEIGHTS[name]):
+        for token in search_tokens(doc.get(field), field):
+            for key in token_keys(token):
+                keys.setdefault(key, None)
+    return list(keys)[:MAX_SEARCH_KEYS]
+
+def search_update(collection: str, current: dict, update_data: dict) -> dict:
+    """{"search_keys": ...} quando a atualização muda algum campo pesquisável"""
+    if not any(field in update_data for field in SEARCH_FIELDS[collection]):
+        return {}
+    return {"search_keys": search_keys(collection, {**current, **update_data})}
+
+def query_keys(tokens: List[str]) -> List[str]:
+    # Palavra curta só casa como prefixo; a partir de 3 letras, qualquer trecho
+    keys = set()
+    for token in tokens:
+        keys.update([f"^{token}"] if len(token) < 3 else token_keys(token)[2:])
+    return sorted(keys)
+
+def search_score(collection: str, doc: dict, tokens: List[str]) -> int:
+    """0 se alguma palavra da consulta não aparece; senão, soma ponderada (exata > prefixo > trecho)"""
+    fields = {field: search_tokens(doc.get(field), field) for field in SEARCH_FIELDS[collection]}
+    score = 0
+    for token in tokens:
+        best = 0
+        for field, words in fields.items():
+            for word in words:
+                if word == token:
+                    match = 3
+                elif word.startswith(token):
+                    match = 2
+                elif len(token) >= 3 and token in word:
+                    match = 1
+                else:
+                    continue
+                best = max(best, match * SEARCH_WEIGHTS[field])
+        if not best:
+            return 0
+        score += best
+    return score
+
+def search_result(collection: str, doc: dict, score: int) -> dict:
+    result = {"type": SEARCH_TYPES[collection], "id": id_str(doc["id"]), "score": score}
+    if collection == "tasks":
+        result.update(
+            title=doc["title"], subtitle=doc.get("client_name") or doc.get("lead_name"),
+            due_date=api_date(doc.get("due_date")), completed=doc.get("completed", False)
+        )
+    else:
+        result.update(title=doc["name"], subtitle=doc.get("company") or doc.get("email") or doc.get("phone"))
+        if collection == "leads":
+            result["stage"] = doc.get("stage")
+    return result
 
-@api_router.post("/payments", response_model=PaymentResponse)
-async def create_payment(data: PaymentCreate, user: dict = Depends(get_current_user)):
-    client = await db.clients.find_one({"id": data.client_id, "user_id": user["id"]}, {"_id": 0})
-    if not client:
-        raise HTTPException(status_code=404, detail="Cliente não encontrado")
-    
-    payment_id = str(uuid.uuid4())
-    now = datetime.now(timezone.utc).isoformat()
-    
-    payment_doc = {
-        "id": payment_id,
-        "client_id": data.client_id,
-        "client_name": client["name"],
-        "description": data.description,
-        "amount": data.amount,
-        "payment_type": data.payment_type,
-        "due_date": data.due_date,
-        "paid": data.paid,
-        "user_id": user["id"],
-        "created_at": now
-    }
-    await db.payments.insert_one(payment_doc)
-    return payment_doc
+@api_router.get("/search")
+async def search(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=50),
+    user: dict = Depends(get_current_user)
+):
+    """Busca em leads, clientes e tarefas do usuário (nome, empresa, email, telefone, notas; sem acento)"""
+    tokens = list(dict.fromkeys(search_tokens(q)))
+    if not tokens:
+        return {"query": q, "results": []}
+    keys = query_keys(tokens)
 
-@api_router.put("/payments/{payment_id}", response_model=PaymentResponse)
-async def update_payment(payment_id: str, data: PaymentUpdate, user: dict = Depends(get_current_user)):
-    payment = await db.payments.find_one({"id": payment_id, "user_id": user["id"]}, {"_id": 0})
-    if not payment:
-        raise HTTPException(status_code=404, detail="Pagamento não encontrado")
-    
-    update_data = {k: v for k, v in data.model_dump().items() if v is not None}
-    await db.payments.update_one({"id": payment_id}, {"$set": update_data})
-    updated = await db.payments.find_one({"id": payment_id}, {"_id": 0})
-    return updated
+    async def candidates(collection: str) -> list:
+        cursor = db[collection].find(
+            {"user_id": user["id"], "search_keys": {"$all": keys}}, SEARCH_PROJECTIONS[collection]
+        ).limit(SEARCH_CANDIDATES)
+        return [(collection, doc) async for doc in cursor]
 
-@api_router.delete("/payments/{payment_id}")
-async def delete_payment(payment_id: str, user: dict = Depends(get_current_user)):
-    result = await db.payments.delete_one({"id": payment_id, "user_id": user["id"]})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Pagamento não encontrado")
-    return {"message": "Pagamento excluído com sucesso"}
+    found = await asyncio.gather(*(candidates(collection) for collection in SEARCH_FIELDS))
+    scored = []
+    for collection, doc in (row for rows in found for row in rows):
+        score = search_score(collection, doc, tokens)
+        if score:
+            scored.append(search_result(collection, doc, score))
+    scored.sort(key=lambda result: (-result["score"], result["title"].lower()))
+    return {"query": q, "results": scored[:limit]}
 
 # ============ DASHBOARD STATS ============
 
+def count_clients_created_in_month(clients: list, month: int, year: int) -> int:
+    count = 0
+    for client in clients:
+        created_at = client.get("created_at", "")
+        if created_at:
+            client_date = to_datetime(created_at)
+            if client_date.month == month and client_date.year == year:
+                count += 1
+    return count
+
+def summarize_open_tasks(tasks: list, today):
+    """Tarefas vencidas até hoje (total e as 5 primeiras para o card)"""
+    tasks_today = 0
+    tasks_today_list = []
+    
+    for task in tasks:
+        raw_due_date = task.get("due_date")
+        if raw_due_date:
+            due_date = to_datetime(raw_due_date).date()
+            if due_date <= today:
+                tasks_today += 1
+                if len(tasks_today_list) < 5:
+                    tasks_today_list.append({
+                        "id": task["id"],
+                        "title": task["title"],
+                        "type": task.get("task_type", "outro"),
+                        "due_date": api_date(raw_due_date)
+                    })
+    
+    return tasks_today, tasks_today_list
+
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats(user: dict = Depends(get_current_user)):
+    return await cached(
+        user["id"], "dashboard",
+        lambda: coalesce((user["id"], "dashboard"), lambda: compute_dashboard_stats(user))
+    )
+
+async def compute_dashboard_stats(user: dict) -> dict:
     now = datetime.now(timezone.utc)
     today = now.date()
     current_month = now.month
@@ -924,28 +3261,14 @@ async def get_dashboard_stats(user: dict = Depends(get_current_user)):
     monthly_goal = user_settings.get("monthly_goal", 0)
     leads_alert_days = user_settings.get("leads_alert_days", 7)
     
-    # Count leads by stage
-    leads = await db.leads.find({"user_id": user["id"]}, {"_id": 0}).to_list(1000)
-    leads_by_stage = {}
-    total_pipeline_value = 0
+    # Leads por estágio: mesmo $group do kanban
+    stage_totals = await lead_stage_totals(user["id"], now - timedelta(days=leads_alert_days))
+    leads_by_stage = {stage: row["count"] for stage, row in stage_totals.items()}
+    total_pipeline_value = sum(row["value"] for stage, row in stage_totals.items() if stage not in CLOSED_STAGES)
+    stale_leads_count = sum(row["stale"] for row in stage_totals.values())
     
     # Alertas de leads sem contato
     alerts = []
-    stale_leads_count = 0
-    cutoff_date = now - timedelta(days=leads_alert_days)
-    
-    for lead in leads:
-        stage = lead.get("stage", "novo_lead")
-        leads_by_stage[stage] = leads_by_stage.get(stage, 0) + 1
-        if stage not in ["perdido", "fechado"]:
-            total_pipeline_value += lead.get("contract_value", 0)
-            # Verificar leads parados
-            updated_at = lead.get("updated_at", lead.get("created_at", ""))
-            if updated_at:
-                lead_date = datetime.fromisoformat(updated_at.replace("Z", "+00:00"))
-                if lead_date < cutoff_date:
-                    stale_leads_count += 1
-    
     if stale_leads_count > 0:
         alerts.append({
             "type": "warning",
@@ -954,58 +3277,20 @@ async def get_dashboard_stats(user: dict = Depends(get_current_user)):
         })
     
     # Count clients e clientes fechados no mês
-    clients = await db.clients.find({"user_id": user["id"]}, {"_id": 0}).to_list(1000)
+    clients = await db.clients.find({"user_id": user["id"]}, LIST_PROJECTION).to_list(1000)
     clients_count = len(clients)
-    clients_closed_this_month = 0
-    
-    for client in clients:
-        created_at = client.get("created_at", "")
-        if created_at:
-            client_date = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
-            if client_date.month == current_month and client_date.year == current_year:
-                clients_closed_this_month += 1
+    clients_closed_this_month = count_clients_created_in_month(clients, current_month, current_year)
     
     # Tasks stats
-    tasks = await db.tasks.find({"user_id": user["id"], "completed": False}, {"_id": 0}).to_list(1000)
-    tasks_today = 0
+    tasks = await db.tasks.find({"user_id": user["id"], "completed": False}, LIST_PROJECTION).to_list(1000)
     tasks_pending = len(tasks)
-    tasks_today_list = []
-    
-    for task in tasks:
-        due_date_str = task.get("due_date", "")
-        if due_date_str:
-            due_date = datetime.fromisoformat(due_date_str.replace("Z", "+00:00")).date()
-            if due_date <= today:
-                tasks_today += 1
-                if len(tasks_today_list) < 5:
-                    tasks_today_list.append({
-                        "id": task["id"],
-                        "title": task["title"],
-                        "type": task.get("task_type", "outro"),
-                        "due_date": due_date_str
-                    })
+    tasks_today, tasks_today_list = summarize_open_tasks(tasks, today)
     
-    # Financial stats
-    payments = await db.payments.find({"user_id": user["id"]}, {"_id": 0}).to_list(1000)
-    
-    monthly_revenue = 0
-    pending_revenue = 0
-    overdue_clients = set()
-    
-    for payment in payments:
-        due_date_str = payment.get("due_date", "")
-        if due_date_str:
-            due_date = datetime.fromisoformat(due_date_str.replace("Z", "+00:00"))
-            if due_date.month == current_month and due_date.year == current_year:
-                if payment.get("paid"):
-                    monthly_revenue += payment.get("amount", 0)
-                else:
-                    pending_revenue += payment.get("amount", 0)
-            # Verificar inadimplentes
-            if not payment.get("paid") and due_date.date() < today:
-                client_id = payment.get("client_id")
-                if client_id:
-                    overdue_clients.add(client_id)
+    # Financial stats: rollup do mês e status gravado pelo overdue_sweeper
+    rollup = await db.finance_rollups.find_one({"user_id": user["id"], "month": now.strftime("%Y-%m")}) or {}
+    monthly_revenue = round(rollup.get("paid", 0), 2) or 0
+    pending_revenue = round(rollup.get("pending", 0) + rollup.get("overdue", 0), 2) or 0
+    overdue_clients = await db.payments.distinct("client_id", {"user_id": user["id"], "status": "overdue"})
     
     # Alerta de inadimplentes
     if overdue_clients:
@@ -1028,7 +3313,7 @@ async def get_dashboard_stats(user: dict = Depends(get_current_user)):
     alerts = alerts[:3]
     
     return {
-        "leads_total": len(leads),
+        "leads_total": sum(leads_by_stage.values()),
         "leads_by_stage": leads_by_stage,
         "total_pipeline_value": total_pipeline_value,
         "clients_count": clients_count,
@@ -1049,6 +3334,8 @@ async def get_dashboard_stats(user: dict = Depends(get_current_user)):
 
 # ============ ADMIN ROUTES ============
 
+MAX_SNAPSHOTS = 5 * 366
+
 # Admin Models
 class UserStatusUpdate(BaseModel):
     status: str  # "active" | "blocked"
@@ -1060,7 +3347,7 @@ class UserPlanUpdate(BaseModel):
     plan: str
     plan_value: float
     plan_status: str
-    plan_expires_at: Optional[str] = None
+    plan_expires_at: OptionalDateParam = None
 
 # Check if user is admin
 @api_router.get("/admin/check")
@@ -1076,49 +3363,76 @@ async def check_admin(user: dict = Depends(get_current_user)):
 @api_router.get("/admin/stats")
 async def get_admin_stats(admin: dict = Depends(get_super_admin)):
     """Get global stats for admin dashboard"""
-    # Count users
-    total_users = await db.users.count_documents({})
-    active_users = await db.users.count_documents({"status": "active"})
-    blocked_users = await db.users.count_documents({"status": "blocked"})
-    
-    # Count by plan
-    users_by_plan = {}
+    return await coalesce((admin["id"], "admin_stats"), compute_admin_stats)
+
+async def compute_admin_stats() -> dict:
+    return await platform_totals()
+
+async def platform_totals() -> dict:
+    """Contagens e MRR da plataforma: uma única passada de agregação em `users`"""
+    def is_eq(field, value):
+        return {"$cond": [{"$eq": [f"${field}", value]}, 1, 0]}
+
+    group = {
+        "_id": None,
+        "total_users": {"$sum": 1},
+        # MRR: soma dos planos ativos pagos
+        "mrr": {"$sum": {"$cond": [
+            {"$and": [{"$eq": ["$plan_status", "active"]}, {"$gt": ["$plan_value", 0]}]}, "$plan_value", 0
+        ]}},
+        "overdue_count": {"$sum": is_eq("plan_status", "overdue")},
+    }
+    for name in USER_STATUS:
+        group[f"status_{name}"] = {"$sum": is_eq("status", name)}
     for plan in PLAN_NAMES:
-        count = await db.users.count_documents({"plan": plan})
-        users_by_plan[plan] = count
-    
-    # Count clients and leads (global)
-    total_clients = await db.clients.count_documents({})
-    total_leads = await db.leads.count_documents({})
-    total_tasks = await db.tasks.count_documents({})
-    
-    # MRR calculation (sum of all active recurring plan values)
-    pipeline = [
-        {"$match": {"plan_status": "active", "plan_value": {"$gt": 0}}},
-        {"$group": {"_id": None, "mrr": {"$sum": "$plan_value"}}}
-    ]
-    mrr_result = await db.users.aggregate(pipeline).to_list(1)
-    mrr = mrr_result[0]["mrr"] if mrr_result else 0
-    
-    # Overdue count
-    overdue_count = await db.users.count_documents({"plan_status": "overdue"})
-    
+        group[f"plan_{plan}"] = {"$sum": is_eq("plan", plan)}
+    result = await db.users.aggregate([{"$group": group}]).to_list(1)
+    row = result[0] if result else {}
+
+    users_by_status = {name: row.get(f"status_{name}", 0) for name in USER_STATUS}
     return {
-        "total_users": total_users,
-        "active_users": active_users,
-        "blocked_users": blocked_users,
-        "users_by_plan": users_by_plan,
-        "total_clients": total_clients,
-        "total_leads": total_leads,
-        "total_tasks": total_tasks,
-        "mrr": mrr,
-        "overdue_count": overdue_count
+        "total_users": row.get("total_users", 0),
+        "active_users": users_by_status["active"],
+        "blocked_users": users_by_status["blocked"],
+        "users_by_status": users_by_status,
+        "users_by_plan": {plan: row.get(f"plan_{plan}", 0) for plan in PLAN_NAMES},
+        # Totais pelos metadados da coleção: sem varrer clients/leads/tasks
+        "total_clients": await db.clients.estimated_document_count(),
+        "total_leads": await db.leads.estimated_document_count(),
+        "total_tasks": await db.tasks.estimated_document_count(),
+        "mrr": row.get("mrr", 0),
+        "overdue_count": row.get("overdue_count", 0)
     }
 
+async def take_platform_snapshot(lease: "Lease") -> dict:
+    """Job diário: grava (ou substitui) o snapshot do dia em `platform_snapshots`"""
+    now = datetime.now(timezone.utc)
+    day = datetime.combine(now.date(), datetime.min.time(), tzinfo=timezone.utc)
+    snapshot = {"date": day, **await platform_totals(), "taken_at": now}
+    await db.platform_snapshots.replace_one({"date": day}, snapshot, upsert=True)
+    return {"date": day.date().isoformat()}
+
+@api_router.get("/admin/stats/history")
+async def get_admin_stats_history(
+    admin: dict = Depends(get_super_admin),
+    from_date: Annotated[OptionalDateParam, Query(alias="from")] = None,
+    to_date: Annotated[OptionalDateParam, Query(alias="to")] = None
+):
+    """Daily platform snapshots (users, plans, MRR, totals) between `from` and `to`; default: last 90 days"""
+    to_date = to_date or datetime.now(timezone.utc)
+    from_date = from_date or to_date - timedelta(days=90)
+    snapshots = await db.platform_snapshots.find(
+        {"date": {"$gte": from_date, "$lte": to_date}}, {"_id": 0}
+    ).sort("date", 1).to_list(MAX_SNAPSHOTS)
+    return [{**api_dates(snapshot), "date": api_date(snapshot["date"])} for snapshot in snapshots]
+
 # Recent Events
 @api_router.get("/admin/events")
 async def get_admin_events(admin: dict = Depends(get_super_admin), limit: int = 10):
     """Get recent system events"""
+    return await coalesce((admin["id"], "admin_events", limit), lambda: compute_admin_events(limit))
+
+async def compute_admin_events(limit: int) -> list:
     events = []
     
     # Recent users
@@ -1151,10 +3465,35 @@ async def get_admin_events(admin: dict = Depends(get_super_admin), limit: int =
         })
     
     # Sort all events by timestamp and return top N
-    events.sort(key=lambda x: x["timestamp"], reverse=True)
+    events.sort(key=lambda x: to_datetime(x["timestamp"]), reverse=True)
     return events[:limit]
 
 # List Users (Admin)
+USAGE_COUNTS = {"clients": "clients_count", "leads": "leads_count", "tasks": "tasks_count"}
+
+async def user_usage_stats(user_ids: list) -> dict:
+    """Contagens de clientes/leads/tarefas e total pago de vários usuários: um $group por coleção"""
+    stats = {user_id: {**{field: 0 for field in USAGE_COUNTS.values()}, "payments_total": 0} for user_id in user_ids}
+    if not user_ids:
+        return stats
+
+    async def group_by_user(collection: str, field: str, match: dict, value: dict):
+        pipeline = [
+            {"$match": {"user_id": {"$in": user_ids}, **match}},
+            {"$group": {"_id": "$user_id", "value": value}}
+        ]
+        async for row in db[collection].aggregate(pipeline):
+            stats[row["_id"]][field] = row["value"]
+
+    await asyncio.gather(
+        *(group_by_user(collection, field, {}, {"$sum": 1}) for collection, field in USAGE_COUNTS.items()),
+        # `paid` existe em todos os pagamentos; `status` só depois da migração 0003
+        group_by_user("payments", "payments_total", {"paid": True}, {"$sum": "$amount"})
+    )
+    for row in stats.values():
+        row["payments_total"] = round(row["payments_total"], 2)
+    return stats
+
 @api_router.get("/admin/users")
 async def list_users(
     admin: dict = Depends(get_super_admin),
@@ -1163,9 +3502,10 @@ async def list_users(
     plan: Optional[str] = None,
     role: Optional[str] = None,
     skip: int = 0,
-    limit: int = 50
+    limit: int = 50,
+    include_stats: bool = False
 ):
-    """List all users with filters"""
+    """List all users with filters; `include_stats` adds each user's usage counts and paid total"""
     query = {}
     
     if search:
@@ -1182,39 +3522,31 @@ async def list_users(
     
     users = await db.users.find(query, {"_id": 0, "password": 0}).skip(skip).limit(limit).sort("created_at", -1).to_list(limit)
     total = await db.users.count_documents(query)
+    if include_stats:
+        stats = await user_usage_stats([user["id"] for user in users])
+        for user in users:
+            user["stats"] = stats[user["id"]]
     
     return {"users": users, "total": total, "skip": skip, "limit": limit}
 
 # Get User Details (Admin)
 @api_router.get("/admin/users/{user_id}")
-async def get_user_details(user_id: str, admin: dict = Depends(get_super_admin)):
+async def get_user_details(user_id: uuid.UUID, admin: dict = Depends(get_super_admin)):
     """Get detailed user information"""
+    return await coalesce((admin["id"], "admin_user_details", user_id), lambda: compute_user_details(user_id))
+
+async def compute_user_details(user_id: uuid.UUID) -> dict:
     user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
     if not user:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
     
-    # Get user stats
-    clients_count = await db.clients.count_documents({"user_id": user_id})
-    leads_count = await db.leads.count_documents({"user_id": user_id})
-    tasks_count = await db.tasks.count_documents({"user_id": user_id})
-    
-    # Get payments total
-    payments = await db.payments.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
-    payments_total = sum(p["amount"] for p in payments if p.get("paid"))
-    
-    return {
-        **user,
-        "stats": {
-            "clients_count": clients_count,
-            "leads_count": leads_count,
-            "tasks_count": tasks_count,
-            "payments_total": payments_total
-        }
-    }
+    # Mesma agregação da listagem, para uma página de um usuário
+    stats = await user_usage_stats([user_id])
+    return {**user, "stats": stats[user_id]}
 
 # Update User Status (Block/Unblock)
 @api_router.put("/admin/users/{user_id}/status")
-async def update_user_status(user_id: str, data: UserStatusUpdate, admin: dict = Depends(get_super_admin)):
+async def update_user_status(user_id: uuid.UUID, data: UserStatusUpdate, admin: dict = Depends(get_super_admin)):
     """Block or unblock a user"""
     if data.status not in USER_STATUS:
         raise HTTPException(status_code=400, detail="Status inválido")
@@ -1230,7 +3562,7 @@ async def update_user_status(user_id: str, data: UserStatusUpdate, admin: dict =
     old_status = user.get("status", "active")
     await db.users.update_one(
         {"id": user_id},
-        {"$set": {"status": data.status, "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"status": data.status, "updated_at": datetime.now(timezone.utc)}}
     )
     
     # Audit log
@@ -1251,7 +3583,7 @@ async def update_user_status(user_id: str, data: UserStatusUpdate, admin: dict =
 
 # Update User Role
 @api_router.put("/admin/users/{user_id}/role")
-async def update_user_role(user_id: str, data: UserRoleUpdate, admin: dict = Depends(get_super_admin)):
+async def update_user_role(user_id: uuid.UUID, data: UserRoleUpdate, admin: dict = Depends(get_super_admin)):
     """Change user role"""
     if data.role not in ROLES:
         raise HTTPException(status_code=400, detail="Role inválida")
@@ -1269,7 +3601,7 @@ async def update_user_role(user_id: str, data: UserRoleUpdate, admin: dict = Dep
     old_role = user.get("role", "USER")
     await db.users.update_one(
         {"id": user_id},
-        {"$set": {"role": data.role, "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"role": data.role, "updated_at": datetime.now(timezone.utc)}}
     )
     
     # Audit log
@@ -1279,7 +3611,7 @@ async def update_user_role(user_id: str, data: UserRoleUpdate, admin: dict = Dep
 
 # Update User Plan
 @api_router.put("/admin/users/{user_id}/plan")
-async def update_user_plan(user_id: str, data: UserPlanUpdate, admin: dict = Depends(get_super_admin)):
+async def update_user_plan(user_id: uuid.UUID, data: UserPlanUpdate, admin: dict = Depends(get_super_admin)):
     """Change user subscription plan"""
     if data.plan not in PLAN_NAMES:
         raise HTTPException(status_code=400, detail="Plano inválido")
@@ -1291,7 +3623,7 @@ async def update_user_plan(user_id: str, data: UserPlanUpdate, admin: dict = Dep
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
     
     old_plan = user.get("plan", "free")
-    now = datetime.now(timezone.utc).isoformat()
+    now = datetime.now(timezone.utc)
     
     update_data = {
         "plan": data.plan,
@@ -1318,7 +3650,7 @@ async def update_user_plan(user_id: str, data: UserPlanUpdate, admin: dict = Dep
 
 # Impersonate User
 @api_router.post("/admin/impersonate/{user_id}")
-async def impersonate_user(user_id: str, admin: dict = Depends(get_super_admin)):
+async def impersonate_user(user_id: uuid.UUID, admin: dict = Depends(get_super_admin)):
     """Generate a token to impersonate a user"""
     user = await db.users.find_one({"id": user_id}, {"_id": 0})
     if not user:
@@ -1356,7 +3688,7 @@ async def exit_impersonate(user: dict = Depends(get_current_user)):
     if not original_user_id:
         raise HTTPException(status_code=400, detail="Você não está em modo de impersonação")
     
-    original_user = await db.users.find_one({"id": original_user_id}, {"_id": 0, "password": 0})
+    original_user = await db.users.find_one({"id": uuid.UUID(original_user_id)}, {"_id": 0, "password": 0})
     if not original_user:
         raise HTTPException(status_code=404, detail="Usuário original não encontrado")
     
@@ -1423,14 +3755,14 @@ async def admin_create_user(data: AdminUserCreate, admin: dict = Depends(get_sup
     if data.plan not in PLAN_NAMES:
         raise HTTPException(status_code=400, detail="Plano inválido")
     
-    user_id = str(uuid.uuid4())
-    now = datetime.now(timezone.utc).isoformat()
+    user_id = uuid.uuid4()
+    now = datetime.now(timezone.utc)
     
     user_doc = {
         "id": user_id,
         "name": data.name,
         "email": data.email,
-        "password": hash_password(data.password),
+        "password": await hash_password_async(data.password),
         "role": data.role,
         "status": "active",
         "plan": data.plan,
@@ -1442,6 +3774,7 @@ async def admin_create_user(data: AdminUserCreate, admin: dict = Depends(get_sup
         "updated_at": now
     }
     await db.users.insert_one(user_doc)
+    await db.task_templates.insert_many(default_task_templates(user_id))
     
     # Audit log
     await create_audit_log(admin, "create_user", user_id, data.email, {"role": data.role, "plan": data.plan})
@@ -1450,13 +3783,13 @@ async def admin_create_user(data: AdminUserCreate, admin: dict = Depends(get_sup
 
 # Update User Profile (Admin)
 @api_router.put("/admin/users/{user_id}/profile")
-async def admin_update_user_profile(user_id: str, data: AdminUserUpdate, admin: dict = Depends(get_super_admin)):
+async def admin_update_user_profile(user_id: uuid.UUID, data: AdminUserUpdate, admin: dict = Depends(get_super_admin)):
     """Update user name and email"""
     user = await db.users.find_one({"id": user_id}, {"_id": 0})
     if not user:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
     
-    update_data = {"updated_at": datetime.now(timezone.utc).isoformat()}
+    update_data = {"updated_at": datetime.now(timezone.utc)}
     changes = {}
     
     if data.name:
@@ -1482,7 +3815,7 @@ async def admin_update_user_profile(user_id: str, data: AdminUserUpdate, admin:
 
 # Reset User Password (Admin)
 @api_router.put("/admin/users/{user_id}/password")
-async def admin_reset_user_password(user_id: str, data: AdminPasswordReset, admin: dict = Depends(get_super_admin)):
+async def admin_reset_user_password(user_id: uuid.UUID, data: AdminPasswordReset, admin: dict = Depends(get_super_admin)):
     """Reset user password"""
     user = await db.users.find_one({"id": user_id}, {"_id": 0})
     if not user:
@@ -1494,8 +3827,8 @@ async def admin_reset_user_password(user_id: str, data: AdminPasswordReset, admi
     await db.users.update_one(
         {"id": user_id},
         {"$set": {
-            "password": hash_password(data.new_password),
-            "updated_at": datetime.now(timezone.utc).isoformat()
+            "password": await hash_password_async(data.new_password),
+            "updated_at": datetime.now(timezone.utc)
         }}
     )
     
@@ -1506,7 +3839,7 @@ async def admin_reset_user_password(user_id: str, data: AdminPasswordReset, admi
 
 # Delete User (Admin)
 @api_router.delete("/admin/users/{user_id}")
-async def admin_delete_user(user_id: str, admin: dict = Depends(get_super_admin)):
+async def admin_delete_user(user_id: uuid.UUID, admin: dict = Depends(get_super_admin)):
     """Delete a user and all their data"""
     user = await db.users.find_one({"id": user_id}, {"_id": 0})
     if not user:
@@ -1522,6 +3855,11 @@ async def admin_delete_user(user_id: str, admin: dict = Depends(get_super_admin)
     await db.clients.delete_many({"user_id": user_id})
     await db.tasks.delete_many({"user_id": user_id})
     await db.payments.delete_many({"user_id": user_id})
+    await db.tenant_usage.delete_one({"_id": user_id})
+    await db.finance_rollups.delete_many({"user_id": user_id})
+    await db.task_templates.delete_many({"user_id": user_id})
+    await db.lead_events.delete_many({"user_id": user_id})
+    await db.funnel_stats.delete_one({"user_id": user_id})
     await db.users.delete_one({"id": user_id})
     
     # Audit log
@@ -1529,23 +3867,986 @@ async def admin_delete_user(user_id: str, admin: dict = Depends(get_super_admin)
     
     return {"message": "Usuário e dados excluídos com sucesso"}
 
-# Include router
-app.include_router(api_router)
+# ============ ON-DEMAND PROFILING ============
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+PROFILES_DIR = Path(os.environ.get('PROFILES_DIR', ROOT_DIR / 'profiles'))
+PROFILING_POLL_SECONDS = 2
+
+class ProfilerHook:
+    """Estado do profiler neste worker, sincronizado com `profiling_sessions`.
+
+    Desligado, o custo no request é uma checagem de atributo. Ligado, cada request
+    que casa com a sessão reserva uma vaga com $inc atômico, então o total de
+    requests perfilados é respeitado mesmo com vários workers.
+    """
+
+    def __init__(self):
+        self.armed = False
+        self.route_regex = None
+        self.user_id = None
+        self.busy = False
+
+    async def refresh(self):
+        session = await db.profiling_sessions.find_one({"_id": "current"})
+        now = datetime.now(timezone.utc)
+        if not session or session["remaining"] <= 0 or to_datetime(session["expires_at"]) < now:
+            self.armed = False
+            return
+        self.route_regex = compile_path(session["route"])[0] if session.get("route") else None
+        self.user_id = session.get("user_id")
+        self.armed = True
+
+    async def poll(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Falha ao atualizar sessão de profiling")
+            await asyncio.sleep(PROFILING_POLL_SECONDS)
+
+    def matches(self, scope) -> bool:
+        if self.busy:
+            return False
+        if self.route_regex and not self.route_regex.match(scope["path"]):
+            return False
+        if self.user_id and token_subject(scope) != self.user_id:
+            return False
+        return True
+
+    async def claim(self) -> bool:
+        session = await db.profiling_sessions.find_one_and_update(
+            {"_id": "current", "remaining": {"$gt": 0}},
+            {"$inc": {"remaining": -1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not session or session["remaining"] <= 0:
+            self.armed = False
+        return session is not None
+
+class ProfilingMiddleware:
+    """Perfila com pyinstrument os requests escolhidos pela sessão ativa"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profiler_hook = scope["app"].state.profiler_hook
+        if not profiler_hook.armed or not profiler_hook.matches(scope):
+            await self.app(scope, receive, send)
+            return
+        # Marca antes do await: outro request concorrente não passa mais em matches()
+        profiler_hook.busy = True
+        try:
+            claimed = await profiler_hook.claim()
+        except BaseException:
+            profiler_hook.busy = False
+            raise
+        if not claimed:
+            profiler_hook.busy = False
+            await self.app(scope, receive, send)
+            return
+
+        profiler = Profiler(interval=0.001, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.stop()
+            profiler_hook.busy = False
+            try:
+                await asyncio.to_thread(self._save, profiler, scope)
+            except Exception:
+                logger.exception("Falha ao salvar profile")
+
+    @staticmethod
+    def _save(profiler, scope):
+        PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        slug = re.sub(r"[^\w-]+", "_", scope["path"]).strip("_")[:80]
+        path = PROFILES_DIR / f"{stamp}_{scope['method']}_{slug}.speedscope.json"
+        path.write_text(profiler.output(renderer=SpeedscopeRenderer()), encoding="utf-8")
+
+class ProfilingStart(BaseModel):
+    route: Optional[str] = None  # template da rota, ex: /api/dashboard/stats
+    user_id: OptionalIdParam = None
+    count: int = 5
+    ttl_minutes: int = 30
+
+PROFILE_NAME_RE = re.compile(r"^[\w.-]+\.speedscope\.json$")
+
+@api_router.post("/admin/profiling")
+async def start_profiling(data: ProfilingStart, admin: dict = Depends(get_super_admin)):
+    """Arm the sampling profiler for the next N matching requests"""
+    if not 1 <= data.count <= 50:
+        raise HTTPException(status_code=400, detail="Quantidade deve estar entre 1 e 50")
+    if data.route and not data.route.startswith("/"):
+        raise HTTPException(status_code=400, detail="Rota inválida")
+
+    target_email = ""
+    if data.user_id:
+        target = await db.users.find_one({"id": data.user_id}, {"email": 1})
+        if not target:
+            raise HTTPException(status_code=404, detail="Usuário não encontrado")
+        target_email = target["email"]
+
+    now = datetime.now(timezone.utc)
+    session = {
+        "route": data.route,
+        # Comparado com o `sub` do token, que é string
+        "user_id": id_str(data.user_id),
+        "remaining": data.count,
+        "requested": data.count,
+        "created_by": admin["id"],
+        "created_at": now,
+        "expires_at": now + timedelta(minutes=data.ttl_minutes)
+    }
+    await db.profiling_sessions.replace_one({"_id": "current"}, session, upsert=True)
+    await app_state().profiler_hook.refresh()
+
+    await create_audit_log(admin, "start_profiling", data.user_id, target_email, {
+        "route": data.route, "count": data.count
+    })
+    return {"message": "Profiling ativado", "session": session}
+
+@api_router.delete("/admin/profiling")
+async def stop_profiling(admin: dict = Depends(get_super_admin)):
+    """Disarm the profiler"""
+    await db.profiling_sessions.delete_one({"_id": "current"})
+    await app_state().profiler_hook.refresh()
+    return {"message": "Profiling desativado"}
+
+@api_router.get("/admin/profiling")
+async def get_profiling_status(admin: dict = Depends(get_super_admin)):
+    """Current profiling session and saved profiles"""
+    session = await db.profiling_sessions.find_one({"_id": "current"}, {"_id": 0})
+    profiles = []
+    if PROFILES_DIR.exists():
+        for path in sorted(PROFILES_DIR.glob("*.speedscope.json"), key=lambda p: p.stat().st_mtime, reverse=True):
+            stat = path.stat()
+            profiles.append({
+                "name": path.name,
+                "size": stat.st_size,
+                "created_at": datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat()
+            })
+    return {"session": session, "profiles": profiles}
+
+@api_router.get("/admin/profiling/{name}")
+async def download_profile(name: str, admin: dict = Depends(get_super_admin)):
+    """Download a profile (open it at https://www.speedscope.app)"""
+    path = PROFILES_DIR / name
+    if not PROFILE_NAME_RE.match(name) or not path.is_file():
+        raise HTTPException(status_code=404, detail="Profile não encontrado")
+    return FileResponse(path, media_type="application/json", filename=name)
+
+# ============ METRICS MIDDLEWARE ============
+
+class MetricsMiddleware:
+    """ASGI middleware que mede latência por template de rota (ex: /api/leads/{lead_id})"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal status_code, streaming
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                streaming = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers", [])
+                )
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_FLIGHT.dec()
+            # O FastAPI grava a rota casada no scope; rotas inexistentes viram um único rótulo
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            # SSE fica aberto por minutos/horas: mede à parte para não distorcer os percentis de latência
+            if streaming:
+                SSE_CONNECTION_DURATION.labels(route=route_path).observe(elapsed)
+            else:
+                HTTP_LATENCY.labels(method=method, route=route_path).observe(elapsed)
+            HTTP_REQUESTS.labels(method=method, route=route_path, status=str(status_code)).inc()
+
+class TracingMiddleware:
+    """Ativa o RequestTrace quando pedido pelo header ou pela amostragem"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._should_trace(scope):
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(scope["method"], scope["path"])
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message.setdefault("headers", []).append((b"x-trace-id", trace.id.encode()))
+            await send(message)
+
+        token = current_trace.set(trace)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_trace.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            try:
+                await asyncio.to_thread(trace_exporter.export, trace.to_dict(route, status_code))
+            except Exception:
+                logger.exception("Falha ao exportar trace %s", trace.id)
+
+    @staticmethod
+    def _should_trace(scope) -> bool:
+        for name, value in scope.get("headers", []):
+            if name == TRACE_HEADER:
+                return value == b"1"
+        return TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Mede o atraso do event loop comparando o sleep pedido com o tempo real"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - start - interval, 0)
+        EVENT_LOOP_LAG.set(lag)
+        app_state().event_loop_lag = lag
+
+async def metrics():
+    """Prometheus scrape endpoint"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+# ============ MIGRATIONS ============
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+LEASE_SECONDS = 60
+MIGRATION_LEASE = "schema_migrations"
+MIGRATION_RETRY_SECONDS = LEASE_SECONDS
+MIGRATION_LOG_SECONDS = 10
+
+class LeaseLost(Exception):
+    pass
+
+class Lease:
+    """Lease exclusivo em `leases`: um dono por nome, expira se o dono morrer"""
+
+    def __init__(self, name: str, seconds: int = LEASE_SECONDS):
+        self.name = name
+        self.seconds = seconds
+        self.owner = f"{WORKER_ID}:{uuid.uuid4().hex[:8]}"
+
+    async def acquire(self) -> bool:
+        """Adquire (ou renova) o lease; False se outro worker o detém"""
+        now = datetime.now(timezone.utc)
+        try:
+            await db.leases.update_one(
+                {"_id": self.name, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.seconds)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def renew(self):
+        if not await self.acquire():
+            raise LeaseLost(self.name)
+
+    async def release(self):
+        await db.leases.delete_one({"_id": self.name, "owner": self.owner})
+
+class MigrationStep:
+    """Backfill de uma coleção: `transform(doc)` devolve um UpdateOne (ou None) para cada doc pendente"""
+
+    def __init__(self, collection: str, query: dict, projection: Optional[dict], transform):
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self.transform = transform
+
+class Migration:
+    """`blocking`: aplicada antes do worker servir requests (o código novo não lê o formato antigo).
+    `report`: função async chamada antes e depois, com o resultado salvo no registro.
+    `job`: função async(lease) idempotente executada após os steps (rebuilds que não são por documento)."""
+
+    def __init__(self, id: str, description: str, steps: List[MigrationStep], blocking: bool = False,
+                 report=None, job=None):
+        self.id = id
+        self.description = description
+        self.steps = steps
+        self.blocking = blocking
+        self.report = report
+        self.job = job
+
+class MigrationRunner:
+    """Aplica as migrações pendentes em lotes com bulk_write, com o app no ar.
+
+    O progresso (último _id por coleção) fica em `schema_migrations`, então uma
+    migração interrompida continua de onde parou. Só o dono do lease migra.
+    """
+
+    def __init__(self, batch_size: int = 500, docs_per_second: int = 2000):
+        self.batch_size = batch_size
+        self.docs_per_second = docs_per_second
+        self._last_log = 0.0
+
+    async def pending(self, migrations: Optional[List[Migration]] = None) -> List[Migration]:
+        applied = {doc["_id"] async for doc in db.schema_migrations.find({"status": "applied"}, {"_id": 1})}
+        return [m for m in migrations or MIGRATIONS if m.id not in applied]
+
+    async def run(self, migrations: Optional[List[Migration]] = None) -> Optional[List[str]]:
+        """Aplica as pendentes; None se outro worker detém o lease"""
+        lease = Lease(MIGRATION_LEASE)
+        if not await lease.acquire():
+            return None
+        applied = []
+        try:
+            for migration in await self.pending(migrations):
+                await self._apply(migration, lease)
+                applied.append(migration.id)
+        finally:
+            await lease.release()
+        return applied
+
+    async def _apply(self, migration: Migration, lease: Lease):
+        record = await db.schema_migrations.find_one({"_id": migration.id}) or {}
+        progress = record.get("progress", {})
+        await db.schema_migrations.update_one(
+            {"_id": migration.id},
+            {
+                "$set": {"description": migration.description, "status": "running", "worker": lease.owner},
+                "$setOnInsert": {"started_at": datetime.now(timezone.utc), "progress": {}}
+            },
+            upsert=True
+        )
+        logger.info("Migração %s iniciada", migration.id)
+        if migration.report and "before" not in record.get("report", {}):
+            await db.schema_migrations.update_one(
+                {"_id": migration.id}, {"$set": {"report.before": await migration.report()}}
+            )
+        try:
+            for step in migration.steps:
+                if not progress.get(step.collection, {}).get("done"):
+                    await self._run_step(migration, step, progress.get(step.collection, {}), lease)
+            if migration.job:
+                await migration.job(lease)
+        except Exception as exc:
+            await db.schema_migrations.update_one(
+                {"_id": migration.id}, {"$set": {"status": "failed", "error": repr(exc)}}
+            )
+            raise
+        done = {"status": "applied", "finished_at": datetime.now(timezone.utc)}
+        if migration.report:
+            done["report.after"] = await migration.report()
+        await db.schema_migrations.update_one({"_id": migration.id}, {"$set": done, "$unset": {"error": ""}})
+        logger.info("Migração %s aplicada", migration.id)
+
+    async def _run_step(self, migration: Migration, step: MigrationStep, state: dict, lease: Lease):
+        key = f"progress.{step.collection}"
+        collection = db[step.collection]
+        last_id = state.get("last_id")
+        processed = state.get("processed", 0)
+        modified = state.get("modified", 0)
+        total = processed + await collection.count_documents(
+            step.query if last_id is None else {"$and": [step.query, {"_id": {"$gt": last_id}}]}
+        )
+        await db.schema_migrations.update_one({"_id": migration.id}, {"$set": {f"{key}.total": total}})
+
+        while True:
+            started = time.monotonic()
+            query = step.query if last_id is None else {"$and": [step.query, {"_id": {"$gt": last_id}}]}
+            docs = await collection.find(query, step.projection).sort("_id", 1) \
+                .limit(self.batch_size).to_list(self.batch_size)
+            if not docs:
+                break
+
+            requests = [request for request in map(step.transform, docs) if request is not None]
+            if requests:
+                result = await collection.bulk_write(requests, ordered=False)
+                modified += result.modified_count + result.deleted_count
+            processed += len(docs)
+            last_id = docs[-1]["_id"]
+            await db.schema_migrations.update_one({"_id": migration.id}, {"$set": {
+                f"{key}.last_id": last_id,
+                f"{key}.processed": processed,
+                f"{key}.modified": modified,
+                "updated_at": datetime.now(timezone.utc)
+            }})
+            await lease.renew()
+            self._log_progress(migration, step, processed, total)
+
+            # Limite de vazão: cada lote "custa" len(docs) / docs_per_second segundos
+            await asyncio.sleep(max(len(docs) / self.docs_per_second - (time.monotonic() - started), 0))
+
+        await db.schema_migrations.update_one({"_id": migration.id}, {"$set": {f"{key}.done": True}})
+
+    def _log_progress(self, migration: Migration, step: MigrationStep, processed: int, total: int):
+        now = time.monotonic()
+        if now - self._last_log >= MIGRATION_LOG_SECONDS:
+            self._last_log = now
+            logger.info(
+                "Migração %s: %s %d/%d (%.0f%%)", migration.id, step.collection,
+                processed, total, processed / total * 100 if total else 100
+            )
+
+async def run_pending_migrations(settings: Settings):
+    """Tarefa de fundo: aplica as migrações pendentes; se outro worker migra, espera e confere de novo"""
+    runner = MigrationRunner(settings.migration_batch_size, settings.migration_docs_per_second)
+    while True:
+        try:
+            if not await runner.pending():
+                return
+            await runner.run()
+        except (PyMongoError, LeaseLost):
+            logger.exception("Migração interrompida; será retomada")
+        await asyncio.sleep(MIGRATION_RETRY_SECONDS)
+
+async def apply_blocking_migrations(settings: Settings):
+    """Na subida: aplica as migrações bloqueantes (e as anteriores a elas) antes de servir"""
+    runner = MigrationRunner(settings.migration_batch_size, settings.migration_docs_per_second)
+    while True:
+        pending = await runner.pending()
+        last = max((i for i, m in enumerate(pending) if m.blocking), default=None)
+        if last is None:
+            return
+        if await runner.run(pending[:last + 1]) is None:
+            logger.info("Aguardando outro worker aplicar as migrações bloqueantes")
+            await asyncio.sleep(2)
+
+async def collection_sizes() -> dict:
+    """Tamanho de dados, índices e cache (WiredTiger) por coleção, via collStats.
+
+    data + índices é o working set se tudo for "quente"; `cache_bytes` é o que
+    está de fato na memória do mongod agora.
+    """
+    report = {}
+    for name in ID_FIELDS_BY_COLLECTION:
+        try:
+            stats = await db.command({"collStats": name})
+        except (OperationFailure, NotImplementedError):
+            continue
+        report[name] = {
+            "count": stats.get("count", 0),
+            "avg_obj_size": stats.get("avgObjSize", 0),
+            "data_size": stats.get("size", 0),
+            "storage_size": stats.get("storageSize", 0),
+            "total_index_size": stats.get("totalIndexSize", 0),
+            "index_sizes": stats.get("indexSizes", {}),
+            "cache_bytes": stats.get("wiredTiger", {}).get("cache", {}).get("bytes currently in the cache"),
+        }
+    report["_total"] = {
+        key: sum(c[key] for c in report.values())
+        for key in ("data_size", "storage_size", "total_index_size")
+    }
+    report["_total"]["working_set_estimate"] = report["_total"]["data_size"] + report["_total"]["total_index_size"]
+    return report
+
+# ---- Migrações (em ordem; nunca altere o id de uma já publicada) ----
+
+def bson_dates_step(collection: str, fields: List[str]) -> MigrationStep:
+    """Datas gravadas como string ISO -> datetime BSON (ver DATES)"""
+
+    def transform(doc):
+        # Cada campo só é trocado se ainda tiver a string lida: escritas concorrentes vencem
+        guard, update = {"_id": doc["_id"]}, {}
+        for field in fields:
+            value = doc.get(field)
+            if not isinstance(value, str):
+                continue
+            try:
+                update[field] = to_datetime(value)
+            except ValueError:
+                logger.warning("Data inválida em %s.%s (_id=%s): %r", collection, field, doc["_id"], value)
+                continue
+            guard[field] = value
+        return UpdateOne(guard, {"$set": update}) if update else None
+
+    query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    return MigrationStep(collection, query, {field: 1 for field in fields}, transform)
+
+ID_FIELDS_BY_COLLECTION = {
+    "users": ["id"],
+    "leads": ["id", "user_id"],
+    "clients": ["id", "user_id"],
+    "tasks": ["id", "user_id", "client_id", "lead_id"],
+    "payments": ["id", "user_id", "client_id"],
+    "audit_logs": ["id", "actor_id", "target_id"],
+}
+EMBEDDED_ID_ARRAYS = {"clients": ["checklist", "weekly_tasks"]}
+
+def _as_uuid(value):
+    try:
+        return uuid.UUID(value)
+    except (TypeError, ValueError):
+        return None
+
+def binary_ids_step(collection: str) -> MigrationStep:
+    """ids em string (36 bytes) -> UUID Binary subtype 4 (16 bytes)"""
+    fields = ID_FIELDS_BY_COLLECTION[collection]
+    arrays = EMBEDDED_ID_ARRAYS.get(collection, [])
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize database and create super admin"""
+    def transform(doc):
+        guard, update = {"_id": doc["_id"]}, {}
+        for field in fields:
+            value = doc.get(field)
+            converted = _as_uuid(value) if isinstance(value, str) else None
+            if converted:
+                guard[field], update[field] = value, converted
+        for field in arrays:
+            items = doc.get(field) or []
+            if any(isinstance(item.get("id"), str) for item in items):
+                guard[field] = items
+                update[field] = [
+                    {**item, "id": _as_uuid(item.get("id")) or item.get("id")} if isinstance(item.get("id"), str) else item
+                    for item in items
+                ]
+        return UpdateOne(guard, {"$set": update}) if update else None
+
+    query = {"$or": [{field: {"$type": "string"}} for field in fields] +
+                    [{f"{field}.id": {"$type": "string"}} for field in arrays]}
+    return MigrationStep(collection, query, {field: 1 for field in fields + arrays}, transform)
+
+def drop_string_keyed_usage() -> MigrationStep:
+    # tenant_usage usa o id do usuário como _id; os contadores são recriados sob demanda
+    return MigrationStep(
+        "tenant_usage", {"_id": {"$type": "string"}}, {"_id": 1},
+        lambda doc: DeleteOne({"_id": doc["_id"]})
+    )
+
+def recount_usage_step() -> MigrationStep:
+    # Os contadores antigos incluíam as tarefas dos modelos; recriados sob demanda por init_usage
+    return MigrationStep("tenant_usage", {}, {"_id": 1}, lambda doc: DeleteOne({"_id": doc["_id"]}))
+
+def payment_status_step() -> MigrationStep:
+    """Grava o `status` (base dos rollups financeiros) nos pagamentos antigos"""
+    def transform(doc):
+        return UpdateOne({"_id": doc["_id"], "status": {"$exists": False}}, {"$set": {"status": payment_status(doc)}})
+    return MigrationStep("payments", {"status": {"$exists": False}}, {"paid": 1, "due_date": 1}, transform)
+
+def clients_tasks_horizon_step() -> MigrationStep:
+    # Clientes existentes passam a receber tarefas dos modelos a partir da migração
+    return MigrationStep(
+        "clients", {"tasks_horizon": {"$exists": False}}, {"_id": 1},
+        lambda doc: UpdateOne(
+            {"_id": doc["_id"], "tasks_horizon": {"$exists": False}},
+            {"$set": {"tasks_horizon": datetime.now(timezone.utc)}}
+        )
+    )
+
+def task_reminders_step() -> MigrationStep:
+    # Tarefas abertas com vencimento hoje ou depois ganham lembrete; as de modelos não
+    today = datetime.combine(datetime.now(timezone.utc).date(), datetime.min.time(), tzinfo=timezone.utc)
+    query = {
+        "completed": False, "template_id": None, "due_date": {"$gte": today},
+        "remind_at": {"$exists": False}, "reminder_sent_at": {"$exists": False}
+    }
+
+    def transform(doc):
+        reminder = reminder_fields(doc["due_date"])
+        return UpdateOne({"_id": doc["_id"], **query}, {"$set": reminder}) if reminder else None
+
+    return MigrationStep("tasks", query, {"_id": 1, "due_date": 1}, transform)
+
+def lead_funnel_step() -> MigrationStep:
+    # Sem histórico: o estágio atual conta como alcançado desde a última alteração do lead
+    return MigrationStep(
+        "leads", {"stages_reached": {"$exists": False}}, {"_id": 1, "stage": 1, "created_at": 1, "updated_at": 1},
+        lambda doc: UpdateOne(
+            {"_id": doc["_id"], "stages_reached": {"$exists": False}},
+            {"$set": {
+                "stages_reached": stages_reached(doc.get("stage", "novo_lead")),
+                "stage_changed_at": doc.get("updated_at") or doc["created_at"]
+            }}
+        )
+    )
+
+def search_keys_step(collection: str) -> MigrationStep:
+    projection = {"_id": 1, **{field: 1 for field in SEARCH_FIELDS[collection]}}
+    return MigrationStep(
+        collection, {"search_keys": {"$exists": False}}, projection,
+        lambda doc: UpdateOne(
+            {"_id": doc["_id"], "search_keys": {"$exists": False}},
+            {"$set": {"search_keys": search_keys(collection, doc)}}
+        )
+    )
+
+MIGRATIONS = [
+    Migration(
+        "0001_bson_dates", "Datas em string ISO para datetime BSON",
+        [bson_dates_step(name, fields) for name, fields in DATE_FIELDS_BY_COLLECTION.items()]
+    ),
+    Migration(
+        "0002_binary_uuids", "ids em string para UUID binário (subtype 4)",
+        [binary_ids_step(name) for name in ID_FIELDS_BY_COLLECTION] + [drop_string_keyed_usage()],
+        blocking=True, report=collection_sizes
+    ),
+    # Bloqueante: dashboard e histórico financeiro só leem os rollups, que precisam existir
+    # antes do primeiro request; vem depois da 0001 porque o $dateToString exige datas BSON
+    Migration(
+        "0003_finance_rollups", "Status dos pagamentos e rollups mensais em finance_rollups",
+        [payment_status_step()], blocking=True, job=lambda lease: rebuild_finance_rollups(lease=lease)
+    ),
+    Migration(
+        "0004_recurring_payments", "Séries de pagamentos recorrentes lançados à mão",
+        [], job=enroll_recurring_payments
+    ),
+    Migration(
+        "0005_task_templates", "Modelos de tarefa padrão e horizonte de geração dos clientes",
+        [clients_tasks_horizon_step()], job=seed_default_task_templates
+    ),
+    Migration(
+        "0006_task_reminders", "Lembretes (remind_at) das tarefas abertas com vencimento futuro",
+        [task_reminders_step()]
+    ),
+    Migration(
+        "0007_lead_funnel", "Estágios alcançados dos leads e contagens iniciais do funil",
+        [lead_funnel_step()], job=seed_funnel_reached
+    ),
+    Migration(
+        "0008_search_keys", "Chaves de busca (trigramas sem acento) de leads, clientes e tarefas",
+        [search_keys_step(collection) for collection in SEARCH_FIELDS]
+    ),
+    Migration(
+        "0009_template_tasks_quota", "Contadores de cota recontados sem as tarefas geradas pelos modelos",
+        [recount_usage_step()]
+    ),
+]
+
+async def migration_status() -> List[dict]:
+    """Estado de cada migração registrada, com % por coleção (para a API e o CLI)"""
+    records = {doc.pop("_id"): doc async for doc in db.schema_migrations.find({})}
+    status = []
+    for migration in MIGRATIONS:
+        record = records.get(migration.id, {})
+        progress = {}
+        for name, state in record.get("progress", {}).items():
+            total, processed = state.get("total", 0), state.get("processed", 0)
+            progress[name] = {
+                "processed": processed,
+                "modified": state.get("modified", 0),
+                "total": total,
+                "percent": 100.0 if state.get("done") else round(processed / total * 100, 1) if total else 0.0
+            }
+        status.append({
+            **record,
+            "id": migration.id,
+            "description": migration.description,
+            "status": record.get("status", "pending"),
+            "progress": progress
+        })
+    return status
+
+@api_router.get("/admin/migrations")
+async def get_migrations(admin: dict = Depends(get_super_admin)):
+    """Applied, running and pending schema migrations with their progress"""
+    return await migration_status()
+
+# ============ PERIODIC JOBS ============
+
+JOB_POLL_SECONDS = 30
+JOB_RETRY_SECONDS = 300
+
+class PeriodicJob:
+    """Job executado a cada `interval`, alinhado ao relógio UTC (1 dia = à meia-noite).
+
+    `fn(lease)` roda em um único worker por vez; quem detém o lease deve
+    renová-lo em execuções longas. O agendamento fica em `job_runs`, então
+    restarts e deploys não repetem nem perdem execuções.
+    """
+
+    def __init__(self, name: str, interval: timedelta, fn):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+
+    def next_run(self, after: datetime) -> datetime:
+        step = self.interval.total_seconds()
+        return datetime.fromtimestamp((after.timestamp() // step + 1) * step, timezone.utc)
+
+async def _job_due(job: PeriodicJob, now: datetime) -> bool:
+    state = await db.job_runs.find_one({"_id": job.name}, {"next_run_at": 1})
+    return state is None or to_datetime(state["next_run_at"]) <= now
+
+async def run_job(job: PeriodicJob, now: Optional[datetime] = None) -> bool:
+    """Executa o job se estiver vencido e o lease estiver livre; True se executou"""
+    now = now or datetime.now(timezone.utc)
+    if not await _job_due(job, now):
+        return False
+    lease = Lease(f"job:{job.name}")
+    if not await lease.acquire():
+        return False
+    try:
+        # Outro worker pode ter concluído a execução entre a leitura e o lease
+        if not await _job_due(job, now):
+            return False
+        started = time.monotonic()
+        try:
+            result = await job.fn(lease)
+        except Exception as exc:
+            logger.exception("Job %s falhou", job.name)
+            JOB_RUNS.labels(job=job.name, result="failed").inc()
+            update = {
+                "status": "failed", "error": repr(exc), "last_run_at": now,
+                "next_run_at": now + timedelta(seconds=JOB_RETRY_SECONDS)
+            }
+            await db.job_runs.update_one({"_id": job.name}, {"$set": update}, upsert=True)
+            return True
+        elapsed = time.monotonic() - started
+        JOB_RUNS.labels(job=job.name, result="ok").inc()
+        JOB_DURATION.labels(job=job.name).observe(elapsed)
+        await db.job_runs.update_one({"_id": job.name}, {
+            "$set": {
+                "status": "ok", "last_run_at": now, "next_run_at": job.next_run(now),
+                "duration_s": round(elapsed, 3), "result": result
+            },
+            "$unset": {"error": ""}
+        }, upsert=True)
+        return True
+    finally:
+        await lease.release()
+
+async def run_periodic_jobs(jobs: Optional[List[PeriodicJob]] = None):
+    """Tarefa de fundo de cada worker: verifica os jobs vencidos a cada ~JOB_POLL_SECONDS"""
+    while True:
+        for job in jobs or JOBS:
+            try:
+                await run_job(job)
+            except PyMongoError:
+                logger.exception("Erro ao agendar o job %s", job.name)
+        await asyncio.sleep(JOB_POLL_SECONDS * random.uniform(0.5, 1.5))
+
+JOBS = [
+    PeriodicJob("platform_snapshot", timedelta(days=1), take_platform_snapshot),
+    PeriodicJob("recurring_payments", timedelta(hours=1), generate_recurring_payments),
+    PeriodicJob("task_templates", timedelta(hours=1), generate_template_tasks),
+    PeriodicJob("overdue_sweeper", timedelta(hours=1), sweep_overdue),
+]
+
+@api_router.get("/admin/jobs")
+async def get_jobs(admin: dict = Depends(get_super_admin)):
+    """Periodic jobs with their last and next run"""
+    runs = {doc.pop("_id"): doc async for doc in db.job_runs.find({})}
+    return [
+        {"name": job.name, "interval_s": job.interval.total_seconds(), "status": "pending",
+         **api_dates(runs.get(job.name, {}))}
+        for job in JOBS
+    ]
+
+# ============ APP FACTORY ============
+
+class AppStateMiddleware:
+    """Expõe os recursos do app (db, executor, ...) via contexto durante o request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        token = current_app_state.set(scope["app"].state)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_app_state.reset(token)
+
+class CacheInvalidationMiddleware:
+    """Escritas invalidam o cache do próprio tenant neste worker antes da resposta sair.
+
+    Os demais workers são avisados pelo change stream.
+    """
+
+    WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in self.WRITE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        tenant_id = token_subject(scope)
+        cache = scope["app"].state.cache
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and tenant_id:
+                cache.evict(tenant_id, "local")
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+async def ensure_indexes():
+    """Índices exigidos pelo app (create_index é idempotente)"""
+    await db.rate_limits.create_index("expires_at", expireAfterSeconds=0)
+    await db.users.create_index("id", unique=True)
+    for name in ["leads", "clients", "tasks", "payments"]:
+        await db[name].create_index("id", unique=True)
+        await db[name].create_index("user_id")
+    await db.finance_rollups.create_index([("user_id", 1), ("month", 1)], unique=True)
+    await db.platform_snapshots.create_index("date", unique=True)
+    await db.payments.create_index(
+        [("source_payment_id", 1), ("period", 1)], unique=True,
+        partialFilterExpression={"source_payment_id": {"$exists": True}}
+    )
+    await db.payments.create_index("next_due_date", partialFilterExpression={"next_due_date": {"$exists": True}})
+    await db.task_templates.create_index("user_id")
+    await db.tasks.create_index(
+        [("client_id", 1), ("template_id", 1), ("period", 1)], unique=True,
+        partialFilterExpression={"template_id": {"$exists": True}}
+    )
+    await db.clients.create_index("tasks_horizon")
+    await db.payments.create_index([("status", 1), ("due_date", 1)])
+    await db.payments.create_index([("user_id", 1), ("status", 1)])
+    await db.users.create_index([("plan_status", 1), ("plan_expires_at", 1)])
+    await db.leads.create_index([("user_id", 1), ("stage", 1), ("updated_at", -1), ("id", -1)])
+    await db.lead_events.create_index([("lead_id", 1), ("at", 1)])
+    await db.lead_events.create_index([("user_id", 1), ("at", 1)])
+    await db.funnel_stats.create_index("user_id", unique=True)
+    for name in SEARCH_FIELDS:
+        await db[name].create_index([("user_id", 1), ("search_keys", 1)])
+    await db.tasks.create_index([("user_id", 1), ("due_date", 1)])
+    await db.tasks.create_index([("user_id", 1), ("client_id", 1), ("due_date", 1)])
+    await db.tasks.create_index([("user_id", 1), ("lead_id", 1), ("due_date", 1)])
+    await db.tasks.create_index("remind_at", partialFilterExpression={"remind_at": {"$exists": True}})
+    await db.notifications.create_index("created_at", expireAfterSeconds=NOTIFICATION_TTL_DAYS * 86400)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Cria os recursos do worker na subida e os libera ao encerrar"""
+    settings = app.state.settings
+    # Criado aqui (e não no import) para que cada worker, inclusive com preload, tenha seu pool
+    app.state.mongo = AsyncIOMotorClient(
+        settings.mongo_url,
+        event_listeners=[PoolMetricsListener(), TraceCommandListener()],
+        tz_aware=True,
+        uuidRepresentation="standard",
+        **settings.mongo_client_options()
+    )
+    app.state.db = app.state.mongo[settings.db_name]
+    app.state.bcrypt_executor = ThreadPoolExecutor(max_workers=settings.bcrypt_workers, thread_name_prefix="bcrypt")
+    app.state.bcrypt_pending = 0
+    app.state.event_loop_lag = 0.0
+    app.state.login_throttle = LoginThrottle(settings)
+    app.state.request_buckets = {}
+    app.state.profiler_hook = ProfilerHook()
+    app.state.cache = TenantCache(settings.cache_ttl_seconds, settings.cache_max_tenants)
+    app.state.live_hub = LiveHub()
+    app.state.singleflight = SingleFlight()
+    app.state.background_tasks = []
+    current_app_state.set(app.state)
+
+    await ensure_indexes()
+    await apply_blocking_migrations(settings)
     await init_super_admin()
+    if settings.run_background_jobs:
+        app.state.background_tasks.append(asyncio.create_task(monitor_event_loop_lag()))
+        app.state.background_tasks.append(asyncio.create_task(app.state.profiler_hook.poll()))
+        change_feed = ChangeFeed(app.state.cache, app.state.live_hub)
+        app.state.background_tasks.append(asyncio.create_task(change_feed.run()))
+        app.state.background_tasks.append(asyncio.create_task(app.state.live_hub.heartbeat()))
+        app.state.background_tasks.append(asyncio.create_task(run_pending_migrations(settings)))
+        app.state.background_tasks.append(asyncio.create_task(run_periodic_jobs()))
+        reminders = ReminderScheduler(
+            reminder_sinks(settings), settings.reminder_window_seconds, settings.reminder_refill_seconds
+        )
+        app.state.background_tasks.append(asyncio.create_task(reminders.run()))
     logger.info("RankFlow API started")
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+    try:
+        yield
+    finally:
+        app.state.live_hub.close()
+        for task in app.state.background_tasks:
+            task.cancel()
+        await asyncio.gather(*app.state.background_tasks, return_exceptions=True)
+        app.state.bcrypt_executor.shutdown(wait=True)
+        app.state.mongo.close()
+        if PROMETHEUS_MULTIPROC_DIR:
+            multiprocess.mark_process_dead(os.getpid())
+        logger.info("RankFlow API stopped")
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """Monta um app independente; os recursos só são criados no lifespan"""
+    settings = settings or Settings.from_env()
+    app = FastAPI(title="RankFlow API", lifespan=lifespan)
+    app.state.settings = settings
+
+    app.include_router(api_router)
+    app.add_api_route("/metrics", metrics, include_in_schema=False)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=settings.cors_origins,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(CacheInvalidationMiddleware)
+    app.add_middleware(ProfilingMiddleware)
+    app.add_middleware(TracingMiddleware)
+    app.add_middleware(MetricsMiddleware)
+    app.add_middleware(AppStateMiddleware)
+    return app
+
+app = create_app()
+
+async def _migrate_command(args):
+    settings = Settings.from_env().model_copy(update={"run_background_jobs": False})
+    application = create_app(settings)
+    if args.command == "status":
+        # Só leitura: não passa pelo lifespan, que aplicaria as migrações bloqueantes e criaria índices
+        mongo = AsyncIOMotorClient(settings.mongo_url, uuidRepresentation="standard", tz_aware=True)
+        application.state.db = mongo[settings.db_name]
+        current_app_state.set(application.state)
+        try:
+            print(json.dumps(await migration_status(), default=json_default, indent=2))
+        finally:
+            mongo.close()
+        return
+    async with lifespan(application):
+        if args.command == "rebuild-finance":
+            print(json.dumps({"rollups": await rebuild_finance_rollups(batch_size=args.batch_size or 500)}))
+            return
+        runner = MigrationRunner(args.batch_size or settings.migration_batch_size,
+                                 args.docs_per_second or settings.migration_docs_per_second)
+        applied = await runner.run()
+        if applied is None:
+            raise SystemExit("Outro worker está migrando; tente novamente em instantes")
+        print(json.dumps({"applied": applied}))
+
+if __name__ == "__main__":
+    # python server.py migrate [--batch-size N] [--docs-per-second N] | status | rebuild-finance
+    import argparse
+    parser = argparse.ArgumentParser(description="RankFlow schema migrations and maintenance jobs")
+    parser.add_argument("command", choices=["migrate", "status", "rebuild-finance"])
+    parser.add_argument("--batch-size", type=int)
+    parser.add_argument("--docs-per-second", type=int)
+    asyncio.run(_migrate_command(parser.parse_args()))
@@ -0,0 +1,102 @@
+import { useEffect, useState } from "react";
+import { useNavigate } from "react-router-dom";
+import api from "../lib/api";
+import { formatDate, PIPELINE_STAGES } from "../lib/utils";
+import { Dialog, DialogContent } from "./ui/dialog";
+import { Command, CommandEmpty, CommandGroup, CommandInput, CommandItem, CommandList } from "./ui/command";
+import { Calendar, UserCheck, Users } from "lucide-react";
+
+const GROUPS = [
+  { type: "lead", label: "Leads", icon: Users },
+  { type: "client", label: "Clientes", icon: UserCheck },
+  { type: "task", label: "Tarefas", icon: Calendar },
+];
+
+// Busca global (Ctrl/Cmd + K): o servidor já devolve os resultados ordenados por relevância
+export default function GlobalSearch({ open, onOpenChange }) {
+  const navigate = useNavigate();
+  const [query, setQuery] = useState("");
+  const [results, setResults] = useState([]);
+
+  useEffect(() => {
+    const onKeyDown = (event) => {
+      if (event.key === "k" && (event.metaKey || event.ctrlKey)) {
+        event.preventDefault();
+        onOpenChange(!open);
+      }
+    };
+    document.addEventListener("keydown", onKeyDown);
+    return () => document.removeEventListener("keydown", onKeyDown);
+  }, [open, onOpenChange]);
+
+  useEffect(() => {
+    const q = query.trim();
+    if (!q) {
+      setResults([]);
+      return undefined;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const response = await api.get("/search", { params: { q } });
+        if (!cancelled) setResults(response.data.results);
+      } catch (error) {
+        if (!cancelled) setResults([]);
+      }
+    }, 250);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [query]);
+
+  const select = (result) => {
+    onOpenChange(false);
+    setQuery("");
+    if (result.type === "client") navigate(`/clients/${result.id}`);
+    else if (result.type === "lead") navigate("/crm");
+    else navigate("/agenda");
+  };
+
+  const details = (result) => {
+    if (result.type === "lead") return PIPELINE_STAGES[result.stage]?.label;
+    if (result.type === "task") return formatDate(result.due_date);
+    return null;
+  };
+
+  return (
+    <Dialog open={open} onOpenChange={onOpenChange}>
+      <DialogContent className="overflow-hidden p-0" data-testid="global-search">
+        <Command shouldFilter={false}>
+          <CommandInput
+            value={query}
+            onValueChange={setQuery}
+            placeholder="Buscar leads, clientes e tarefas..."
+            data-testid="global-search-input"
+          />
+          <CommandList>
+            {query.trim() && <CommandEmpty>Nada encontrado</CommandEmpty>}
+            {GROUPS.map(({ type, label, icon: Icon }) => {
+              const items = results.filter((result) => result.type === type);
+              if (items.length === 0) return null;
+              return (
+                <CommandGroup key={type} heading={label}>
+                  {items.map((result) => (
+                    <CommandItem key={result.id} value={`${type}-${result.id}`} onSelect={() => select(result)}>
+                      <Icon className="text-slate-400" />
+                      <div className="flex-1 min-w-0">
+                        <p className="truncate">{result.title}</p>
+                        {result.subtitle && <p className="text-xs text-slate-400 truncate">{result.subtitle}</p>}
+                      </div>
+                      {details(result) && <span className="text-xs text-slate-400 shrink-0">{details(result)}</span>}
+                    </CommandItem>
+                  ))}
+                </CommandGroup>
+              );
+            })}
+          </CommandList>
+        </Command>
+      </DialogContent>
+    </Dialog>
+  );
+}
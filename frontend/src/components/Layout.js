@@ -10,10 +10,14 @@ import {
   Menu,
   X,
   Shield,
-  AlertTriangle
+  AlertTriangle,
+  Search
 } from "lucide-react";
 import { Button } from "./ui/button";
 import { useState } from "react";
+import { toast } from "sonner";
+import { useLiveEvents } from "../hooks/use-live-events";
+import GlobalSearch from "./GlobalSearch";
 
 const navItems = [
   { path: "/", icon: LayoutDashboard, label: "Dashboard" },
@@ -27,6 +31,14 @@ export default function Layout() {
   const { user, logout, isSuperAdmin, isImpersonating, exitImpersonate } = useAuth();
   const navigate = useNavigate();
   const [mobileMenuOpen, setMobileMenuOpen] = useState(false);
+  const [searchOpen, setSearchOpen] = useState(false);
+
+  // Lembretes de tarefas chegam como notificações em qualquer página
+  useLiveEvents((event) => {
+    if (event.type === "notification.created" && event.document?.type === "reminder") {
+      toast.info(`Lembrete: ${event.document.title}`, { description: event.document.message || undefined });
+    }
+  });
 
   const handleLogout = () => {
     logout();
@@ -70,6 +82,16 @@ export default function Layout() {
         </div>
         
         <nav className="flex-1 p-4 space-y-1">
+          <button
+            type="button"
+            className="sidebar-link w-full"
+            onClick={() => setSearchOpen(true)}
+            data-testid="nav-search"
+          >
+            <Search className="w-5 h-5" />
+            <span className="flex-1 text-left">Buscar</span>
+            <kbd className="text-xs text-slate-400 font-mono">Ctrl K</kbd>
+          </button>
           {navItems.map((item) => (
             <NavLink
               key={item.path}
@@ -157,6 +179,17 @@ export default function Layout() {
       {mobileMenuOpen && (
         <div className={`md:hidden fixed inset-0 z-30 bg-white ${isImpersonating ? 'pt-28' : 'pt-16'}`}>
           <nav className="p-4 space-y-1">
+            <button
+              type="button"
+              className="sidebar-link w-full"
+              onClick={() => {
+                setMobileMenuOpen(false);
+                setSearchOpen(true);
+              }}
+            >
+              <Search className="w-5 h-5" />
+              <span>Buscar</span>
+            </button>
             {navItems.map((item) => (
               <NavLink
                 key={item.path}
@@ -201,6 +234,8 @@ export default function Layout() {
       <main className={`flex-1 overflow-auto ${isImpersonating ? 'md:pt-12 pt-28' : 'md:pt-0 pt-16'}`}>
         <Outlet />
       </main>
+
+      <GlobalSearch open={searchOpen} onOpenChange={setSearchOpen} />
     </div>
   );
 }
@@ -0,0 +1,74 @@
+import { useEffect, useRef } from "react";
+import api from "../lib/api";
+
+const RECONNECT_DELAY_MS = 5000;
+
+// Assina o canal SSE do usuário e repassa cada delta ({ type, id, changes | document })
+// ao handler; "resync" indica que eventos foram perdidos. O stream usa um token curto
+// de /events/token (vale ~60s e só na conexão), então a cada queda buscamos um novo
+// em vez de deixar o EventSource reconectar sozinho com a URL antiga.
+export function useLiveEvents(onEvent) {
+  const handlerRef = useRef(onEvent);
+  handlerRef.current = onEvent;
+
+  useEffect(() => {
+    if (!localStorage.getItem("rankflow_token") || typeof EventSource === "undefined") return undefined;
+
+    let source = null;
+    let timer = null;
+    let closed = false;
+
+    const reconnect = () => {
+      if (!closed) timer = setTimeout(connect, RECONNECT_DELAY_MS);
+    };
+
+    async function connect() {
+      let token;
+      try {
+        const response = await api.post("/events/token");
+        token = response.data.token;
+      } catch (error) {
+        reconnect();
+        return;
+      }
+      if (closed) return;
+      source = new EventSource(
+        `${process.env.REACT_APP_BACKEND_URL}/api/events/stream?token=${encodeURIComponent(token)}`
+      );
+      source.onmessage = (message) => {
+        try {
+          handlerRef.current(JSON.parse(message.data));
+        } catch (error) {
+          // Evento malformado: ignora
+        }
+      };
+      source.onerror = () => {
+        source.close();
+        source = null;
+        reconnect();
+      };
+    }
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(timer);
+      if (source) source.close();
+    };
+  }, []);
+}
+
+// Aplica um delta de uma coleção ("lead", "task", ...) a uma lista de documentos
+export function applyLiveEvent(items, event, kind) {
+  if (event.type === `${kind}.created`) {
+    if (!event.document || items.some((item) => item.id === event.id)) return items;
+    return [...items, event.document];
+  }
+  if (event.type === `${kind}.updated`) {
+    return items.map((item) => (item.id === event.id ? { ...item, ...event.changes } : item));
+  }
+  if (event.type === `${kind}.deleted`) {
+    return items.filter((item) => item.id !== event.id);
+  }
+  return items;
+}
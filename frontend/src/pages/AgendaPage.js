@@ -1,5 +1,6 @@
 import { useState, useEffect } from "react";
 import api from "../lib/api";
+import { useLiveEvents, applyLiveEvent } from "../hooks/use-live-events";
 import { formatDate, TASK_TYPES, isPast, isToday } from "../lib/utils";
 import { Button } from "../components/ui/button";
 import { Input } from "../components/ui/input";
@@ -34,16 +35,19 @@ export default function AgendaPage() {
     fetchData();
   }, []);
 
+  useLiveEvents((event) => {
+    if (event.type === "resync") {
+      fetchData();
+      return;
+    }
+    setTasks((current) => applyLiveEvent(current, event, "task"));
+  });
+
+  // Todas as abas mostram só tarefas abertas: concluídas ficam no servidor
   const fetchData = async () => {
     try {
-      const [tasksRes, clientsRes, leadsRes] = await Promise.all([
-        api.get("/tasks"),
-        api.get("/clients"),
-        api.get("/leads"),
-      ]);
-      setTasks(tasksRes.data);
-      setClients(clientsRes.data);
-      setLeads(leadsRes.data);
+      const response = await api.get("/tasks", { params: { completed: false } });
+      setTasks(response.data);
     } catch (error) {
       toast.error("Erro ao carregar dados");
     } finally {
@@ -51,6 +55,18 @@ export default function AgendaPage() {
     }
   };
 
+  // Clientes e leads só alimentam os selects do modal: carregados ao abri-lo
+  const openModal = async () => {
+    setModalOpen(true);
+    try {
+      const [clientsRes, leadsRes] = await Promise.all([api.get("/clients"), api.get("/leads")]);
+      setClients(clientsRes.data);
+      setLeads(leadsRes.data);
+    } catch (error) {
+      toast.error("Erro ao carregar clientes e leads");
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     try {
@@ -70,8 +86,8 @@ export default function AgendaPage() {
 
   const handleToggleComplete = async (taskId, currentStatus) => {
     try {
-      await api.put(`/tasks/${taskId}`, { completed: !currentStatus });
-      fetchData();
+      const response = await api.put(`/tasks/${taskId}`, { completed: !currentStatus });
+      setTasks((current) => current.map((task) => (task.id === taskId ? response.data : task)));
       toast.success(currentStatus ? "Tarefa reaberta" : "Tarefa concluída!");
     } catch (error) {
       toast.error("Erro ao atualizar tarefa");
@@ -150,7 +166,7 @@ export default function AgendaPage() {
           <h1 className="text-3xl font-bold text-slate-900 tracking-tight">Agenda</h1>
           <p className="text-slate-500 mt-1">Gerencie suas tarefas e follow-ups</p>
         </div>
-        <Button onClick={() => setModalOpen(true)} className="gap-2" data-testid="add-task-btn">
+        <Button onClick={openModal} className="gap-2" data-testid="add-task-btn">
           <Plus className="w-4 h-4" />
           Nova Tarefa
         </Button>
@@ -1,5 +1,6 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import api from "../lib/api";
+import { useLiveEvents, applyLiveEvent } from "../hooks/use-live-events";
 import { formatCurrency, formatDate, PIPELINE_STAGES } from "../lib/utils";
 import { Button } from "../components/ui/button";
 import { Input } from "../components/ui/input";
@@ -17,6 +18,8 @@ const STAGES_ORDER = ["novo_lead", "contato_feito", "reuniao", "proposta", "fech
 
 export default function CRMPage() {
   const [leads, setLeads] = useState([]);
+  const [columns, setColumns] = useState({});
+  const totalsTimer = useRef(null);
   const [loading, setLoading] = useState(true);
   const [modalOpen, setModalOpen] = useState(false);
   const [editingLead, setEditingLead] = useState(null);
@@ -36,10 +39,29 @@ export default function CRMPage() {
     fetchLeads();
   }, []);
 
+  useEffect(() => () => clearTimeout(totalsTimer.current), []);
+
+  useLiveEvents((event) => {
+    if (event.type === "resync") {
+      fetchLeads();
+      return;
+    }
+    if (!event.type.startsWith("lead.")) return;
+    setLeads((current) => applyLiveEvent(current, event, "lead"));
+    // Contagens e valores das colunas vêm do servidor: várias mudanças seguidas viram uma busca
+    clearTimeout(totalsTimer.current);
+    totalsTimer.current = setTimeout(fetchTotals, 500);
+  });
+
+  const columnsFrom = (board) =>
+    Object.fromEntries(board.columns.map(({ leads: _, ...column }) => [column.stage, column]));
+
+  // Primeira página de cada coluna, com totais e cursor para carregar mais
   const fetchLeads = async () => {
     try {
-      const response = await api.get("/leads");
-      setLeads(response.data);
+      const response = await api.get("/leads/board");
+      setLeads(response.data.columns.flatMap((column) => column.leads));
+      setColumns(columnsFrom(response.data));
     } catch (error) {
       toast.error("Erro ao carregar leads");
     } finally {
@@ -47,6 +69,41 @@ export default function CRMPage() {
     }
   };
 
+  const fetchTotals = async () => {
+    try {
+      const response = await api.get("/leads/board", { params: { limit: 0 } });
+      const totals = columnsFrom(response.data);
+      setColumns((current) =>
+        Object.fromEntries(
+          Object.entries(totals).map(([stage, column]) => [
+            stage,
+            { ...column, next_cursor: current[stage]?.next_cursor ?? null },
+          ])
+        )
+      );
+    } catch (error) {
+      // Mantém os totais anteriores; o próximo evento tenta de novo
+    }
+  };
+
+  const loadMore = async (stage) => {
+    try {
+      const response = await api.get(`/leads/board/${stage}`, {
+        params: { cursor: columns[stage]?.next_cursor },
+      });
+      setLeads((current) => {
+        const known = new Set(current.map((lead) => lead.id));
+        return [...current, ...response.data.leads.filter((lead) => !known.has(lead.id))];
+      });
+      setColumns((current) => ({
+        ...current,
+        [stage]: { ...current[stage], next_cursor: response.data.next_cursor },
+      }));
+    } catch (error) {
+      toast.error("Erro ao carregar leads");
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     try {
@@ -87,8 +144,8 @@ export default function CRMPage() {
 
   const handleStageChange = async (leadId, newStage) => {
     try {
-      await api.put(`/leads/${leadId}`, { stage: newStage });
-      fetchLeads();
+      const response = await api.put(`/leads/${leadId}`, { stage: newStage });
+      setLeads((current) => current.map((lead) => (lead.id === leadId ? response.data : lead)));
       toast.success("Estágio atualizado!");
     } catch (error) {
       toast.error("Erro ao atualizar estágio");
@@ -170,9 +227,14 @@ export default function CRMPage() {
                 <span className={`w-2 h-2 rounded-full bg-${PIPELINE_STAGES[stage]?.color || 'slate'}-500`} />
                 <span>{PIPELINE_STAGES[stage]?.label || stage}</span>
               </div>
-              <Badge variant="secondary" className="font-mono">
-                {getLeadsByStage(stage).length}
-              </Badge>
+              <div className="flex items-center gap-2">
+                <span className="text-xs font-mono font-normal text-slate-400">
+                  {formatCurrency(columns[stage]?.value || 0)}
+                </span>
+                <Badge variant="secondary" className="font-mono">
+                  {columns[stage]?.count ?? getLeadsByStage(stage).length}
+                </Badge>
+              </div>
             </div>
             <div className="kanban-column-body">
               {getLeadsByStage(stage).length === 0 ? (
@@ -191,6 +253,17 @@ export default function CRMPage() {
                   />
                 ))
               )}
+              {columns[stage]?.next_cursor && (
+                <Button
+                  variant="ghost"
+                  size="sm"
+                  className="w-full text-slate-500"
+                  onClick={() => loadMore(stage)}
+                  data-testid={`load-more-${stage}`}
+                >
+                  Carregar mais
+                </Button>
+              )}
             </div>
           </div>
         ))}
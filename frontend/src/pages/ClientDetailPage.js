@@ -67,9 +67,8 @@ export default function ClientDetailPage() {
 
   const fetchTasks = async () => {
     try {
-      const response = await api.get("/tasks");
-      const clientTasks = response.data.filter((t) => t.client_id === id);
-      setTasks(clientTasks);
+      const response = await api.get("/tasks", { params: { client_id: id } });
+      setTasks(response.data);
     } catch (error) {
       console.error("Erro ao carregar tarefas", error);
     }
@@ -1,5 +1,6 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import api from "../lib/api";
+import { useLiveEvents } from "../hooks/use-live-events";
 import { formatCurrency } from "../lib/utils";
 import { Card, CardContent } from "../components/ui/card";
 import { Button } from "../components/ui/button";
@@ -30,10 +31,19 @@ export default function DashboardPage() {
   const [alertDaysInput, setAlertDaysInput] = useState("");
   const [saving, setSaving] = useState(false);
 
+  const refreshTimer = useRef(null);
+
   useEffect(() => {
     fetchStats();
+    return () => clearTimeout(refreshTimer.current);
   }, []);
 
+  // Os números do dashboard são agregados: junta uma rajada de eventos num único refetch
+  useLiveEvents(() => {
+    clearTimeout(refreshTimer.current);
+    refreshTimer.current = setTimeout(fetchStats, 1000);
+  });
+
   const fetchStats = async () => {
     try {
       const response = await api.get("/dashboard/stats");
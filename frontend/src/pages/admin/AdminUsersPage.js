@@ -1,7 +1,7 @@
 import { useState, useEffect } from "react";
 import { useNavigate } from "react-router-dom";
 import api from "../../lib/api";
-import { formatDate } from "../../lib/utils";
+import { formatCurrency, formatDate } from "../../lib/utils";
 import { Button } from "../../components/ui/button";
 import { Input } from "../../components/ui/input";
 import { Label } from "../../components/ui/label";
@@ -41,7 +41,7 @@ export default function AdminUsersPage() {
   const fetchUsers = async () => {
     try {
       setLoading(true);
-      const params = new URLSearchParams();
+      const params = new URLSearchParams({ include_stats: "true" });
       if (search) params.append("search", search);
       if (statusFilter !== "all") params.append("status", statusFilter);
       if (planFilter !== "all") params.append("plan", planFilter);
@@ -238,6 +238,10 @@ export default function AdminUsersPage() {
                     <TableHead className="text-slate-400">Role</TableHead>
                     <TableHead className="text-slate-400">Plano</TableHead>
                     <TableHead className="text-slate-400">Status</TableHead>
+                    <TableHead className="text-slate-400 text-right">Clientes</TableHead>
+                    <TableHead className="text-slate-400 text-right">Leads</TableHead>
+                    <TableHead className="text-slate-400 text-right">Tarefas</TableHead>
+                    <TableHead className="text-slate-400 text-right">Recebido</TableHead>
                     <TableHead className="text-slate-400">Criado em</TableHead>
                     <TableHead className="text-slate-400 text-right">Ações</TableHead>
                   </TableRow>
@@ -255,6 +259,12 @@ export default function AdminUsersPage() {
                       <TableCell>{getRoleBadge(user.role)}</TableCell>
                       <TableCell>{getPlanBadge(user.plan)}</TableCell>
                       <TableCell>{getStatusBadge(user.status)}</TableCell>
+                      <TableCell className="text-slate-300 font-mono text-sm text-right">{user.stats?.clients_count ?? "-"}</TableCell>
+                      <TableCell className="text-slate-300 font-mono text-sm text-right">{user.stats?.leads_count ?? "-"}</TableCell>
+                      <TableCell className="text-slate-300 font-mono text-sm text-right">{user.stats?.tasks_count ?? "-"}</TableCell>
+                      <TableCell className="text-slate-300 font-mono text-sm text-right">
+                        {user.stats ? formatCurrency(user.stats.payments_total) : "-"}
+                      </TableCell>
                       <TableCell className="text-slate-400 font-mono text-sm">
                         {formatDate(user.created_at)}
                       </TableCell>
@@ -0,0 +1,91 @@
+"""Micro-benchmark fixtures for the CPU-bound hot paths of backend/server.py.
+
+`benchmark(fn, *args)` mirrors the pytest-benchmark call style. Timings are
+divided by a fixed pure-Python calibration workload measured right after
+each of them, so the stored baseline is a ratio that stays comparable across
+machines. A benchmark fails when its ratio exceeds the baseline by more
+than BENCH_MAX_SLOWDOWN (default 1.5x) in BENCH_ATTEMPTS consecutive
+measurements, each paired with a fresh calibration run.
+
+    BENCH_SAVE=1 python -m pytest tests/benchmarks   # refresh baseline.json
+"""
+import json
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+BASELINE_FILE = Path(__file__).with_name("baseline.json")
+MAX_SLOWDOWN = float(os.environ.get("BENCH_MAX_SLOWDOWN", "1.5"))
+SAVE_BASELINE = os.environ.get("BENCH_SAVE") == "1"
+ATTEMPTS = int(os.environ.get("BENCH_ATTEMPTS", "3"))
+ROUNDS = 7
+MIN_ROUND_SECONDS = 0.02
+
+
+def measure(fn, *args, **kwargs) -> float:
+    """Best per-call time over ROUNDS rounds of at least MIN_ROUND_SECONDS each"""
+    iterations = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_ROUND_SECONDS:
+            break
+        iterations *= 2
+
+    best = elapsed / iterations
+    for _ in range(ROUNDS - 1):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn(*args, **kwargs)
+        best = min(best, (time.perf_counter() - start) / iterations)
+    return best
+
+
+def _calibration_workload():
+    counts = {}
+    total = 0
+    for i in range(20000):
+        counts[i % 97] = counts.get(i % 97, 0) + i
+        total += len(str(i))
+    return total
+
+
+@pytest.fixture(scope="session")
+def bench_results():
+    results = {}
+    yield results
+    if SAVE_BASELINE and results:
+        baseline = json.loads(BASELINE_FILE.read_text()) if BASELINE_FILE.exists() else {}
+        baseline.update(results)
+        BASELINE_FILE.write_text(json.dumps(dict(sorted(baseline.items())), indent=2) + "\n")
+
+
+@pytest.fixture
+def benchmark(request, bench_results):
+    baseline = json.loads(BASELINE_FILE.read_text()) if BASELINE_FILE.exists() else {}
+    name = request.node.name
+
+    def run(fn, *args, **kwargs):
+        result = fn(*args, **kwargs)
+        expected = baseline.get(name)
+        # Ruído da máquina (outro processo, frequência da CPU) só reprova se persistir
+        for _ in range(ATTEMPTS):
+            seconds = measure(fn, *args, **kwargs)
+            ratio = seconds / measure(_calibration_workload)
+            if SAVE_BASELINE or not expected or ratio <= expected * MAX_SLOWDOWN:
+                break
+        bench_results[name] = round(ratio, 4)
+        request.node.user_properties.append(("seconds_per_call", seconds))
+
+        if not SAVE_BASELINE and expected and ratio > expected * MAX_SLOWDOWN:
+            pytest.fail(
+                f"{name} ficou mais lento: {ratio:.4f} x calibração "
+                f"(baseline {expected:.4f}, limite {MAX_SLOWDOWN}x)"
+            )
+        return result
+
+    return run
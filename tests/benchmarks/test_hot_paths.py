@@ -0,0 +1,98 @@
+import asyncio
+import random
+from datetime import datetime, timezone
+
+import pytest
+from fastapi.routing import serialize_response
+from starlette.responses import JSONResponse
+
+import server
+from tests.load.datagen import SeedConfig, build_tenant
+
+# Datasets fixos: mesma seed e mesmo "agora" em todas as execuções
+NOW = datetime(2026, 1, 15, 12, 0, tzinfo=timezone.utc)
+ROWS = 1000
+
+
+@pytest.fixture(scope="module")
+def tenant():
+    config = SeedConfig(leads=ROWS, clients=200, tasks=ROWS, payments=ROWS, audit_logs=0)
+    return build_tenant(0, config, "hash", random.Random(1234), NOW)
+
+
+@pytest.fixture(scope="module")
+def large_client(tenant):
+    doc = dict(tenant["clients"][0])
+    doc["checklist"] = [{"id": f"c{i}", "title": f"Item {i}", "completed": i % 2 == 0} for i in range(500)]
+    doc["weekly_tasks"] = [{"id": f"w{i}", "title": f"Semanal {i}", "completed": False} for i in range(500)]
+    return doc
+
+
+def _response_field(path: str):
+    route = next(r for r in server.app.routes if getattr(r, "path", None) == path and "GET" in r.methods)
+    return route.secure_cloned_response_field or route.response_field
+
+
+def _serializer(path: str):
+    field = _response_field(path)
+    loop = asyncio.new_event_loop()
+
+    def serialize(rows):
+        content = loop.run_until_complete(serialize_response(field=field, response_content=rows))
+        return JSONResponse(content).body
+
+    return serialize
+
+
+def test_create_token(benchmark):
+    token = benchmark(server.create_token, "5b0c3f7e-2c4e-4d8e-9f51-3d1b7c1e9a20")
+    assert token.count(".") == 2
+
+
+def test_decode_token(benchmark):
+    token = server.create_token("5b0c3f7e-2c4e-4d8e-9f51-3d1b7c1e9a20")
+    payload = benchmark(server.decode_token, token)
+    assert payload["sub"] == "5b0c3f7e-2c4e-4d8e-9f51-3d1b7c1e9a20"
+
+
+def test_count_clients_created_in_month(benchmark, tenant):
+    count = benchmark(server.count_clients_created_in_month, tenant["clients"], NOW.month, NOW.year)
+    assert 0 <= count <= len(tenant["clients"])
+
+
+def test_summarize_open_tasks(benchmark, tenant):
+    open_tasks = [t for t in tenant["tasks"] if not t["completed"]]
+    tasks_today, tasks_today_list = benchmark(server.summarize_open_tasks, open_tasks, NOW.date())
+    assert len(tasks_today_list) == min(tasks_today, 5)
+
+
+def test_client_response_validation(benchmark, large_client):
+    client = benchmark(server.ClientResponse.model_validate, large_client)
+    assert len(client.checklist) == 500
+
+
+def test_get_week_start(benchmark):
+    week_start = benchmark(server.get_week_start)
+    assert week_start.weekday() == 0 and week_start.hour == 0
+
+
+def test_serialize_leads(benchmark, tenant):
+    body = benchmark(_serializer("/api/leads"), tenant["leads"])
+    assert body.startswith(b"[{")
+
+
+def test_serialize_tasks(benchmark, tenant):
+    body = benchmark(_serializer("/api/tasks"), tenant["tasks"])
+    assert body.startswith(b"[{")
+
+
+def test_search_score(benchmark, tenant):
+    # Pior caso de /search: SEARCH_CANDIDATES leads conferidos contra a consulta
+    candidates = tenant["leads"][:server.SEARCH_CANDIDATES]
+    tokens = server.search_tokens("Empresa 1")
+
+    def score_all():
+        return [server.search_score("leads", lead, tokens) for lead in candidates]
+
+    scores = benchmark(score_all)
+    assert any(scores)
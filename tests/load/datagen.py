@@ -0,0 +1,250 @@
+"""Synthetic multi-tenant data generator for the load tests.
+
+Documents mirror the shapes written by backend/server.py so the API
+reads them exactly as it reads real data. Everything is inserted with
+insert_many in large unordered batches; derived fields and aggregates
+come from the server's own helpers so they never drift from the API.
+"""
+import os
+import random
+import sys
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import bcrypt
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "backend"))
+# server.py lê a configuração no import (mesmos padrões de run.py)
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "rankflow_loadtest")
+
+import server  # noqa: E402
+
+PIPELINE_STAGES = server.PIPELINE_STAGES
+TASK_TYPES = server.TASK_TYPES
+
+LOADTEST_EMAIL_DOMAIN = "loadtest.rankflow.com"
+LOADTEST_PASSWORD = "loadtest123"
+BATCH_SIZE = 5000
+
+
+@dataclass
+class SeedConfig:
+    users: int = 10
+    leads: int = 200
+    clients: int = 50
+    checklist_items: int = 4
+    weekly_tasks: int = 5
+    tasks: int = 300
+    payments: int = 100
+    audit_logs: int = 20
+    seed: int = 42
+
+
+def loadtest_email(index: int) -> str:
+    return f"user{index}@{LOADTEST_EMAIL_DOMAIN}"
+
+
+def _day(dt: datetime) -> datetime:
+    # Datas de calendário (due_date, next_contact) ficam à meia-noite UTC
+    return datetime.combine(dt.date(), datetime.min.time(), tzinfo=timezone.utc)
+
+
+def _new_id(rng: random.Random) -> uuid.UUID:
+    # Derivado do rng para que a mesma seed gere exatamente o mesmo dataset.
+    # Gravado como Binary subtype 4: o client precisa de uuidRepresentation="standard"
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def build_tenant(index: int, config: SeedConfig, password_hash: str, rng: random.Random, now: datetime) -> dict:
+    """Build every document of one tenant, grouped by collection"""
+    user_id = _new_id(rng)
+    created = now - timedelta(days=rng.randint(30, 365))
+    user = {
+        "id": user_id,
+        "name": f"Load Test {index}",
+        "email": loadtest_email(index),
+        "password": password_hash,
+        "role": "USER",
+        "status": "active",
+        "plan": rng.choice(["free", "starter", "pro", "enterprise"]),
+        "plan_value": rng.choice([0, 49.9, 99.9, 199.9]),
+        "plan_status": "active",
+        "plan_expires_at": None,
+        "last_login_at": None,
+        "settings": {"monthly_goal": 10000, "leads_alert_days": 7},
+        "created_at": created,
+        "updated_at": created
+    }
+
+    leads = []
+    for i in range(config.leads):
+        updated = now - timedelta(days=rng.randint(0, 90), minutes=rng.randint(0, 1440))
+        next_contact = now + timedelta(days=rng.randint(-5, 20)) if rng.random() < 0.3 else None
+        lead = {
+            "id": _new_id(rng),
+            "name": f"Lead {index}-{i}",
+            "email": f"lead{i}@example.com",
+            "phone": f"11 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+            "company": f"Empresa {i % 37}",
+            "stage": rng.choice(PIPELINE_STAGES),
+            "contract_value": round(rng.uniform(300, 5000), 2),
+            "next_contact": _day(next_contact) if next_contact else None,
+            "reminder": None,
+            "notes": "Lead gerado para teste de carga",
+            "user_id": user_id,
+            "created_at": updated - timedelta(days=rng.randint(0, 30)),
+            "updated_at": updated
+        }
+        lead["stages_reached"] = server.stages_reached(lead["stage"])
+        lead["stage_changed_at"] = updated
+        lead["search_keys"] = server.search_keys("leads", lead)
+        leads.append(lead)
+
+    # Contagens `reached` como a migração 0007 as deriva dos leads (sem histórico de transições)
+    reached = {}
+    for lead in leads:
+        for stage in lead["stages_reached"]:
+            reached[stage] = reached.get(stage, 0) + 1
+    funnel_stats = [{"user_id": user_id, "reached": reached, "updated_at": now}] if leads else []
+
+    clients = []
+    for i in range(config.clients):
+        created_at = now - timedelta(days=rng.randint(0, 180))
+        client = {
+            "id": _new_id(rng),
+            "name": f"Cliente {index}-{i}",
+            "email": f"cliente{i}@example.com",
+            "phone": f"11 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+            "company": f"Empresa {i % 23}",
+            "contract_value": round(rng.uniform(500, 3000), 2),
+            "plan": rng.choice(["unico", "recorrente"]),
+            "notes": None,
+            "checklist": [
+                {"id": _new_id(rng), "title": f"Item {n}", "completed": rng.random() < 0.5}
+                for n in range(config.checklist_items)
+            ],
+            "weekly_tasks": [
+                {"id": _new_id(rng), "title": f"Tarefa semanal {n}", "completed": rng.random() < 0.3}
+                for n in range(config.weekly_tasks)
+            ],
+            "weekly_tasks_reset_at": created_at,
+            "user_id": user_id,
+            "created_at": created_at,
+            "updated_at": created_at
+        }
+        client["search_keys"] = server.search_keys("clients", client)
+        clients.append(client)
+
+    tasks = []
+    for i in range(config.tasks):
+        client = rng.choice(clients) if clients and rng.random() < 0.6 else None
+        lead = rng.choice(leads) if leads and not client and rng.random() < 0.5 else None
+        due = now + timedelta(days=rng.randint(-30, 30))
+        task = {
+            "id": _new_id(rng),
+            "title": f"Tarefa {i}",
+            "description": None,
+            "task_type": "follow_up" if lead else rng.choice(TASK_TYPES),
+            "due_date": _day(due),
+            "completed": rng.random() < 0.4,
+            "client_id": client["id"] if client else None,
+            "client_name": client["name"] if client else None,
+            "lead_id": lead["id"] if lead else None,
+            "lead_name": lead["name"] if lead else None,
+            "user_id": user_id,
+            "created_at": due - timedelta(days=7)
+        }
+        task["search_keys"] = server.search_keys("tasks", task)
+        tasks.append(task)
+
+    payments = []
+    for i in range(config.payments if clients else 0):
+        client = rng.choice(clients)
+        due = now + timedelta(days=rng.randint(-120, 30))
+        payment = {
+            "id": _new_id(rng),
+            "client_id": client["id"],
+            "client_name": client["name"],
+            "description": f"Mensalidade {i}",
+            "amount": round(rng.uniform(100, 2000), 2),
+            "payment_type": rng.choice(["pontual", "recorrente"]),
+            "due_date": _day(due),
+            "paid": due < now and rng.random() < 0.8,
+            "user_id": user_id,
+            "created_at": due - timedelta(days=30)
+        }
+        payment["status"] = server.payment_status(payment, now.date())
+        payments.append(payment)
+
+    audit_logs = []
+    for i in range(config.audit_logs):
+        audit_logs.append({
+            "id": _new_id(rng),
+            "actor_id": None,
+            "actor_email": f"admin@{LOADTEST_EMAIL_DOMAIN}",
+            "action": rng.choice(["change_plan", "update_profile", "activate_user"]),
+            "target_id": user_id,
+            "target_email": user["email"],
+            "details": {},
+            "created_at": now - timedelta(minutes=rng.randint(0, 60 * 24 * 30))
+        })
+
+    return {
+        "users": [user],
+        "leads": leads,
+        "clients": clients,
+        "tasks": tasks,
+        "payments": payments,
+        "audit_logs": audit_logs,
+        "funnel_stats": funnel_stats
+    }
+
+
+async def _flush(db, buffers: dict, force: bool = False) -> None:
+    for name, docs in buffers.items():
+        if docs and (force or len(docs) >= BATCH_SIZE):
+            await db[name].insert_many(docs, ordered=False)
+            docs.clear()
+
+
+async def seed(db, config: SeedConfig) -> dict:
+    """Insert N synthetic tenants; returns the number of documents per collection"""
+    rng = random.Random(config.seed)
+    now = datetime.now(timezone.utc)
+    # Um único hash para todos os usuários: bcrypt por usuário dominaria o tempo de seed
+    password_hash = bcrypt.hashpw(LOADTEST_PASSWORD.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+
+    totals = {}
+    buffers = {}
+    user_ids = []
+    for index in range(config.users):
+        tenant = build_tenant(index, config, password_hash, rng, now)
+        user_ids.extend(user["id"] for user in tenant["users"])
+        for name, docs in tenant.items():
+            buffers.setdefault(name, []).extend(docs)
+            totals[name] = totals.get(name, 0) + len(docs)
+        await _flush(db, buffers)
+    await _flush(db, buffers, force=True)
+
+    # Os rollups são recalculados pelo próprio server, que acessa o banco pelo estado do app
+    server.app.state.db = db
+    server.current_app_state.set(server.app.state)
+    totals["finance_rollups"] = 0
+    for user_id in user_ids:
+        totals["finance_rollups"] += await server.rebuild_finance_rollups(user_id)
+    return totals
+
+
+async def drop_seeded(db) -> None:
+    """Remove every tenant created by `seed` and its data"""
+    email_query = {"email": {"$regex": f"@{LOADTEST_EMAIL_DOMAIN}$"}}
+    user_ids = [u["id"] async for u in db.users.find(email_query, {"id": 1})]
+    for name in ["leads", "clients", "tasks", "payments", "finance_rollups", "task_templates",
+                 "funnel_stats", "lead_events"]:
+        await db[name].delete_many({"user_id": {"$in": user_ids}})
+    await db.tenant_usage.delete_many({"_id": {"$in": user_ids}})
+    await db.audit_logs.delete_many({"target_id": {"$in": user_ids}})
+    await db.users.delete_many(email_query)
@@ -0,0 +1,284 @@
+"""Load-test harness for the RankFlow API.
+
+Seeds synthetic tenants straight into MongoDB, then drives a weighted mix
+of the routes the frontend hits most (login, dashboard, CRM kanban moves,
+agenda) against a running server and reports latency percentiles and
+throughput per route as JSON.
+
+    python -m tests.load.run seed --users 50 --leads 500 --tasks 800
+    python -m tests.load.run run --base-url http://localhost:8001 \\
+        --concurrency 50 --duration 60 --output load-report.json
+    python -m tests.load.run compare baseline.json load-report.json
+    python -m tests.load.run drop
+
+MONGO_URL and DB_NAME are read from the environment, like the backend.
+Every virtual user logs in from the same address, so start the server
+under test with a high LOGIN_IP_LIMIT (e.g. 100000) or the login
+throttle will answer most logins with 429.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from .datagen import (
+    LOADTEST_PASSWORD, PIPELINE_STAGES, SeedConfig, drop_seeded, loadtest_email, seed
+)
+
+# Peso de cada cenário no mix (aproximação do uso real do frontend)
+SCENARIO_WEIGHTS = {
+    "login": 5,
+    "dashboard": 30,
+    "crm_move": 25,
+    "agenda": 25,
+    "clients": 15,
+}
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class Recorder:
+    """Latencies and errors grouped by route template"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.recording = False
+
+    def record(self, route: str, elapsed: float, ok: bool):
+        if not self.recording:
+            return
+        self.latencies.setdefault(route, []).append(elapsed * 1000)
+        if not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    def summary(self, duration: float) -> dict:
+        routes = {}
+        all_latencies = []
+        for route, values in sorted(self.latencies.items()):
+            values.sort()
+            all_latencies.extend(values)
+            routes[route] = self._stats(values, self.errors.get(route, 0), duration)
+        all_latencies.sort()
+        return {
+            "routes": routes,
+            "total": self._stats(all_latencies, sum(self.errors.values()), duration)
+        }
+
+    @staticmethod
+    def _stats(values: list, errors: int, duration: float) -> dict:
+        return {
+            "count": len(values),
+            "errors": errors,
+            "rps": round(len(values) / duration, 2) if duration else 0,
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2),
+            "mean_ms": round(sum(values) / len(values), 2) if values else 0,
+            "max_ms": round(values[-1], 2) if values else 0
+        }
+
+
+class VirtualUser:
+    """One simulated browser session bound to a seeded tenant"""
+
+    def __init__(self, http: httpx.AsyncClient, recorder: Recorder, email: str, rng: random.Random):
+        self.http = http
+        self.recorder = recorder
+        self.email = email
+        self.rng = rng
+        self.headers = {}
+
+    async def call(self, method: str, route: str, url: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await self.http.request(method, url, headers=self.headers, **kwargs)
+        except httpx.HTTPError:
+            self.recorder.record(f"{method} {route}", time.perf_counter() - start, False)
+            return None
+        self.recorder.record(f"{method} {route}", time.perf_counter() - start, response.status_code < 400)
+        return response
+
+    async def login(self):
+        response = await self.call(
+            "POST", "/api/auth/login", "/api/auth/login",
+            json={"email": self.email, "password": LOADTEST_PASSWORD}
+        )
+        if response is not None and response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def dashboard(self):
+        await self.call("GET", "/api/dashboard/stats", "/api/dashboard/stats")
+
+    async def crm_move(self):
+        response = await self.call("GET", "/api/leads/board", "/api/leads/board")
+        if response is None or response.status_code != 200:
+            return
+        leads = [lead for column in response.json()["columns"] for lead in column["leads"]]
+        if not leads:
+            return
+        lead = self.rng.choice(leads)
+        stage = self.rng.choice([s for s in PIPELINE_STAGES if s != lead["stage"]])
+        await self.call("PUT", "/api/leads/{lead_id}", f"/api/leads/{lead['id']}", json={"stage": stage})
+
+    async def agenda(self):
+        # O AgendaPage carrega só as tarefas abertas; clientes e leads apenas ao abrir o modal
+        tasks = await self.call("GET", "/api/tasks", "/api/tasks", params={"completed": "false"})
+        if tasks is None or tasks.status_code != 200 or not tasks.json():
+            return
+        task = self.rng.choice(tasks.json())
+        await self.call(
+            "PUT", "/api/tasks/{task_id}", f"/api/tasks/{task['id']}",
+            json={"completed": not task["completed"]}
+        )
+
+    async def clients(self):
+        await self.call("GET", "/api/clients", "/api/clients")
+
+    async def run(self, deadline: float):
+        await self.login()
+        scenarios = list(SCENARIO_WEIGHTS)
+        weights = [SCENARIO_WEIGHTS[name] for name in scenarios]
+        while time.monotonic() < deadline:
+            scenario = self.rng.choices(scenarios, weights)[0]
+            await getattr(self, scenario)()
+
+
+async def run_load(args) -> dict:
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as http:
+        users = [
+            VirtualUser(http, recorder, loadtest_email(rng.randrange(args.users)), random.Random(rng.random()))
+            for _ in range(args.concurrency)
+        ]
+        start = time.monotonic()
+        deadline = start + args.warmup + args.duration
+        runners = [asyncio.create_task(user.run(deadline)) for user in users]
+
+        await asyncio.sleep(args.warmup)
+        recorder.recording = True
+        measured_start = time.monotonic()
+        await asyncio.gather(*runners)
+        measured = time.monotonic() - measured_start
+
+    report = recorder.summary(measured)
+    report.update({
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "base_url": args.base_url,
+        "concurrency": args.concurrency,
+        "duration_s": round(measured, 2),
+        "warmup_s": args.warmup,
+        "scenario_weights": SCENARIO_WEIGHTS
+    })
+    return report
+
+
+def compare(old: dict, new: dict) -> list:
+    """Per-route deltas between two reports (positive = slower / more)"""
+    rows = []
+    for route in sorted(set(old["routes"]) | set(new["routes"])):
+        before = old["routes"].get(route)
+        after = new["routes"].get(route)
+        if not before or not after:
+            rows.append({"route": route, "only_in": "new" if after else "old"})
+            continue
+        row = {"route": route}
+        for key in ["p50_ms", "p95_ms", "p99_ms", "rps"]:
+            delta = after[key] - before[key]
+            row[key] = after[key]
+            row[f"{key}_change_pct"] = round(delta / before[key] * 100, 1) if before[key] else None
+        rows.append(row)
+    return rows
+
+
+def _database():
+    client = AsyncIOMotorClient(
+        os.environ.get("MONGO_URL", "mongodb://localhost:27017"), uuidRepresentation="standard"
+    )
+    return client, client[os.environ.get("DB_NAME", "rankflow_loadtest")]
+
+
+async def _seed(args):
+    client, db = _database()
+    config = SeedConfig(
+        users=args.users, leads=args.leads, clients=args.clients,
+        checklist_items=args.checklist_items, weekly_tasks=args.weekly_tasks,
+        tasks=args.tasks, payments=args.payments, audit_logs=args.audit_logs, seed=args.seed
+    )
+    start = time.perf_counter()
+    totals = await seed(db, config)
+    client.close()
+    print(json.dumps({"inserted": totals, "seconds": round(time.perf_counter() - start, 2)}, indent=2))
+
+
+async def _drop(args):
+    client, db = _database()
+    await drop_seeded(db)
+    client.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="insert synthetic tenants into MongoDB")
+    seed_parser.add_argument("--users", type=int, default=10)
+    seed_parser.add_argument("--leads", type=int, default=200)
+    seed_parser.add_argument("--clients", type=int, default=50)
+    seed_parser.add_argument("--checklist-items", type=int, default=4)
+    seed_parser.add_argument("--weekly-tasks", type=int, default=5)
+    seed_parser.add_argument("--tasks", type=int, default=300)
+    seed_parser.add_argument("--payments", type=int, default=100)
+    seed_parser.add_argument("--audit-logs", type=int, default=20)
+    seed_parser.add_argument("--seed", type=int, default=42)
+
+    run_parser = commands.add_parser("run", help="drive the route mix and report latencies")
+    run_parser.add_argument("--base-url", default="http://localhost:8001")
+    run_parser.add_argument("--users", type=int, default=10, help="number of seeded tenants to log in as")
+    run_parser.add_argument("--concurrency", type=int, default=20)
+    run_parser.add_argument("--duration", type=float, default=30)
+    run_parser.add_argument("--warmup", type=float, default=5)
+    run_parser.add_argument("--timeout", type=float, default=30)
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--output", help="write the JSON report to this file")
+
+    compare_parser = commands.add_parser("compare", help="diff two JSON reports")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+
+    commands.add_parser("drop", help="delete the seeded tenants")
+
+    args = parser.parse_args(argv)
+    if args.command == "seed":
+        asyncio.run(_seed(args))
+    elif args.command == "drop":
+        asyncio.run(_drop(args))
+    elif args.command == "compare":
+        with open(args.baseline) as f_old, open(args.candidate) as f_new:
+            print(json.dumps(compare(json.load(f_old), json.load(f_new)), indent=2))
+    else:
+        report = asyncio.run(run_load(args))
+        output = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(output)
+        print(output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
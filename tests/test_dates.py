@@ -0,0 +1,50 @@
+import operator
+from datetime import datetime, timezone
+
+import server
+
+OPERATORS = {"$gte": operator.ge, "$gt": operator.gt, "$lte": operator.le, "$lt": operator.lt}
+
+
+def legacy_matches(query: dict, value: str) -> bool:
+    """Aplica o ramo de strings do filtro como o Mongo (comparação lexicográfica)"""
+    conditions = query["$or"][1]["due_date"]
+    return all(OPERATORS[op](value, bound) for op, bound in conditions.items())
+
+
+def day_query(day: int) -> dict:
+    # Mesmos limites que /tasks monta para from=to=2024-05-<day>
+    return server.date_range_query(
+        "due_date",
+        gte=datetime(2024, 5, day, tzinfo=timezone.utc),
+        lte=datetime.combine(datetime(2024, 5, day).date(), datetime.max.time(), tzinfo=timezone.utc),
+    )
+
+
+def test_legacy_strings_inside_inclusive_day():
+    query = day_query(1)
+    for value in ["2024-05-01", "2024-05-01T00:00:00+00:00", "2024-05-01T00:00:00Z",
+                  "2024-05-01T13:45:00.123456+00:00", "2024-05-01T23:59:59Z", "2024-05-01T23:59:59.999999+00:00"]:
+        assert legacy_matches(query, value), value
+
+
+def test_legacy_strings_outside_day():
+    query = day_query(1)
+    for value in ["2024-04-30", "2024-04-30T23:59:59.999999+00:00", "2024-05-02", "2024-05-02T00:00:00Z"]:
+        assert not legacy_matches(query, value), value
+
+
+def test_exclusive_and_intraday_bounds():
+    noon = datetime(2024, 5, 1, 12, tzinfo=timezone.utc)
+    after = server.date_range_query("due_date", gt=noon)
+    assert not legacy_matches(after, "2024-05-01")
+    assert not legacy_matches(after, "2024-05-01T12:00:00+00:00")
+    assert legacy_matches(after, "2024-05-01T12:00:01Z")
+    before = server.date_range_query("due_date", lt=datetime(2024, 5, 2, tzinfo=timezone.utc))
+    assert legacy_matches(before, "2024-05-01T23:59:59+00:00")
+    assert not legacy_matches(before, "2024-05-02")
+
+
+def test_bson_branch_keeps_exact_bounds():
+    start = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    assert server.date_range_query("due_date", gte=start)["$or"][0] == {"due_date": {"$gte": start}}
@@ -0,0 +1,60 @@
+from datetime import date, datetime, timezone
+
+import server
+
+USER = "u1"
+
+
+def payment(amount, due, paid=False, status=None):
+    doc = {"user_id": USER, "amount": amount, "due_date": datetime(*due, tzinfo=timezone.utc), "paid": paid}
+    if status:
+        doc["status"] = status
+    return doc
+
+
+def test_payment_status():
+    today = date(2026, 3, 10)
+    assert server.payment_status(payment(10, (2026, 3, 1), paid=True), today) == "paid"
+    assert server.payment_status(payment(10, (2026, 3, 9)), today) == "overdue"
+    assert server.payment_status(payment(10, (2026, 3, 10)), today) == "pending"
+
+
+def test_rollup_deltas_insert_and_delete():
+    created = payment(100.0, (2026, 3, 5), status="pending")
+    assert server.rollup_deltas([(None, -1), (created, 1)]) == {
+        (USER, "2026-03"): {"pending": 100.0, "pending_count": 1}
+    }
+    assert server.rollup_deltas([(created, -1), (None, 1)]) == {
+        (USER, "2026-03"): {"pending": -100.0, "pending_count": -1}
+    }
+
+
+def test_rollup_deltas_status_change_same_month():
+    before = payment(100.0, (2026, 3, 5), status="pending")
+    after = payment(100.0, (2026, 3, 5), paid=True, status="paid")
+    assert server.rollup_deltas([(before, -1), (after, 1)]) == {
+        (USER, "2026-03"): {"pending": -100.0, "pending_count": -1, "paid": 100.0, "paid_count": 1}
+    }
+
+
+def test_rollup_deltas_moves_between_months():
+    before = payment(80.0, (2026, 3, 31), status="pending")
+    after = payment(120.0, (2026, 4, 1), status="pending")
+    assert server.rollup_deltas([(before, -1), (after, 1)]) == {
+        (USER, "2026-03"): {"pending": -80.0, "pending_count": -1},
+        (USER, "2026-04"): {"pending": 120.0, "pending_count": 1},
+    }
+
+
+def test_rollup_deltas_unchanged_payment_nets_to_zero():
+    doc = payment(50.0, (2026, 3, 5), status="overdue")
+    assert server.rollup_deltas([(doc, -1), (doc, 1)]) == {
+        (USER, "2026-03"): {"overdue": 0.0, "overdue_count": 0}
+    }
+
+
+def test_rollup_deltas_derives_missing_status():
+    # Pagamentos antigos, sem `status` gravado, usam payment_status
+    assert server.rollup_deltas([(payment(30.0, (2020, 1, 1), paid=True), 1)]) == {
+        (USER, "2020-01"): {"paid": 30.0, "paid_count": 1}
+    }
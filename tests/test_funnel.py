@@ -0,0 +1,40 @@
+import bisect
+
+import server
+
+
+def bucket(days: float) -> str:
+    # Mesma chave que record_stage_change grava em funnel_stats.days.<etapa>
+    return str(bisect.bisect_right(server.STAGE_DAY_BUCKETS, days))
+
+
+def test_stages_reached():
+    assert server.stages_reached("novo_lead") == ["novo_lead"]
+    assert server.stages_reached("reuniao") == ["novo_lead", "contato_feito", "reuniao"]
+    assert server.stages_reached("fechado") == server.FUNNEL_STAGES
+    # Perdido não está no funil: não implica as etapas anteriores
+    assert server.stages_reached("perdido") == ["perdido"]
+
+
+def test_histogram_median_empty():
+    assert server.histogram_median({}) is None
+    assert server.histogram_median({"3": 0}) is None
+
+
+def test_histogram_median_interpolates_inside_bucket():
+    assert bucket(0.2) == "0" and bucket(4.5) == "3"
+    # 4 leads em [0, 1): a metade cai no meio da faixa
+    assert server.histogram_median({"0": 4}) == 0.5
+    # 1 em [1, 2) e 3 em [3, 5): falta 1 dos 3 para a metade -> 3 + 2 * 1/3
+    assert server.histogram_median({bucket(1.5): 1, bucket(4): 3}) == 3.7
+
+
+def test_histogram_median_skips_empty_buckets():
+    assert server.histogram_median({"2": 2, "4": 0, "5": 2}) == 3.0
+
+
+def test_histogram_median_open_last_bucket():
+    last = str(len(server.STAGE_DAY_BUCKETS))
+    assert bucket(400) == last
+    assert server.histogram_median({last: 3}) == float(server.STAGE_DAY_BUCKETS[-1])
+    assert server.histogram_median({"0": 1, last: 3}) == float(server.STAGE_DAY_BUCKETS[-1])
@@ -0,0 +1,36 @@
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1] / "backend"
+
+# Simula o PROMETHEUS_MULTIPROC_DIR vindo só do backend/.env: o load_dotenv de server.py
+# precisa rodar antes do import do prometheus_client para as métricas irem aos arquivos
+SCRIPT = textwrap.dedent("""
+    import asyncio, os, sys, tempfile
+    import dotenv
+
+    multiproc_dir = tempfile.mkdtemp()
+    real_load_dotenv = dotenv.load_dotenv
+
+    def load_dotenv(*args, **kwargs):
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = multiproc_dir
+        return real_load_dotenv(*args, **kwargs)
+
+    dotenv.load_dotenv = load_dotenv
+    sys.path.insert(0, sys.argv[1])
+    import server
+
+    server.HTTP_REQUESTS.labels(method="GET", route="/api/probe", status="200").inc()
+    body = asyncio.run(server.metrics()).body.decode()
+    assert 'route="/api/probe"' in body, body
+    assert os.listdir(multiproc_dir)
+""")
+
+
+def test_multiproc_dir_from_dotenv_is_honoured():
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT, str(BACKEND_DIR)], capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
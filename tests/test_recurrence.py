@@ -0,0 +1,69 @@
+from datetime import datetime, timezone
+
+import server
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_month_due_date_clamps_to_last_day():
+    assert server.month_due_date(2026, 2, 31) == utc(2026, 2, 28)
+    assert server.month_due_date(2028, 2, 31) == utc(2028, 2, 29)
+    assert server.month_due_date(2026, 2, 30) == utc(2026, 2, 28)
+    assert server.month_due_date(2026, 4, 31) == utc(2026, 4, 30)
+    assert server.month_due_date(2026, 13, 15) == utc(2027, 1, 15)
+
+
+def test_next_recurrence_keeps_the_series_day():
+    assert server.next_recurrence(utc(2026, 1, 31), 31) == utc(2026, 2, 28)
+    # Depois de fevereiro volta ao dia 31, sem "grudar" no 28
+    assert server.next_recurrence(utc(2026, 2, 28), 31) == utc(2026, 3, 31)
+    assert server.next_recurrence(utc(2026, 12, 10), 10) == utc(2027, 1, 10)
+
+
+def test_next_recurrence_skips_to_not_before():
+    due = utc(2025, 6, 15)
+    assert server.next_recurrence(due, 15, not_before=utc(2026, 3, 1)) == utc(2026, 3, 15)
+    assert server.next_recurrence(due, 15, not_before=utc(2026, 3, 15)) == utc(2026, 3, 15)
+    assert server.next_recurrence(due, 15, not_before=utc(2026, 3, 20)) == utc(2026, 4, 15)
+    # not_before já atrás do próximo vencimento não muda nada
+    assert server.next_recurrence(due, 15, not_before=utc(2025, 1, 1)) == utc(2025, 7, 15)
+
+
+def test_monthly_occurrences_clamp_february():
+    template = {"frequency": "monthly", "interval": 1, "day": 31, "created_at": utc(2026, 1, 1)}
+    assert server.template_occurrences(template, utc(2026, 1, 1), utc(2026, 4, 30)) == [
+        utc(2026, 1, 31), utc(2026, 2, 28), utc(2026, 3, 31), utc(2026, 4, 30)
+    ]
+
+
+def test_monthly_interval_counts_from_creation_month():
+    template = {"frequency": "monthly", "interval": 2, "day": 5, "created_at": utc(2026, 2, 20)}
+    assert server.template_occurrences(template, utc(2026, 1, 1), utc(2026, 7, 1)) == [
+        utc(2026, 2, 5), utc(2026, 4, 5), utc(2026, 6, 5)
+    ]
+
+
+def test_weekly_interval_is_anchored_on_creation_week():
+    # Criado numa quarta (07/01/2026): a semana-âncora começa na segunda 05/01
+    template = {"frequency": "weekly", "interval": 2, "day": 0, "created_at": utc(2026, 1, 7)}
+    assert server.template_occurrences(template, utc(2026, 1, 1), utc(2026, 2, 2)) == [
+        utc(2026, 1, 5), utc(2026, 1, 19), utc(2026, 2, 2)
+    ]
+    # Janela começando numa semana "ímpar" não desloca a série
+    assert server.template_occurrences(template, utc(2026, 1, 10), utc(2026, 2, 10)) == [
+        utc(2026, 1, 19), utc(2026, 2, 2)
+    ]
+
+
+def test_occurrence_window_is_half_open():
+    template = {"frequency": "monthly", "interval": 1, "day": 10, "created_at": utc(2026, 1, 1)}
+    # (start, end]: a data em `start` já foi gerada na janela anterior; a de `end` entra
+    assert server.template_occurrences(template, utc(2026, 3, 10), utc(2026, 5, 10)) == [
+        utc(2026, 4, 10), utc(2026, 5, 10)
+    ]
+    weekly = {"frequency": "weekly", "interval": 1, "day": 0, "created_at": utc(2026, 1, 1)}
+    assert server.template_occurrences(weekly, utc(2026, 1, 5), utc(2026, 1, 19)) == [
+        utc(2026, 1, 12), utc(2026, 1, 19)
+    ]
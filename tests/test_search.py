@@ -0,0 +1,68 @@
+import server
+
+LEAD = {
+    "name": "Maria CONCEIÇÃO",
+    "company": "Padaria São João",
+    "email": "maria@padaria.com.br",
+    "phone": "(11) 98765-4321",
+    "notes": None,
+}
+
+
+def matches(query: str, doc: dict = LEAD, collection: str = "leads") -> bool:
+    """O que /search faz: o índice precisa ter todas as chaves da consulta e o score confirma"""
+    tokens = list(dict.fromkeys(server.search_tokens(query)))
+    indexed = set(server.search_keys(collection, doc))
+    return set(server.query_keys(tokens)) <= indexed and server.search_score(collection, doc, tokens) > 0
+
+
+def test_search_tokens_normalize_accents_and_case():
+    assert server.search_tokens("CONCEIÇÃO") == ["conceicao"]
+    assert server.search_tokens("São João, Ltda.") == ["sao", "joao", "ltda"]
+    assert server.search_tokens(None) == []
+
+
+def test_search_tokens_phone_keeps_only_digits():
+    assert server.search_tokens("(11) 98765-4321", "phone") == ["11987654321"]
+    assert server.search_tokens("sem telefone", "phone") == []
+
+
+def test_accented_name_matches_plain_query_and_back():
+    assert matches("conceicao")
+    assert matches("CONCEIÇÃO")
+    assert matches("joão padaria")
+    assert not matches("conceicao pereira")
+
+
+def test_phone_fragment_matches():
+    assert matches("98765")
+    assert matches("98765-4321")
+    assert matches("(11) 98765")
+    assert not matches("98766")
+
+
+def test_short_words_match_only_as_prefix():
+    assert server.query_keys(["m"]) == ["^m"]
+    assert server.query_keys(["ma"]) == ["^ma"]
+    assert matches("m") and matches("ma")
+    # "ar" aparece dentro de "maria", mas não começa nenhuma palavra
+    assert not matches("ar")
+    assert matches("ria")
+
+
+def test_search_score_prefers_exact_then_prefix_then_substring():
+    exact = server.search_score("leads", LEAD, ["maria"])
+    prefix = server.search_score("leads", LEAD, ["mar"])
+    substring = server.search_score("leads", LEAD, ["ria"])
+    assert exact > prefix > substring > 0
+    # O campo de maior peso vence: nome (8) antes de email (4)
+    assert exact == 3 * server.SEARCH_WEIGHTS["name"]
+
+
+def test_search_keys_truncated_keeping_weighted_fields_first():
+    doc = {**LEAD, "notes": " ".join(f"palavra{i}" for i in range(500))}
+    keys = server.search_keys("leads", doc)
+    assert len(keys) == server.MAX_SEARCH_KEYS
+    assert len(set(keys)) == len(keys)
+    assert set(server.search_keys("leads", LEAD)) <= set(keys)
+    assert matches("conceicao", doc)